@@ -0,0 +1,273 @@
+# benchmark.py
+
+import argparse
+import contextlib
+import datetime
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+from database import DatabaseManager, INSERT_MODES
+from fakedb import FakeDatabase
+from fast_load import fast_load
+from pipeline import CHUNK_SIZE
+from planner import build_plan, fill_database
+from process_pool import process_fill
+from schema import Column, ForeignKey, UniqueKey
+from tvp import insert_mode_context
+
+DEFAULT_ROWS = (1000, 100000, 1000000)
+BENCHMARK_DIR = 'benchmarks'
+# Замедление больше этой доли относительно прошлого запуска считается регрессией
+REGRESSION_THRESHOLD = 0.1
+# Постоянный seed: каждый запуск генерирует одни и те же данные
+BENCHMARK_SEED = 20240101
+
+WIDE_COLUMN_TYPES = [
+    ('NVARCHAR', 50), ('INT', None), ('FLOAT', None), ('DATE', None), ('DATETIME', None),
+    ('BIT', None), ('UNIQUEIDENTIFIER', None), ('VARBINARY', 16), ('DECIMAL', None), ('BIGINT', None),
+]
+WIDE_COLUMNS = 50
+
+
+def _identity(name='Id', data_type='INT'):
+    return Column(name, data_type, None, False, True)
+
+
+def _column(name, data_type, max_length=None, is_nullable=False):
+    return Column(name, data_type, max_length, is_nullable, False)
+
+
+# Одна широкая таблица со столбцами всех поддерживаемых типов
+def wide_schema(db, rows):
+    columns = [_identity()]
+    for number in range(WIDE_COLUMNS):
+        data_type, max_length = WIDE_COLUMN_TYPES[number % len(WIDE_COLUMN_TYPES)]
+        columns.append(_column(f"{data_type.title()}{number}", data_type, max_length, is_nullable=number % 3 == 0))
+    db.add_table('Wide', columns, unique_keys=[UniqueKey('PK_Wide', ('Id',), True)])
+    return {'Wide': rows}
+
+
+# Звезда: таблица фактов с внешними ключами на четыре справочника
+def star_schema(db, rows):
+    dimension_rows = max(10, rows // 100)
+    db.add_table('Customers', [_identity(), _column('Name', 'NVARCHAR', 100), _column('Email', 'NVARCHAR', 100)],
+                 unique_keys=[UniqueKey('PK_Customers', ('Id',), True), UniqueKey('UX_Customers_Email', ('Email',), False)])
+    db.add_table('Products', [_identity(), _column('Title', 'NVARCHAR', 100), _column('Price', 'DECIMAL')],
+                 unique_keys=[UniqueKey('PK_Products', ('Id',), True)])
+    db.add_table('Stores', [_identity(), _column('City', 'NVARCHAR', 50)],
+                 unique_keys=[UniqueKey('PK_Stores', ('Id',), True)])
+    db.add_table('Calendar', [_column('DateKey', 'INT'), _column('Day', 'DATE')],
+                 unique_keys=[UniqueKey('PK_Calendar', ('DateKey',), True)])
+    db.add_table('Sales', [
+        _identity('Id', 'BIGINT'), _column('CustomerId', 'INT'), _column('ProductId', 'INT'),
+        _column('StoreId', 'INT'), _column('DateKey', 'INT'), _column('Quantity', 'SMALLINT'),
+        _column('Amount', 'DECIMAL'), _column('SoldAt', 'DATETIME2'),
+    ], foreign_keys=[
+        ForeignKey('FK_Sales_Customers', 'CustomerId', 'Customers', 'Id'),
+        ForeignKey('FK_Sales_Products', 'ProductId', 'Products', 'Id'),
+        ForeignKey('FK_Sales_Stores', 'StoreId', 'Stores', 'Id'),
+        ForeignKey('FK_Sales_Calendar', 'DateKey', 'Calendar', 'DateKey'),
+    ], unique_keys=[UniqueKey('PK_Sales', ('Id',), True)])
+    return {'Customers': dimension_rows, 'Products': dimension_rows, 'Stores': dimension_rows,
+            'Calendar': dimension_rows, 'Sales': rows}
+
+
+# Таблица с уникальными столбцами всех видов и составной ключ из внешних ключей
+def unique_schema(db, rows):
+    db.add_table('Accounts', [
+        _identity(), _column('Login', 'NVARCHAR', 50), _column('Email', 'NVARCHAR', 100),
+        _column('Number', 'BIGINT'), _column('Token', 'UNIQUEIDENTIFIER'), _column('Opened', 'DATE'),
+        _column('Code', 'VARBINARY', 8),
+    ], unique_keys=[UniqueKey('PK_Accounts', ('Id',), True)] + [
+        UniqueKey(f"UX_Accounts_{name}", (name,), False) for name in ('Login', 'Email', 'Number', 'Token', 'Opened', 'Code')
+    ])
+    db.add_table('Groups', [_identity(), _column('Name', 'NVARCHAR', 50)],
+                 unique_keys=[UniqueKey('PK_Groups', ('Id',), True), UniqueKey('UX_Groups_Name', ('Name',), False)])
+    db.add_table('Memberships', [_column('AccountId', 'INT'), _column('GroupId', 'INT')], foreign_keys=[
+        ForeignKey('FK_Memberships_Accounts', 'AccountId', 'Accounts', 'Id'),
+        ForeignKey('FK_Memberships_Groups', 'GroupId', 'Groups', 'Id'),
+    ], unique_keys=[UniqueKey('PK_Memberships', ('AccountId', 'GroupId'), True)])
+    return {'Accounts': rows, 'Groups': max(10, rows // 1000), 'Memberships': rows}
+
+
+SCENARIOS = {
+    'wide': wide_schema,
+    'star': star_schema,
+    'unique': unique_schema,
+}
+
+
+def run_scenario(scenario, rows, insert_mode='fast_executemany', chunk_size=CHUNK_SIZE, connections=1,
+                 trace_memory=False, latency=0.0, processes=1, fast=False):
+    db = FakeDatabase(latency=latency)
+    row_counts = SCENARIOS[scenario](db, rows)
+    manager = DatabaseManager(driver=db)
+    # Замеряется чтение схемы с сервера, а не из снимка прошлого запуска
+    manager.catalog.snapshot_dir = None
+    manager.connect('benchmark', 'Windows Authentication')
+    manager.use_database(db.name)
+    db.stats.reset()
+    manager.metrics.reset()
+
+    if trace_memory:
+        tracemalloc.start()
+    stages = {}
+    started_at = time.perf_counter()
+    try:
+        stage_started_at = time.perf_counter()
+        plan = build_plan(manager, list(row_counts))
+        stages['catalog'] = time.perf_counter() - stage_started_at
+        catalog_statements = db.stats.statements
+
+        stage_started_at = time.perf_counter()
+        with fast_load(manager, list(row_counts)) if fast else contextlib.nullcontext(), \
+                insert_mode_context(manager, insert_mode):
+            if processes > 1 and len(row_counts) == 1:
+                [(table_name, n)] = row_counts.items()
+                inserted = process_fill(manager, table_name, n, processes=processes, chunk_size=chunk_size,
+                                        insert_mode=insert_mode, seed=BENCHMARK_SEED)
+                succeeded = inserted == n
+            else:
+                report = fill_database(manager, row_counts, plan, connections=connections, chunk_size=chunk_size,
+                                       insert_mode=insert_mode, seed=BENCHMARK_SEED)
+                inserted, succeeded = report.inserted, report.succeeded
+        stages['fill'] = time.perf_counter() - stage_started_at
+        peak_memory = tracemalloc.get_traced_memory()[1] if trace_memory else None
+    finally:
+        if trace_memory:
+            tracemalloc.stop()
+        manager.close_connection()
+    seconds = time.perf_counter() - started_at
+
+    stats = db.stats.snapshot()
+    # Время «сервера» — обработка запросов заменителем; остальное время заполнения
+    # уходит на генерацию и подготовку данных на клиенте.
+    stages['server'] = stats['server_seconds']
+    stages['client'] = max(0.0, stages['fill'] - stats['server_seconds'])
+    # Этапы, измеренные самим DatabaseManager (суммарно по потокам)
+    stages.update(manager.metrics.to_record()['stages'])
+    total_rows = sum(row_counts.values())
+    return {
+        'scenario': scenario,
+        'rows': rows,
+        'total_rows': total_rows,
+        'inserted': inserted,
+        'succeeded': succeeded,
+        'insert_mode': insert_mode,
+        'connections': connections,
+        'processes': processes,
+        'fast_load': fast,
+        'seconds': seconds,
+        'rows_per_sec': inserted / seconds if seconds > 0 else 0.0,
+        'catalog_queries': stats['catalog_queries'],
+        'catalog_statements': catalog_statements,
+        'statements': stats['statements'],
+        'round_trips': stats['round_trips'],
+        'commits': stats['commits'],
+        'peak_memory_mb': peak_memory / 2 ** 20 if peak_memory is not None else None,
+        'stages': {stage: round(value, 4) for stage, value in stages.items()},
+    }
+
+
+# Сравниваются только прогоны с одинаковыми параметрами заполнения. В файлах
+# старых запусков этих полей нет, для них берутся значения по умолчанию.
+def _result_key(result):
+    return (result['scenario'], result['rows'], result['insert_mode'], result.get('connections', 1),
+            result.get('processes', 1), result.get('fast_load', False))
+
+
+def _describe_run(result):
+    fast = ', fast-load' if result['fast_load'] else ''
+    return (f"{result['scenario']:>8} {result['rows']:>9} {result['insert_mode']:>16} "
+            f"[соединений {result['connections']}, процессов {result['processes']}{fast}]")
+
+
+def compare(results, baseline_path, threshold=REGRESSION_THRESHOLD):
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = {_result_key(result): result for result in json.load(f)['results']}
+    regressions = []
+    for result in results:
+        previous = baseline.get(_result_key(result))
+        if previous is None or not previous['rows_per_sec']:
+            continue
+        ratio = result['rows_per_sec'] / previous['rows_per_sec']
+        mark = ''
+        if ratio < 1 - threshold:
+            mark = '  РЕГРЕССИЯ'
+            regressions.append(result)
+        print(f"{_describe_run(result)}: {ratio:6.2f}x к {baseline_path} "
+              f"(обменов с сервером: {previous['round_trips']} -> {result['round_trips']}){mark}")
+    return regressions
+
+
+def format_result(result):
+    memory = f"{result['peak_memory_mb']:.1f} МБ" if result['peak_memory_mb'] is not None else "—"
+    stages = ', '.join(f"{stage} {value:.2f} с" for stage, value in result['stages'].items())
+    return (f"{_describe_run(result)}: {result['rows_per_sec']:>10.0f} записей/с, "
+            f"каталог {result['catalog_queries']}, запросов {result['statements']}, "
+            f"обменов {result['round_trips']}, память {memory} ({stages})")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='benchmark',
+                                     description="Замеры скорости генерации и вставки на заменителе сервера")
+    parser.add_argument('--scenario', dest='scenarios', action='append', choices=sorted(SCENARIOS),
+                        help="схема для замера; по умолчанию все")
+    parser.add_argument('--rows', action='append', type=int, help="количество записей; по умолчанию 1K, 100K и 1M")
+    parser.add_argument('--insert-mode', dest='insert_modes', action='append', choices=INSERT_MODES,
+                        help="режим вставки; можно указать несколько раз, по умолчанию все")
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    parser.add_argument('--connections', type=int, default=1)
+    parser.add_argument('--processes', type=int, default=1,
+                        help="процессов генерации; применяется к сценариям с одной таблицей")
+    parser.add_argument('--fast-load', action='store_true', help="заполнять в режиме быстрой загрузки")
+    parser.add_argument('--latency', type=float, default=0.0, help="задержка одного обмена с сервером, секунд")
+    parser.add_argument('--no-memory', action='store_true',
+                        help="не делать отдельный прогон для пиковой памяти (tracemalloc)")
+    parser.add_argument('--output', help="файл результатов JSON")
+    parser.add_argument('--compare', help="файл прошлого запуска для сравнения")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    scenarios = args.scenarios or sorted(SCENARIOS)
+    sizes = args.rows or DEFAULT_ROWS
+
+    insert_modes = args.insert_modes or INSERT_MODES
+
+    results = []
+    for scenario in scenarios:
+        for rows in sizes:
+            for insert_mode in insert_modes:
+                result = run_scenario(scenario, rows, insert_mode, args.chunk_size, args.connections,
+                                      False, args.latency, args.processes, args.fast_load)
+                if not args.no_memory:
+                    # tracemalloc замедляет выделение памяти в разы, поэтому пиковая
+                    # память снимается отдельным прогоном и не искажает скорость.
+                    traced = run_scenario(scenario, rows, insert_mode, args.chunk_size, args.connections,
+                                          True, args.latency, args.processes, args.fast_load)
+                    result['peak_memory_mb'] = traced['peak_memory_mb']
+                results.append(result)
+                print(format_result(result), flush=True)
+
+    output = args.output or os.path.join(
+        BENCHMARK_DIR, f"benchmark-{datetime.datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump({'created': datetime.datetime.now().replace(microsecond=0).isoformat(),
+                   'python': platform.python_version(), 'platform': platform.platform(),
+                   'results': results}, f, ensure_ascii=False, indent=2)
+    print(f"Результаты сохранены в {output}")
+
+    if args.compare and compare(results, args.compare):
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
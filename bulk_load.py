@@ -0,0 +1,159 @@
+# bulk_load.py
+
+import datetime
+import json
+import logging
+import os
+
+from database import OperationCancelled
+from pipeline import CHUNK_SIZE, FillProgress, create_generator, iter_batches
+
+FIELD_TERMINATOR = '\t'
+ROW_TERMINATOR = '\n'
+FORMAT_FILE_VERSION = '14.0'
+BULK_BATCH_SIZE = 100000
+# Размер буфера записи файла данных; в памяти одновременно одна порция строк
+WRITE_BUFFER_SIZE = 1024 * 1024
+
+
+def _text(value):
+    # Разделители внутри значения сломали бы разбор файла сервером
+    return str(value).replace('\t', ' ').replace('\r', ' ').replace('\n', ' ')
+
+
+def _format_value(value):
+    if value is None:
+        # Пустое поле при KEEPNULLS загружается как NULL
+        return ''
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    if isinstance(value, (bytes, bytearray)):
+        return value.hex().upper()
+    if isinstance(value, datetime.datetime):
+        return value.isoformat(sep=' ')
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    if isinstance(value, (int, float)):
+        return str(value)
+    return _text(value)
+
+
+def dataset_paths(data_path):
+    base = os.path.splitext(data_path)[0]
+    return base + '.fmt', base + '.json'
+
+
+# Файл форматов bcp в текстовом виде: поля файла данных идут в порядке вставляемых
+# столбцов, identity-столбцы таблицы пропускаются и заполняются сервером.
+def write_format_file(table, format_path):
+    columns = table.insertable_columns
+    ordinals = {column.name: position for position, column in enumerate(table.columns, 1)}
+    lines = [FORMAT_FILE_VERSION, str(len(columns))]
+    for number, column in enumerate(columns, 1):
+        terminator = ROW_TERMINATOR if number == len(columns) else FIELD_TERMINATOR
+        terminator = terminator.replace('\t', '\\t').replace('\n', '\\n')
+        lines.append(f'{number}\tSQLCHAR\t0\t0\t"{terminator}"\t{ordinals[column.name]}\t{column.name}\t""')
+    with open(format_path, 'w', encoding='utf-8', newline='\n') as f:
+        f.write('\n'.join(lines) + '\n')
+
+
+def write_manifest(table, manifest_path, data_path, format_path, rows):
+    manifest = {
+        'schema': table.schema,
+        'table': table.name,
+        'rows': rows,
+        'data_file': os.path.basename(data_path),
+        'format_file': os.path.basename(format_path),
+        'encoding': 'utf-8',
+        'field_terminator': FIELD_TERMINATOR,
+        'row_terminator': ROW_TERMINATOR,
+        'columns': [{'name': column.name, 'data_type': column.data_type} for column in table.insertable_columns],
+        'created': datetime.datetime.now().replace(microsecond=0).isoformat(),
+    }
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+
+def read_manifest(manifest_path):
+    with open(manifest_path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+# Пишет сгенерированные строки в файл данных порциями по chunk_size, рядом
+# сохраняет файл форматов и описание набора данных. Файлы можно загрузить
+# позже и в другую базу той же структуры, в том числе утилитой bcp.
+def export_dataset(db_manager, table_name, n, data_path, schema='dbo', chunk_size=CHUNK_SIZE,
+                   on_progress=None, cancel_event=None, seed=None, reference_date=None, profile=None):
+    generator = create_generator(db_manager, table_name, schema, seed=seed, reference_date=reference_date,
+                                 profile=profile)
+    table = generator.table
+    format_path, manifest_path = dataset_paths(data_path)
+    progress = FillProgress(n)
+    written = 0
+    with open(data_path, 'w', encoding='utf-8', newline='', buffering=WRITE_BUFFER_SIZE) as f:
+        for batch in iter_batches(generator, n, chunk_size, metrics=db_manager.metrics):
+            if cancel_event is not None and cancel_event.is_set():
+                raise OperationCancelled()
+            with db_manager.metrics.stage('serialize'):
+                f.writelines(FIELD_TERMINATOR.join(map(_format_value, row)) + ROW_TERMINATOR
+                             for row in batch.rows())
+            written += len(batch)
+            progress.generated = written
+            if on_progress:
+                on_progress(progress)
+    write_format_file(table, format_path)
+    write_manifest(table, manifest_path, data_path, format_path, written)
+    logging.info(f"Набор данных для таблицы {schema}.{table_name} сохранён в {data_path}: {written} записей")
+    return written
+
+
+# Загружает ранее сохранённый набор данных. server_path — путь к файлу данных
+# так, как его видит служба SQL Server (например, общая папка), если он
+# отличается от локального пути.
+def load_dataset(db_manager, manifest_path, table_name=None, schema=None, server_path=None,
+                 batch_size=BULK_BATCH_SIZE, tablock=True):
+    manifest = read_manifest(manifest_path)
+    table_name = table_name or manifest['table']
+    schema = schema or manifest['schema']
+    table = db_manager.catalog.get_table(table_name, schema)
+    if table is None:
+        raise ValueError(f"Схема таблицы {schema}.{table_name} недоступна")
+    expected = [column['name'] for column in manifest['columns']]
+    actual = [column.name for column in table.insertable_columns]
+    if expected != actual:
+        raise ValueError(f"Столбцы набора данных {expected} не совпадают со столбцами таблицы {schema}.{table_name}")
+
+    directory = os.path.dirname(os.path.abspath(manifest_path))
+    data_path = server_path or os.path.join(directory, manifest['data_file'])
+    server_directory = os.path.dirname(data_path)
+    # Файл форматов читается сервером, поэтому лежит рядом с файлом данных
+    format_path = os.path.join(server_directory, manifest['format_file'])
+    return db_manager.bulk_insert_file(table_name, data_path, schema, format_path=format_path,
+                                       batch_size=batch_size, tablock=tablock)
+
+
+def bulk_fill(db_manager, table_name, n, data_path, schema='dbo', chunk_size=CHUNK_SIZE, server_path=None,
+              batch_size=BULK_BATCH_SIZE, tablock=True, on_progress=None, cancel_event=None, seed=None,
+              reference_date=None, profile=None):
+    written = export_dataset(db_manager, table_name, n, data_path, schema, chunk_size, on_progress, cancel_event,
+                             seed, reference_date, profile)
+    if cancel_event is not None and cancel_event.is_set():
+        raise OperationCancelled()
+    manifest_path = dataset_paths(data_path)[1]
+    inserted = load_dataset(db_manager, manifest_path, table_name, schema, server_path, batch_size, tablock)
+    if inserted is None or inserted < 0:
+        # Драйвер не всегда сообщает число строк для BULK INSERT
+        inserted = written
+    if on_progress:
+        progress = FillProgress(n)
+        progress.generated = progress.inserted = n
+        on_progress(progress)
+    return inserted
+
+
+def bcp_command(table, data_path, server, database, format_path=None, batch_size=BULK_BATCH_SIZE,
+                username=None, password=None):
+    format_path = format_path or dataset_paths(data_path)[0]
+    auth = f'-U "{username}" -P "{password}"' if username else '-T'
+    return (f'bcp "[{database}].[{table.schema}].[{table.name}]" in "{data_path}" -S "{server}" {auth} '
+            f'-f "{format_path}" -C 65001 -b {batch_size} -h "TABLOCK"')
@@ -0,0 +1,333 @@
+# cli.py
+
+import argparse
+import contextlib
+import datetime
+import json
+import logging
+import sys
+import threading
+import time
+
+from database import DatabaseManager, INSERT_MODES, MAX_RECORDS, OperationCancelled
+from data_profile import DATA_PROFILE_DIR, PROFILE_SAMPLE_ROWS, TOP_VALUES, TableProfile, profile_path, profile_table
+from fast_load import fast_load
+from generators import new_seed
+from instrumentation import PROFILE_MODES, profiled
+from parallel import parallel_fill
+from pipeline import CHUNK_SIZE, export_script
+from process_pool import process_fill
+from planner import build_plan, fill_database
+from tvp import insert_mode_context
+from resilience import DEFAULT_ON_ERROR, ON_ERROR_POLICIES
+from utils import MAX_ROWS_PER_INSERT
+
+# Коды завершения
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_USAGE = 2
+EXIT_CONNECTION = 3
+EXIT_CANCELLED = 130
+
+AUTH_METHODS = {
+    'windows': 'Windows Authentication',
+    'sql': 'SQL Server Authentication',
+}
+# Как часто печатать прогресс одной таблицы, секунд
+PROGRESS_INTERVAL = 1.0
+
+
+# Вывод событий построчно в JSON, чтобы запуск можно было разбирать скриптом
+class JsonReporter:
+    def __init__(self, stream=None, interval=PROGRESS_INTERVAL):
+        self.stream = stream or sys.stdout
+        self.interval = interval
+        self._last_progress = {}
+        self._lock = threading.Lock()
+
+    def emit(self, event, **fields):
+        line = json.dumps({'event': event, **fields}, ensure_ascii=False, default=str)
+        with self._lock:
+            self.stream.write(line + '\n')
+            self.stream.flush()
+
+    def error(self, title, message):
+        self.emit('error', title=title, message=message)
+
+    def info(self, title, message):
+        self.emit('info', title=title, message=message)
+
+    def progress(self, table_name, progress):
+        now = time.monotonic()
+        finished = progress.processed >= progress.total
+        if not finished and now - self._last_progress.get(table_name, 0) < self.interval:
+            return
+        self._last_progress[table_name] = now
+        self.emit('progress', table=table_name, **progress.snapshot())
+
+
+def parse_table_count(value):
+    table_name, separator, count = value.rpartition('=')
+    if not separator or not table_name:
+        raise argparse.ArgumentTypeError(f"ожидается ТАБЛИЦА=КОЛИЧЕСТВО, получено: {value}")
+    try:
+        count = int(count)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"некорректное количество записей: {value}")
+    if count < 0 or count > MAX_RECORDS:
+        raise argparse.ArgumentTypeError(f"количество записей должно быть от 0 до {MAX_RECORDS}: {value}")
+    return table_name, count
+
+
+def parse_date(value):
+    try:
+        return datetime.date.fromisoformat(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"ожидается дата ГГГГ-ММ-ДД, получено: {value}")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='cli', description="Генерация тестовых данных для SQL Server без интерфейса")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    # Параметры подключения, общие для всех команд
+    connection = argparse.ArgumentParser(add_help=False)
+    connection.add_argument('--server', required=True, help="имя сервера SQL Server")
+    connection.add_argument('--db', required=True, help="база данных")
+    connection.add_argument('--auth', choices=sorted(AUTH_METHODS), default='windows', help="способ аутентификации")
+    connection.add_argument('--user', default='', help="имя пользователя для SQL Server Authentication")
+    connection.add_argument('--password', default='', help="пароль для SQL Server Authentication")
+    connection.add_argument('--schema', default='dbo')
+    connection.add_argument('--log-file', default='data_generator.log')
+
+    fill = commands.add_parser('fill', parents=[connection], help="заполнить таблицы сгенерированными данными")
+    fill.add_argument('--table', dest='tables', action='append', type=parse_table_count, required=True,
+                      metavar='ТАБЛИЦА=КОЛИЧЕСТВО', help="таблица и количество записей; можно указать несколько раз")
+    fill.add_argument('--connections', type=int, default=1, help="число параллельных соединений")
+    fill.add_argument('--processes', type=int, default=1,
+                      help="число процессов генерации для одной таблицы; вставка идёт через одно соединение")
+    fill.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    fill.add_argument('--insert-mode', choices=INSERT_MODES, default='fast_executemany')
+    fill.add_argument('--on-error', choices=ON_ERROR_POLICIES, default=DEFAULT_ON_ERROR,
+                      help="что делать со строками, которые отклонил сервер: заменить, пропустить или остановиться")
+    fill.add_argument('--fast-load', action='store_true',
+                      help="TABLOCK, отключение неуникальных индексов и проверок ограничений, BULK_LOGGED на время заполнения")
+    fill.add_argument('--seed', type=int, help="seed генерации; с тем же seed данные повторяются в точности")
+    fill.add_argument('--reference-date', type=parse_date,
+                      help="дата, от которой отсчитываются сгенерированные даты; по умолчанию сегодня")
+    fill.add_argument('--use-profiles', action='store_true',
+                      help=f"генерировать по профилям данных из {DATA_PROFILE_DIR}, снятым командой profile")
+    fill.add_argument('--profile', choices=PROFILE_MODES, help="профилировать запуск и записать результат в лог")
+
+    profile = commands.add_parser('profile', parents=[connection],
+                                  help="снять профиль распределений данных существующих таблиц")
+    profile.add_argument('--table', dest='tables', action='append', required=True, metavar='ТАБЛИЦА',
+                         help="таблица; можно указать несколько раз")
+    profile.add_argument('--top', type=int, default=TOP_VALUES, help="сколько самых частых значений сохранять")
+    profile.add_argument('--sample-rows', type=int, default=PROFILE_SAMPLE_ROWS,
+                         help="таблицы больше этого числа строк профилируются по выборке TABLESAMPLE")
+    profile.add_argument('--output-dir', default=DATA_PROFILE_DIR)
+
+    script = commands.add_parser('script', parents=[connection],
+                                 help="записать сгенерированные данные в SQL-скрипт, не вставляя их")
+    script.add_argument('--table', dest='table', type=parse_table_count, required=True,
+                        metavar='ТАБЛИЦА=КОЛИЧЕСТВО', help="таблица и количество записей")
+    script.add_argument('--output', required=True,
+                        help="файл скрипта; при расширении .gz скрипт сжимается gzip")
+    script.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help="строк в одном пакете до GO")
+    script.add_argument('--rows-per-insert', type=int, default=MAX_ROWS_PER_INSERT,
+                        help=f"строк в одном INSERT, не больше {MAX_ROWS_PER_INSERT}")
+    script.add_argument('--seed', type=int, help="seed генерации; с тем же seed данные повторяются в точности")
+    script.add_argument('--reference-date', type=parse_date,
+                        help="дата, от которой отсчитываются сгенерированные даты; по умолчанию сегодня")
+    script.add_argument('--use-profiles', action='store_true',
+                        help=f"генерировать по профилю данных из {DATA_PROFILE_DIR}, снятому командой profile")
+    return parser
+
+
+def connect(args, reporter, profile_mode=None):
+    db_manager = DatabaseManager(error_callback=reporter.error, info_callback=reporter.info)
+    db_manager.profile_mode = profile_mode
+    if not db_manager.connect(args.server, AUTH_METHODS[args.auth], args.user, args.password) \
+            or not db_manager.use_database(args.db):
+        return None
+    return db_manager
+
+
+def profile_tables(args, reporter):
+    db_manager = connect(args, reporter)
+    if db_manager is None:
+        return EXIT_CONNECTION
+    failed = False
+    try:
+        for table_name in args.tables:
+            try:
+                profile = profile_table(db_manager, table_name, args.schema, args.top, args.sample_rows)
+                path = profile_path(args.db, args.schema, table_name, args.output_dir)
+                profile.save(path)
+                reporter.emit('profile', table=table_name, rows=profile.rows, sampled_rows=profile.sampled_rows,
+                              path=path)
+            except Exception as e:
+                logging.error(f"Ошибка при профилировании таблицы {args.schema}.{table_name}: {e}")
+                reporter.emit('failed', table=table_name, message=str(e))
+                failed = True
+    finally:
+        db_manager.close_connection()
+    return EXIT_FAILED if failed else EXIT_OK
+
+
+def script_table(args, reporter):
+    db_manager = connect(args, reporter)
+    if db_manager is None:
+        return EXIT_CONNECTION
+    table_name, n = args.table
+    seed = new_seed() if args.seed is None else args.seed
+    reporter.emit('seed', seed=seed)
+    profile = TableProfile.for_table(args.db, args.schema, table_name) if args.use_profiles else None
+    started_at = time.monotonic()
+    try:
+        written = export_script(db_manager, table_name, n, args.output, args.schema, args.chunk_size, seed,
+                                args.reference_date, profile, args.rows_per_insert,
+                                on_progress=lambda progress: reporter.progress(table_name, progress))
+    except KeyboardInterrupt:
+        reporter.emit('cancelled', table=table_name, path=args.output)
+        return EXIT_CANCELLED
+    except Exception as e:
+        logging.error(f"Ошибка при экспорте SQL-скрипта в файл {args.output}: {e}")
+        reporter.emit('failed', table=table_name, message=str(e))
+        return EXIT_FAILED
+    finally:
+        db_manager.close_connection()
+    reporter.emit('done', table=table_name, rows=written, path=args.output,
+                  elapsed=round(time.monotonic() - started_at, 3))
+    return EXIT_OK
+
+
+def fill(args, reporter):
+    db_manager = connect(args, reporter, args.profile)
+    if db_manager is None:
+        return EXIT_CONNECTION
+
+    row_counts = dict(args.tables)
+    connections = max(1, args.connections)
+    if args.processes > 1 and (len(row_counts) > 1 or connections > 1):
+        reporter.error("Ошибка", "--processes поддерживается только для одной таблицы и одного соединения")
+        db_manager.close_connection()
+        return EXIT_USAGE
+    # Seed печатается всегда, чтобы неудачный набор данных можно было воспроизвести
+    seed = new_seed() if args.seed is None else args.seed
+    reporter.emit('seed', seed=seed)
+    profiles = {}
+    if args.use_profiles:
+        for table_name in row_counts:
+            profile = TableProfile.for_table(args.db, args.schema, table_name)
+            if profile is None:
+                reporter.info("Профиль данных", f"Профиль таблицы {table_name} не найден, используются "
+                                                f"встроенные распределения")
+            else:
+                profiles[table_name] = profile
+    cancel_event = threading.Event()
+    outcome = {}
+
+    def fill_tables():
+        if args.processes > 1:
+            [(table_name, n)] = row_counts.items()
+            progress_state = {'inserted': 0, 'rejected': 0}
+
+            def report_progress(progress):
+                progress_state['inserted'] = progress.inserted
+                progress_state['rejected'] = progress.rejected
+                reporter.progress(table_name, progress)
+
+            try:
+                inserted = process_fill(db_manager, table_name, n, args.schema, args.processes, args.chunk_size,
+                                        insert_mode=args.insert_mode, on_progress=report_progress,
+                                        cancel_event=cancel_event, seed=seed, reference_date=args.reference_date,
+                                        profile=profiles.get(table_name), on_error=args.on_error)
+            except OperationCancelled:
+                inserted = progress_state['inserted']
+            rejected = progress_state['rejected']
+            succeeded = inserted == n and not rejected
+            error = None if succeeded else (f"Таблица {table_name}: вставлено {inserted} из {n} записей, "
+                                            f"отклонено строк: {rejected}")
+            outcome['tables'] = [{'table': table_name, 'requested': n, 'inserted': inserted, 'error': error}]
+            outcome['inserted'] = inserted
+            outcome['succeeded'] = succeeded
+            return
+        if len(row_counts) == 1 and connections > 1:
+            # Одна таблица: параллельно загружаются диапазоны её строк
+            [(table_name, n)] = row_counts.items()
+            report = parallel_fill(db_manager, table_name, n, args.schema, connections, args.chunk_size,
+                                   args.insert_mode, lambda progress: reporter.progress(table_name, progress),
+                                   cancel_event, seed, args.reference_date, profiles.get(table_name), args.on_error)
+            outcome['tables'] = [{'table': table_name, 'requested': n, 'inserted': report.inserted,
+                                  'error': None if report.succeeded else report.summary()}]
+        else:
+            plan = build_plan(db_manager, list(row_counts), args.schema)
+            reporter.emit('plan', levels=plan.levels,
+                          deferred=[f"{table_name}.{fk.column}" for table_name, fk in plan.deferred])
+            report = fill_database(db_manager, row_counts, plan, args.schema, connections, args.chunk_size,
+                                   args.insert_mode, reporter.progress, cancel_event, seed, args.reference_date,
+                                   profiles, args.on_error)
+            outcome['tables'] = [{'table': result.table_name, 'requested': result.requested,
+                                  'inserted': result.inserted, 'error': result.error}
+                                 for result in report.results]
+        outcome['inserted'] = report.inserted
+        outcome['succeeded'] = report.succeeded
+
+    def run():
+        db_manager.metrics.reset()
+        try:
+            load_mode = fast_load(db_manager, [table_name for table_name, n in row_counts.items() if n > 0],
+                                  args.schema) if args.fast_load else contextlib.nullcontext()
+            with profiled(db_manager.profile_mode, 'cli-fill'), load_mode, \
+                    insert_mode_context(db_manager, args.insert_mode):
+                fill_tables()
+        except Exception as e:
+            logging.error(f"Ошибка при заполнении базы данных {args.db}: {e}")
+            outcome['exception'] = str(e)
+        db_manager.metrics.log('cli-fill', database=args.db)
+
+    started_at = time.monotonic()
+    thread = threading.Thread(target=run, name='cli-fill')
+    thread.start()
+    try:
+        while thread.is_alive():
+            thread.join(0.2)
+    except KeyboardInterrupt:
+        # Текущие порции откатываются, зафиксированные остаются
+        cancel_event.set()
+        reporter.emit('cancelling')
+        thread.join()
+    finally:
+        db_manager.close_connection()
+
+    elapsed = round(time.monotonic() - started_at, 3)
+    reporter.emit('metrics', **db_manager.metrics.to_record())
+    if 'exception' in outcome:
+        reporter.emit('failed', message=outcome['exception'], elapsed=elapsed)
+        return EXIT_FAILED
+    if cancel_event.is_set():
+        reporter.emit('cancelled', inserted=outcome['inserted'], tables=outcome['tables'], elapsed=elapsed)
+        return EXIT_CANCELLED
+    event = 'done' if outcome['succeeded'] else 'failed'
+    reporter.emit(event, inserted=outcome['inserted'], tables=outcome['tables'], elapsed=elapsed)
+    return EXIT_OK if outcome['succeeded'] else EXIT_FAILED
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(filename=args.log_file, level=logging.INFO,
+                        format='%(asctime)s:%(levelname)s:%(message)s')
+    reporter = JsonReporter()
+    if args.command == 'fill':
+        return fill(args, reporter)
+    if args.command == 'profile':
+        return profile_tables(args, reporter)
+    if args.command == 'script':
+        return script_table(args, reporter)
+    return EXIT_USAGE
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,312 @@
+# data_profile.py
+
+import datetime
+import decimal
+import json
+import logging
+import math
+import os
+import re
+import uuid
+
+import numpy as np
+
+from generators import draw_rows
+from schema import TEXT_TYPES, INTEGER_TYPES, FLOAT_TYPES, DATETIME_TYPES
+
+DATA_PROFILE_DIR = 'data_profiles'
+# Сколько самых частых значений столбца сохранять
+TOP_VALUES = 100
+# Большие таблицы профилируются по выборке TABLESAMPLE примерно такого размера
+PROFILE_SAMPLE_ROWS = 1000000
+# Типы, для которых сервер не умеет COUNT(DISTINCT) и GROUP BY
+UNSORTABLE_TYPES = ('TEXT', 'NTEXT', 'IMAGE', 'XML', 'GEOGRAPHY', 'GEOMETRY', 'HIERARCHYID', 'SQL_VARIANT')
+BINARY_TYPES = ('VARBINARY', 'BINARY')
+# Дробная часть k * GOLDEN равномерно распределена: по ней выбирается длина
+# строки хвостового значения k
+GOLDEN = 0.6180339887498949
+
+
+def _encode(value):
+    if isinstance(value, (bytes, bytearray)):
+        return value.hex()
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    return value
+
+
+def _decode(value, data_type):
+    if value is None:
+        return None
+    if data_type == 'DATE':
+        return datetime.date.fromisoformat(value)
+    if data_type in DATETIME_TYPES:
+        return datetime.datetime.fromisoformat(value)
+    if data_type in BINARY_TYPES:
+        return bytes.fromhex(value)
+    return value
+
+
+def profile_path(database, schema, table_name, directory=DATA_PROFILE_DIR):
+    name = re.sub(r'[^\w.-]', '_', f"{database}.{schema}.{table_name}")
+    return os.path.join(directory, f"{name}.json")
+
+
+# Распределение значений одного столбца: доля NULL, число различных значений,
+# минимум и максимум (для строк — длины), самые частые значения и гистограмма
+# длин строк. Частоты считаются по просмотренным строкам.
+class ColumnProfile:
+    def __init__(self, name, data_type, rows, nulls, distinct, low=None, high=None, top=(), lengths=()):
+        self.name = name
+        self.data_type = data_type
+        self.rows = rows
+        self.nulls = nulls
+        self.distinct = distinct
+        self.low = low
+        self.high = high
+        self.top = list(top)
+        self.lengths = list(lengths)
+
+    @property
+    def null_ratio(self):
+        return self.nulls / self.rows if self.rows else 0.0
+
+    def to_dict(self):
+        return {'name': self.name, 'data_type': self.data_type, 'rows': self.rows, 'nulls': self.nulls,
+                'distinct': self.distinct, 'low': _encode(self.low), 'high': _encode(self.high),
+                'top': [[_encode(value), count] for value, count in self.top],
+                'lengths': [list(pair) for pair in self.lengths]}
+
+    @classmethod
+    def from_dict(cls, data):
+        data_type = data['data_type']
+        # Для строк low и high — длины, а не значения
+        bounds_type = 'INT' if data_type in TEXT_TYPES else data_type
+        return cls(data['name'], data_type, data['rows'], data['nulls'], data['distinct'],
+                   _decode(data.get('low'), bounds_type), _decode(data.get('high'), bounds_type),
+                   [(_decode(value, data_type), count) for value, count in data.get('top', [])],
+                   [tuple(pair) for pair in data.get('lengths', [])])
+
+    # Функция (n, row_offset) -> список значений с тем же распределением.
+    # Частые значения выбираются с их весами; остальные строки берутся из
+    # «хвоста» — tail_distinct значений, вычисляемых по номеру k, поэтому число
+    # различных значений тоже воспроизводится. Для типов без модели хвоста
+    # (UUID, двоичные) хвост берётся у обычного генератора fallback.
+    def sampler(self, column, key, vocabulary, fallback):
+        null_ratio = self.null_ratio if column.is_nullable else 0.0
+        top_values = np.empty(len(self.top), dtype=object)
+        top_values[:] = [value for value, _ in self.top]
+        cumulative = np.cumsum([count for _, count in self.top], dtype=np.float64)
+        non_null = self.rows - self.nulls
+        tail_distinct = max(self.distinct - len(self.top), 0)
+        tail = self._tail(column, vocabulary, tail_distinct) if tail_distinct else None
+        if not len(cumulative):
+            top_share = 0.0
+        elif tail_distinct == 0 or non_null <= 0:
+            top_share = 1.0
+        else:
+            top_share = min(1.0, cumulative[-1] / non_null)
+
+        def generate(n, row_offset):
+            draws = draw_rows(key, row_offset, n, lambda rng, count: rng.random((count, 3)))
+            values = np.empty(n, dtype=object)
+            from_top = draws[:, 1] < top_share
+            if from_top.any():
+                positions = np.searchsorted(cumulative, draws[from_top, 2] * cumulative[-1], side='right')
+                values[from_top] = top_values[positions]
+            rest = ~from_top
+            if rest.any():
+                if tail is not None:
+                    values[rest] = tail((draws[rest, 2] * tail_distinct).astype(np.int64))
+                else:
+                    values[rest] = np.array(fallback(n, row_offset), dtype=object)[rest]
+            values[draws[:, 0] < null_ratio] = None
+            return values.tolist()
+        return generate
+
+    def _tail(self, column, vocabulary, tail_distinct):
+        data_type = column.data_type
+        if self.low is None or self.high is None:
+            return None
+        step_count = max(tail_distinct - 1, 1)
+        if data_type in INTEGER_TYPES:
+            low, high = int(self.low), int(self.high)
+            step = (high - low) / step_count
+            return lambda k: np.clip(np.round(low + k * step), low, high).astype(np.int64).astype(object)
+        if data_type in FLOAT_TYPES:
+            low, high = float(self.low), float(self.high)
+            step = (high - low) / step_count
+            return lambda k: np.round(low + k * step, 2).astype(object)
+        if data_type == 'DATE':
+            low = np.datetime64(self.low, 'D')
+            step = (np.datetime64(self.high, 'D') - low).astype(np.int64) / step_count
+            return lambda k: (low + np.round(k * step).astype('timedelta64[D]')).astype(object)
+        if data_type in DATETIME_TYPES:
+            low = np.datetime64(self.low, 's')
+            step = (np.datetime64(self.high, 's') - low).astype(np.int64) / step_count
+            return lambda k: (low + np.round(k * step).astype('timedelta64[s]')).astype(object)
+        if data_type in TEXT_TYPES:
+            return self._text_tail(column, vocabulary)
+        return None
+
+    def _text_tail(self, column, vocabulary):
+        max_length = column.max_length if column.max_length and column.max_length > 0 else None
+        if self.lengths:
+            lengths = np.array([length for length, _ in self.lengths], dtype=np.int64)
+            weights = np.cumsum([count for _, count in self.lengths], dtype=np.float64)
+        else:
+            lengths = np.arange(int(self.low), int(self.high) + 1, dtype=np.int64)
+            weights = np.arange(1, len(lengths) + 1, dtype=np.float64)
+        if max_length:
+            lengths = np.minimum(lengths, max_length)
+        # Значение k — срез текста из слов словаря со смещением, зависящим от k
+        longest = int(lengths.max()) if len(lengths) else 0
+        source = ' '.join(vocabulary)
+        source = source * (longest // max(len(source), 1) + 2)
+        span = len(source) - longest
+
+        def tail(k):
+            chosen = lengths[np.searchsorted(weights, ((k * GOLDEN) % 1.0) * weights[-1], side='right')]
+            offsets = (k * 7919) % span
+            result = np.empty(len(k), dtype=object)
+            result[:] = [source[offset:offset + length] for offset, length in zip(offsets.tolist(), chosen.tolist())]
+            return result
+        return tail
+
+
+# Профиль таблицы; сохраняется в JSON и используется генератором вместо
+# встроенных распределений для профилированных столбцов.
+class TableProfile:
+    def __init__(self, schema, table_name, rows, sampled_rows, columns, created=None):
+        self.schema = schema
+        self.table_name = table_name
+        self.rows = rows
+        self.sampled_rows = sampled_rows
+        self.columns = {column.name: column for column in columns}
+        self.created = created or datetime.datetime.now().replace(microsecond=0).isoformat()
+
+    def column(self, column_name):
+        return self.columns.get(column_name)
+
+    def to_dict(self):
+        return {'schema': self.schema, 'table': self.table_name, 'rows': self.rows,
+                'sampled_rows': self.sampled_rows, 'created': self.created,
+                'columns': [column.to_dict() for column in self.columns.values()]}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['schema'], data['table'], data['rows'], data['sampled_rows'],
+                   [ColumnProfile.from_dict(column) for column in data['columns']], data.get('created'))
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=2)
+        logging.info(f"Профиль данных таблицы {self.schema}.{self.table_name} сохранён в {path}")
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding='utf-8') as f:
+            return cls.from_dict(json.load(f))
+
+    @classmethod
+    def for_table(cls, database, schema, table_name, directory=DATA_PROFILE_DIR):
+        path = profile_path(database, schema, table_name, directory)
+        if not os.path.exists(path):
+            return None
+        try:
+            return cls.load(path)
+        except (OSError, ValueError, KeyError) as e:
+            logging.warning(f"Не удалось прочитать профиль данных {path}: {e}")
+            return None
+
+
+def _bounds_expressions(column):
+    name = f"[{column.name}]"
+    if column.data_type in TEXT_TYPES and column.data_type != 'TEXT':
+        return f"MIN(LEN({name}))", f"MAX(LEN({name}))"
+    if column.data_type == 'BIT':
+        return f"MIN(CAST({name} AS INT))", f"MAX(CAST({name} AS INT))"
+    if column.data_type in INTEGER_TYPES or column.data_type in FLOAT_TYPES \
+            or column.data_type == 'DATE' or column.data_type in DATETIME_TYPES:
+        return f"MIN({name})", f"MAX({name})"
+    return "NULL", "NULL"
+
+
+def _sample_clause(total_rows, sample_rows):
+    if total_rows <= sample_rows:
+        return ""
+    # REPEATABLE: все запросы профиля видят одну и ту же выборку страниц
+    percent = min(100, math.ceil(sample_rows * 100 / total_rows))
+    return f" TABLESAMPLE ({percent} PERCENT) REPEATABLE (1)"
+
+
+# Снимает профиль существующей таблицы агрегатами на сервере: один запрос на
+# счётчики и границы всех столбцов, затем по запросу на частые значения и
+# гистограмму длин каждого столбца. Таблицы больше sample_rows строк
+# профилируются по выборке TABLESAMPLE.
+def profile_table(db_manager, table_name, schema='dbo', top_n=TOP_VALUES, sample_rows=PROFILE_SAMPLE_ROWS):
+    table = db_manager.catalog.get_table(table_name, schema)
+    if table is None:
+        raise ValueError(f"Схема таблицы {schema}.{table_name} недоступна")
+    columns = table.insertable_columns
+
+    cursor = db_manager.conn.cursor()
+    try:
+        cursor.execute("""
+            SELECT SUM(rows)
+            FROM sys.partitions
+            WHERE object_id = OBJECT_ID(?) AND index_id IN (0, 1)
+        """, (f"{schema}.{table_name}",))
+        row = cursor.fetchone()
+        total_rows = row[0] if row and row[0] is not None else 0
+        source = f"{table.full_name}{_sample_clause(total_rows, sample_rows)}"
+
+        expressions = ["COUNT_BIG(*)"]
+        for column in columns:
+            name = f"[{column.name}]"
+            sortable = column.data_type not in UNSORTABLE_TYPES
+            expressions.append(f"COUNT_BIG({name})")
+            expressions.append(f"COUNT(DISTINCT {name})" if sortable else "NULL")
+            expressions.extend(_bounds_expressions(column))
+        cursor.execute(f"SELECT {', '.join(expressions)} FROM {source}")
+        row = cursor.fetchone()
+        sampled_rows = row[0]
+
+        profiles = []
+        for number, column in enumerate(columns):
+            non_null, distinct, low, high = row[1 + number * 4:5 + number * 4]
+            name = f"[{column.name}]"
+            top = []
+            lengths = []
+            if column.data_type not in UNSORTABLE_TYPES and non_null and (distinct or 0) < non_null:
+                # Столбец без повторов частых значений не имеет
+                cursor.execute(f"""
+                    SELECT TOP (?) {name} AS Value, COUNT_BIG(*) AS Frequency
+                    FROM {source}
+                    WHERE {name} IS NOT NULL
+                    GROUP BY {name}
+                    ORDER BY COUNT_BIG(*) DESC
+                """, (top_n,))
+                top = [(row_top.Value, row_top.Frequency) for row_top in cursor.fetchall()]
+            if column.data_type in TEXT_TYPES and column.data_type != 'TEXT' and non_null:
+                cursor.execute(f"""
+                    SELECT LEN({name}) AS Length, COUNT_BIG(*) AS Frequency
+                    FROM {source}
+                    WHERE {name} IS NOT NULL
+                    GROUP BY LEN({name})
+                """)
+                lengths = sorted((row_length.Length, row_length.Frequency) for row_length in cursor.fetchall())
+            profiles.append(ColumnProfile(column.name, column.data_type, sampled_rows, sampled_rows - non_null,
+                                          distinct or 0, low, high, top, lengths))
+    finally:
+        cursor.close()
+
+    profile = TableProfile(schema, table_name, total_rows, sampled_rows, profiles)
+    logging.info(f"Снят профиль данных таблицы {schema}.{table_name}: просмотрено {sampled_rows} "
+                 f"из {total_rows} строк, столбцов: {len(profiles)}")
+    return profile
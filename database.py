@@ -1,21 +1,100 @@
 # database.py
 
-import random
-import uuid
+import time
 import logging
-import pyodbc
-from faker import Faker
-from utils import generate_sql_value
-import tkinter.messagebox as messagebox
+from schema import SchemaCatalog, UniqueKey
+from record_batch import RecordBatch
+from instrumentation import Instrumentation, InstrumentedConnection
 
-# Инициализация Faker с русской локализацией
-fake = Faker('ru_RU')
-MAX_RECORDS = 1000
+# Генерация идёт потоково порциями, поэтому лимит защищает только от опечаток
+MAX_RECORDS = 100000000
+
+# Параметры пакетной вставки
+INSERT_MODES = ('fast_executemany', 'multirow', 'tvp')
+INSERT_BATCH_SIZE = 1000
+MAX_ROWS_PER_VALUES = 1000
+MAX_STATEMENT_PARAMETERS = 2100
+# SQLSTATE, по которым драйвер не поддерживает fast_executemany
+FAST_EXECUTEMANY_UNSUPPORTED_STATES = ('HYC00', 'HY010', 'IM001')
+
+
+class OperationCancelled(Exception):
+    pass
+
+
+# Обработчик сообщений по умолчанию: текст уже записан в лог, поэтому без
+# интерфейса сообщения никуда больше не выводятся и ничего не блокируют.
+def ignore_message(title, message):
+    pass
 
 
 class DatabaseManager:
-    def __init__(self):
+    # driver — модуль с функцией connect, совместимой с pyodbc; замеры
+    # подставляют сюда заменитель сервера из fakedb.
+    def __init__(self, error_callback=None, info_callback=None, driver=None):
+        self._driver = driver
         self.conn = None
+        self.connection_string = None
+        self.server = None
+        self.database = None
+        self.error_callback = error_callback or ignore_message
+        self.info_callback = info_callback or ignore_message
+        self.catalog = SchemaCatalog(self)
+        self.metrics = Instrumentation()
+        # 'cprofile' или 'tracemalloc' — профилировать фоновые заполнения
+        self.profile_mode = None
+        # Подсказка TABLOCK во всех INSERT; включается режимом быстрой загрузки
+        self.tablock = False
+        # Типы и процедуры режима вставки tvp; задаются tvp.tvp_insert
+        self.tvp_objects = None
+
+    # pyodbc загружается при первом подключении: окно подключения не ждёт
+    # загрузки драйвера
+    @property
+    def driver(self):
+        if self._driver is None:
+            import pyodbc
+            self._driver = pyodbc
+        return self._driver
+
+    def open_connection(self):
+        conn = InstrumentedConnection(self.driver.connect(self.connection_string), self.metrics)
+        if self.database:
+            conn.autocommit = True
+            conn.execute(f"USE [{self.database}];")
+        return conn
+
+    # Заменяет оборванное соединение новым к той же базе данных
+    def reconnect(self):
+        try:
+            self.conn.close()
+        except Exception:
+            pass
+        self.conn = self.open_connection()
+
+    # Новый менеджер с собственным соединением к той же базе данных и общим
+    # кэшем схемы; используется параллельными загрузчиками.
+    def clone(self):
+        manager = DatabaseManager(error_callback=self.error_callback, info_callback=self.info_callback,
+                                  driver=self.driver)
+        manager.metrics = self.metrics
+        manager.profile_mode = self.profile_mode
+        # TABLOCK наследуется для соединений планировщика, каждое из которых пишет в
+        # свою таблицу; parallel_fill отключает его, когда в таблицу пишут несколько
+        manager.tablock = self.tablock
+        manager.tvp_objects = self.tvp_objects
+        manager.conn = self.open_connection()
+        manager.connection_string = self.connection_string
+        manager.server = self.server
+        manager.database = self.database
+        manager.catalog = self.catalog.share(manager)
+        return manager
+
+    def show_error(self, title, message):
+        self.error_callback(title, message)
+
+    def show_info(self, title, message):
+        self.info_callback(title, message)
 
     def connect(self, server, auth_method, username='', password=''):
         try:
@@ -23,12 +102,15 @@ class DatabaseManager:
                 connection_string = f'DRIVER={{ODBC Driver 17 for SQL Server}};SERVER={server};UID={username};PWD={password};'
             else:
                 connection_string = f'DRIVER={{ODBC Driver 17 for SQL Server}};SERVER={server};Trusted_Connection=yes;'
-            self.conn = pyodbc.connect(connection_string)
+            self.conn = InstrumentedConnection(self.driver.connect(connection_string), self.metrics)
+            self.connection_string = connection_string
+            self.server = server
+            self.catalog.invalidate()
             logging.info(f"Успешное подключение к серверу {server}")
             return True
         except Exception as e:
             logging.error(f"Ошибка подключения к серверу {server}: {e}")
-            messagebox.showerror("Ошибка подключения", f"Ошибка подключения: {e}")
+            self.show_error("Ошибка подключения", f"Ошибка подключения: {e}")
             return False
 
     def get_databases(self):
@@ -40,18 +122,20 @@ class DatabaseManager:
             return databases
         except Exception as e:
             logging.error(f"Ошибка при получении списка баз данных: {e}")
-            messagebox.showerror("Ошибка", f"Ошибка при получении списка баз данных: {e}")
+            self.show_error("Ошибка", f"Ошибка при получении списка баз данных: {e}")
             return []
 
     def use_database(self, database_name):
         try:
             self.conn.autocommit = True
             self.conn.execute(f"USE [{database_name}];")
+            self.database = database_name
+            self.catalog.invalidate()
             logging.info(f"Переключено на базу данных {database_name}")
             return True
         except Exception as e:
             logging.error(f"Ошибка при переключении базы данных {database_name}: {e}")
-            messagebox.showerror("Ошибка", f"Ошибка при переключении базы данных: {e}")
+            self.show_error("Ошибка", f"Ошибка при переключении базы данных: {e}")
             return False
 
     def get_tables(self):
@@ -63,9 +147,12 @@ class DatabaseManager:
             return tables
         except Exception as e:
             logging.error(f"Ошибка при получении списка таблиц: {e}")
-            messagebox.showerror("Ошибка", f"Ошибка при получении списка таблиц: {e}")
+            self.show_error("Ошибка", f"Ошибка при получении списка таблиц: {e}")
             return []
 
+    def invalidate_schema_cache(self, table_name=None, schema='dbo'):
+        self.catalog.invalidate(table_name, schema)
+
     def get_table_schema(self, table_name, schema='dbo'):
         cursor = self.conn.cursor()
         try:
@@ -78,13 +165,14 @@ class DatabaseManager:
                     COLUMNPROPERTY(OBJECT_ID(TABLE_SCHEMA + '.' + TABLE_NAME), COLUMN_NAME, 'IsIdentity') AS IsIdentity
                 FROM INFORMATION_SCHEMA.COLUMNS
                 WHERE TABLE_NAME = ? AND TABLE_SCHEMA = ?
+                ORDER BY ORDINAL_POSITION
             """, (table_name, schema))
             schema_info = cursor.fetchall()
             logging.info(f"Получена схема таблицы {schema}.{table_name}")
             return schema_info
         except Exception as e:
             logging.error(f"Ошибка при получении схемы таблицы {schema}.{table_name}: {e}")
-            messagebox.showerror("Ошибка", f"Ошибка при получении схемы таблицы {table_name}: {e}")
+            self.show_error("Ошибка", f"Ошибка при получении схемы таблицы {table_name}: {e}")
             return []
         finally:
             cursor.close()
@@ -116,40 +204,163 @@ class DatabaseManager:
             return foreign_keys
         except Exception as e:
             logging.error(f"Ошибка при получении внешних ключей для таблицы {schema}.{table_name}: {e}")
-            messagebox.showerror("Ошибка", f"Ошибка при получении внешних ключей для таблицы {table_name}: {e}")
+            self.show_error("Ошибка", f"Ошибка при получении внешних ключей для таблицы {table_name}: {e}")
             return []
         finally:
             cursor.close()
 
-    def get_unique_columns(self, table_name, schema='dbo'):
+    def get_unique_keys(self, table_name, schema='dbo'):
+        # Первичные ключи, ограничения UNIQUE и уникальные индексы, включая составные
         cursor = self.conn.cursor()
         try:
             cursor.execute("""
                 SELECT
-                    kcu.COLUMN_NAME,
-                    c.DATA_TYPE
+                    i.name AS IndexName,
+                    i.is_primary_key AS IsPrimaryKey,
+                    c.name AS ColumnName
                 FROM
-                    INFORMATION_SCHEMA.TABLE_CONSTRAINTS tc
-                    JOIN INFORMATION_SCHEMA.KEY_COLUMN_USAGE kcu
-                        ON tc.CONSTRAINT_NAME = kcu.CONSTRAINT_NAME
-                    JOIN INFORMATION_SCHEMA.COLUMNS c
-                        ON c.TABLE_NAME = tc.TABLE_NAME AND c.COLUMN_NAME = kcu.COLUMN_NAME
+                    sys.indexes AS i
+                INNER JOIN
+                    sys.index_columns AS ic ON ic.object_id = i.object_id AND ic.index_id = i.index_id
+                INNER JOIN
+                    sys.columns AS c ON c.object_id = ic.object_id AND c.column_id = ic.column_id
                 WHERE
-                    tc.TABLE_NAME = ?
-                    AND tc.TABLE_SCHEMA = ?
-                    AND tc.CONSTRAINT_TYPE = 'UNIQUE'
-            """, (table_name, schema))
-            unique_columns_info = cursor.fetchall()
-            unique_columns = [(row.COLUMN_NAME, row.DATA_TYPE) for row in unique_columns_info if row.DATA_TYPE.upper() not in ['BIT']]
-            logging.info(f"Уникальные столбцы для таблицы {schema}.{table_name}: {[col[0] for col in unique_columns]}")
-            return unique_columns
+                    i.object_id = OBJECT_ID(?)
+                    AND i.is_unique = 1
+                    AND i.is_disabled = 0
+                    AND i.is_hypothetical = 0
+                    AND ic.is_included_column = 0
+                ORDER BY
+                    i.index_id, ic.key_ordinal
+            """, (f"{schema}.{table_name}",))
+            keys = {}
+            for row in cursor.fetchall():
+                name, is_primary_key, column_name = row[0], row[1], row[2]
+                keys.setdefault(name, (bool(is_primary_key), []))[1].append(column_name)
+            unique_keys = [UniqueKey(name, tuple(columns), is_primary_key)
+                           for name, (is_primary_key, columns) in keys.items()]
+            logging.info(f"Уникальные ключи для таблицы {schema}.{table_name}: "
+                         f"{[(key.name, key.columns) for key in unique_keys]}")
+            return unique_keys
         except Exception as e:
-            logging.error(f"Ошибка при получении уникальных столбцов для таблицы {schema}.{table_name}: {e}")
-            messagebox.showerror("Ошибка", f"Ошибка при получении уникальных столбцов для таблицы {table_name}: {e}")
+            logging.error(f"Ошибка при получении уникальных ключей для таблицы {schema}.{table_name}: {e}")
+            self.show_error("Ошибка", f"Ошибка при получении уникальных ключей для таблицы {table_name}: {e}")
             return []
         finally:
             cursor.close()
 
+    # Запросы к каталогу сразу по всей базе данных. Ошибки не перехватываются:
+    # SchemaCatalog в этом случае читает схему по таблицам.
+    def get_schema_fingerprint(self):
+        cursor = self.conn.cursor()
+        try:
+            # modify_date таблицы меняется и при создании или изменении её индексов
+            cursor.execute("""
+                SELECT COUNT(*), MAX(modify_date)
+                FROM sys.objects
+                WHERE is_ms_shipped = 0 AND type IN ('U', 'F', 'PK', 'UQ')
+            """)
+            row = cursor.fetchone()
+            return f"{row[0]}:{row[1]}"
+        finally:
+            cursor.close()
+
+    def get_all_columns(self):
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute("""
+                SELECT
+                    s.name AS SchemaName,
+                    t.name AS TableName,
+                    c.name AS ColumnName,
+                    TYPE_NAME(c.system_type_id) AS DataType,
+                    CASE
+                        WHEN c.max_length = -1 THEN -1
+                        WHEN TYPE_NAME(c.system_type_id) IN ('nchar', 'nvarchar') THEN c.max_length / 2
+                        WHEN TYPE_NAME(c.system_type_id) IN ('char', 'varchar', 'binary', 'varbinary') THEN c.max_length
+                    END AS MaxLength,
+                    c.is_nullable AS IsNullable,
+                    c.is_identity AS IsIdentity
+                FROM
+                    sys.tables AS t
+                INNER JOIN
+                    sys.schemas AS s ON s.schema_id = t.schema_id
+                INNER JOIN
+                    sys.columns AS c ON c.object_id = t.object_id
+                WHERE
+                    t.is_ms_shipped = 0
+                ORDER BY
+                    s.name, t.name, c.column_id
+            """)
+            return cursor.fetchall()
+        finally:
+            cursor.close()
+
+    def get_all_foreign_keys(self):
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute("""
+                SELECT
+                    SCHEMA_NAME(tp.schema_id) AS SchemaName,
+                    tp.name AS TableName,
+                    fk.name AS ForeignKey,
+                    cp.name AS ParentColumn,
+                    tr.name AS ReferencedTable,
+                    cr.name AS ReferencedColumn
+                FROM
+                    sys.foreign_keys AS fk
+                INNER JOIN
+                    sys.foreign_key_columns AS fkc ON fk.object_id = fkc.constraint_object_id
+                INNER JOIN
+                    sys.tables AS tp ON fkc.parent_object_id = tp.object_id
+                INNER JOIN
+                    sys.columns AS cp ON fkc.parent_object_id = cp.object_id AND fkc.parent_column_id = cp.column_id
+                INNER JOIN
+                    sys.tables AS tr ON fkc.referenced_object_id = tr.object_id
+                INNER JOIN
+                    sys.columns AS cr ON fkc.referenced_object_id = cr.object_id AND fkc.referenced_column_id = cr.column_id
+                ORDER BY
+                    tp.object_id, fk.object_id, fkc.constraint_column_id
+            """)
+            return cursor.fetchall()
+        finally:
+            cursor.close()
+
+    def get_all_unique_keys(self):
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute("""
+                SELECT
+                    SCHEMA_NAME(t.schema_id) AS SchemaName,
+                    t.name AS TableName,
+                    i.name AS IndexName,
+                    i.is_primary_key AS IsPrimaryKey,
+                    c.name AS ColumnName
+                FROM
+                    sys.indexes AS i
+                INNER JOIN
+                    sys.tables AS t ON t.object_id = i.object_id
+                INNER JOIN
+                    sys.index_columns AS ic ON ic.object_id = i.object_id AND ic.index_id = i.index_id
+                INNER JOIN
+                    sys.columns AS c ON c.object_id = ic.object_id AND c.column_id = ic.column_id
+                WHERE
+                    t.is_ms_shipped = 0
+                    AND i.is_unique = 1
+                    AND i.is_disabled = 0
+                    AND i.is_hypothetical = 0
+                    AND ic.is_included_column = 0
+                ORDER BY
+                    t.object_id, i.index_id, ic.key_ordinal
+            """)
+            return cursor.fetchall()
+        finally:
+            cursor.close()
+
+    def get_unique_columns(self, table_name, schema='dbo'):
+        table = self.catalog.get_table(table_name, schema)
+        return table.unique_columns if table is not None else []
+
     def get_existing_fk_values(self, referenced_table, referenced_column, schema='dbo'):
         cursor = self.conn.cursor()
         try:
@@ -159,174 +370,149 @@ class DatabaseManager:
             return values
         except Exception as e:
             logging.error(f"Ошибка при получении существующих значений из таблицы {schema}.{referenced_table}: {e}")
-            messagebox.showerror("Ошибка", f"Ошибка при получении существующих значений из таблицы {referenced_table}: {e}")
+            self.show_error("Ошибка", f"Ошибка при получении существующих значений из таблицы {referenced_table}: {e}")
             return []
         finally:
             cursor.close()
 
-    def generate_value(self, data_type):
+    def insert_records(self, table_name, records, schema='dbo', batch_size=INSERT_BATCH_SIZE,
+                       insert_mode='fast_executemany'):
+        if not records:
+            return False
+        if not isinstance(records, RecordBatch):
+            records = RecordBatch.from_records(records)
+
         try:
-            if data_type in ['NVARCHAR', 'VARCHAR', 'CHAR', 'NCHAR', 'TEXT']:
-                return fake.word()
-            elif data_type in ['INT', 'BIGINT', 'SMALLINT', 'TINYINT']:
-                return fake.unique.random_int(min=1, max=1000000)
-            elif data_type in ['FLOAT', 'REAL', 'DECIMAL', 'NUMERIC']:
-                return round(random.uniform(1.0, 1000.0), 2)
-            elif data_type == 'DATE':
-                return fake.date_between(start_date='-30y', end_date='today').strftime('%Y-%m-%d')
-            elif data_type in ['DATETIME', 'DATETIME2', 'SMALLDATETIME']:
-                return fake.date_time_between(start_date='-30y', end_date='now').strftime('%Y-%m-%d %H:%M:%S')
-            elif data_type == 'BIT':
-                return random.choice([0, 1])
-            elif data_type == 'UNIQUEIDENTIFIER':
-                return str(uuid.uuid4())
-            elif data_type == 'VARBINARY':
-                return fake.binary(length=16)
-            else:
-                return fake.word()
+            inserted = self.insert_batch(table_name, records, schema, batch_size, insert_mode)
+            self.show_info("Успех", f"Успешно вставлено {inserted} записей.")
+            return True
         except Exception as e:
-            logging.error(f"Ошибка в generate_value для типа данных {data_type}: {e}")
-            return None
+            self.show_error("Ошибка", f"Ошибка при вставке записей: {e}")
+            return False
+
+    # Вставляет порцию RecordBatch в одной транзакции и фиксирует её; при ошибке
+    # транзакция откатывается, а исключение пробрасывается вызывающему.
+    def insert_batch(self, table_name, batch, schema='dbo', batch_size=INSERT_BATCH_SIZE,
+                     insert_mode='fast_executemany', cancel_event=None):
+        table = self.catalog.get_table(table_name, schema)
+        if table is None:
+            raise ValueError(f"Схема таблицы {schema}.{table_name} недоступна")
 
-    def generate_records(self, table_name, n, schema='dbo'):
+        with self.metrics.stage('serialize'):
+            rows = list(batch.rows())
+        return self.insert_rows(table, list(batch.columns), rows, batch_size, insert_mode, cancel_event)
+
+    def insert_rows(self, table, columns, rows, batch_size=INSERT_BATCH_SIZE, insert_mode='fast_executemany',
+                    cancel_event=None):
+        schema, table_name = table.schema, table.name
+        cursor = self.conn.cursor()
+        autocommit = self.conn.autocommit
+        self.conn.autocommit = False
+        started_at = time.perf_counter()
         try:
-            schema_info = self.get_table_schema(table_name, schema)
-            if not schema_info:
-                logging.warning(f"Схема таблицы {schema}.{table_name} пустая.")
-                return []
-
-            foreign_keys = self.get_foreign_keys(table_name, schema)
-            fk_columns = {fk.ParentColumn: (fk.ReferencedTable, fk.ReferencedColumn) for fk in foreign_keys}
-
-            unique_columns = self.get_unique_columns(table_name, schema)
-            unique_generators = {}
-
-            for col, data_type in unique_columns:
-                if data_type.upper() in ['NVARCHAR', 'VARCHAR', 'CHAR', 'NCHAR', 'TEXT']:
-                    unique_generators[col] = fake.unique.word
-                elif data_type.upper() in ['INT', 'BIGINT', 'SMALLINT', 'TINYINT']:
-                    unique_generators[col] = lambda: fake.unique.random_int(min=1, max=1000000)
-                elif data_type.upper() == 'UNIQUEIDENTIFIER':
-                    unique_generators[col] = fake.unique.uuid4
-                else:
-                    unique_generators[col] = fake.unique.word
-
-            records = []
-            for i in range(n):
-                record = {}
-                for column in schema_info:
-                    column_name, data_type, char_max_length, is_nullable, is_identity = column
-                    if is_identity == 1:
-                        continue
-
-                    if column_name in fk_columns:
-                        referenced_table, referenced_column = fk_columns[column_name]
-                        existing_values = self.get_existing_fk_values(referenced_table, referenced_column, schema)
-                        if not existing_values:
-                            messagebox.showerror("Ошибка", f"Нет существующих значений для внешнего ключа {column_name} в таблице {referenced_table}.")
-                            logging.error(f"Нет существующих значений для внешнего ключа {column_name} в таблице {referenced_table}.")
-                            return []
-                        value = random.choice(existing_values)
-                    else:
-                        if any(col[0] == column_name for col in unique_columns):
-                            try:
-                                value = unique_generators[column_name]()
-                            except Exception as e:
-                                messagebox.showerror("Ошибка", f"Ошибка при генерации уникального значения для столбца {column_name}: {e}")
-                                logging.error(f"Ошибка при генерации уникального значения для столбца {column_name}: {e}")
-                                return []
-                        else:
-                            value = self.generate_value(data_type.upper())
-
-                        if data_type.upper() in ['NVARCHAR', 'VARCHAR', 'CHAR', 'NCHAR', 'TEXT'] and char_max_length:
-                            value = value[:char_max_length] if len(value) > char_max_length else value
-
-                    if value is None:
-                        if is_nullable == 'YES':
-                            record[column_name] = None
-                        else:
-                            while value is None:
-                                if column_name in fk_columns:
-                                    referenced_table, referenced_column = fk_columns[column_name]
-                                    existing_values = self.get_existing_fk_values(referenced_table, referenced_column, schema)
-                                    if not existing_values:
-                                        messagebox.showerror("Ошибка", f"Нет существующих значений для внешнего ключа {column_name} в таблице {referenced_table}.")
-                                        logging.error(f"Нет существующих значений для внешнего ключа {column_name} в таблице {referenced_table}.")
-                                        return []
-                                    value = random.choice(existing_values)
-                                else:
-                                    if any(col[0] == column_name for col in unique_columns):
-                                        try:
-                                            value = unique_generators[column_name]()
-                                        except Exception as e:
-                                            messagebox.showerror("Ошибка", f"Ошибка при генерации уникального значения для столбца {column_name}: {e}")
-                                            logging.error(f"Ошибка при генерации уникального значения для столбца {column_name}: {e}")
-                                            return []
-                                    else:
-                                        value = self.generate_value(data_type.upper())
-                                        if data_type.upper() in ['NVARCHAR', 'VARCHAR', 'CHAR', 'NCHAR', 'TEXT'] and char_max_length:
-                                            value = value[:char_max_length] if len(value) > char_max_length else value
-                                if value is not None:
-                                    break
-                            record[column_name] = value
-                    else:
-                        record[column_name] = value
-                records.append(record)
-
-            logging.info(f"Сгенерировано {len(records)} записей для таблицы {schema}.{table_name}")
-            return records
+            if insert_mode == 'fast_executemany':
+                try:
+                    self._insert_fast_executemany(cursor, table, columns, rows, batch_size, cancel_event)
+                except (AttributeError, self.driver.Error) as e:
+                    if isinstance(e, self.driver.Error) and e.args[0] not in FAST_EXECUTEMANY_UNSUPPORTED_STATES:
+                        raise
+                    logging.warning(f"fast_executemany недоступен ({e}), используется многострочный INSERT")
+                    self.conn.rollback()
+                    cursor.close()
+                    cursor = self.conn.cursor()
+                    self._insert_multirow(cursor, table, columns, rows, cancel_event)
+            elif insert_mode == 'tvp':
+                self._insert_tvp(cursor, table, columns, rows, cancel_event)
+            else:
+                self._insert_multirow(cursor, table, columns, rows, cancel_event)
+            self.conn.commit()
+            self.metrics.record_batch(len(rows), time.perf_counter() - started_at)
+            logging.info(f"Вставлено {len(rows)} записей в таблицу {schema}.{table_name} (режим {insert_mode})")
+            return len(rows)
+        except OperationCancelled:
+            self.conn.rollback()
+            logging.info(f"Вставка в таблицу {schema}.{table_name} отменена, транзакция откатана")
+            raise
         except Exception as e:
-            logging.error(f"Ошибка при генерации записей для таблицы {schema}.{table_name}: {e}")
-            messagebox.showerror("Ошибка", f"Ошибка при генерации записей: {e}")
-            return []
+            self.conn.rollback()
+            logging.error(f"Ошибка при вставке записей в таблицу {schema}.{table_name}: {e}")
+            raise
+        finally:
+            self.metrics.add_stage('insert', time.perf_counter() - started_at)
+            cursor.close()
+            self.conn.autocommit = autocommit
 
-    def generate_insert_queries(self, table_name, records, schema='dbo'):
-        if not records:
-            return []
+    def _insert_statement(self, table, columns, row_count=1):
+        columns_str = ', '.join([f"[{column}]" for column in columns])
+        row_placeholders = f"({', '.join(['?'] * len(columns))})"
+        hint = " WITH (TABLOCK)" if self.tablock else ""
+        return f"INSERT INTO {table.full_name}{hint} ({columns_str}) VALUES {', '.join([row_placeholders] * row_count)}"
 
-        queries = []
+    def _check_cancelled(self, cancel_event):
+        if cancel_event is not None and cancel_event.is_set():
+            raise OperationCancelled()
 
-        for record in records:
-            columns = record.keys()
-            values = []
-            try:
-                for column in columns:
-                    value = record[column]
-                    cursor = self.conn.cursor()
-                    cursor.execute("""
-                        SELECT DATA_TYPE
-                        FROM INFORMATION_SCHEMA.COLUMNS
-                        WHERE TABLE_NAME = ? AND COLUMN_NAME = ? AND TABLE_SCHEMA = ?
-                    """, (table_name, column, schema))
-                    result = cursor.fetchone()
-                    data_type = result[0] if result else 'NVARCHAR'
-                    sql_value = generate_sql_value(value, data_type.upper())
-                    values.append(sql_value)
-                    cursor.close()
-                columns_str = ', '.join([f"[{col}]" for col in columns])
-                query = f"INSERT INTO [{schema}].[{table_name}] ({columns_str}) VALUES ({', '.join(values)});"
-                queries.append(query)
-            except Exception as e:
-                logging.error(f"Ошибка при генерации запроса для столбца {column} в таблице {schema}.{table_name}: {e}")
-                continue
+    def _insert_fast_executemany(self, cursor, table, columns, rows, batch_size, cancel_event=None):
+        cursor.fast_executemany = True
+        query = self._insert_statement(table, columns)
+        for start in range(0, len(rows), batch_size):
+            self._check_cancelled(cancel_event)
+            cursor.executemany(query, rows[start:start + batch_size])
 
-        logging.info(f"Сгенерировано {len(queries)} SQL-запросов для вставки данных в таблицу {schema}.{table_name}")
-        return queries
+    def _insert_multirow(self, cursor, table, columns, rows, cancel_event=None):
+        rows_per_statement = max(1, min(MAX_ROWS_PER_VALUES, (MAX_STATEMENT_PARAMETERS - 1) // len(columns)))
+        full_query = self._insert_statement(table, columns, rows_per_statement)
+        for start in range(0, len(rows), rows_per_statement):
+            self._check_cancelled(cancel_event)
+            chunk = rows[start:start + rows_per_statement]
+            query = full_query if len(chunk) == rows_per_statement else self._insert_statement(table, columns, len(chunk))
+            cursor.execute(query, [value for row in chunk for value in row])
+
+    # Вся порция уходит одним табличным параметром в процедуру INSERT ... SELECT:
+    # один обмен с сервером и один план на порцию
+    def _insert_tvp(self, cursor, table, columns, rows, cancel_event=None):
+        if self.tvp_objects is None:
+            raise ValueError("Режим вставки tvp включается через tvp.tvp_insert")
+        procedure_name = self.tvp_objects.procedure(table, columns, self.tablock)
+        self._check_cancelled(cancel_event)
+        if rows:
+            cursor.execute(f"{{CALL {procedure_name} (?)}}", [rows])
+
+    def bulk_insert_file(self, table_name, data_path, schema='dbo', format_path=None, batch_size=None,
+                         tablock=True, field_terminator='\\t', row_terminator='0x0a'):
+        # Путь указывается так, как его видит служба SQL Server, а не клиент
+        options = ["CODEPAGE = '65001'", "KEEPNULLS"]
+        if format_path:
+            options.append(f"FORMATFILE = '{format_path.replace("'", "''")}'")
+        else:
+            options.append(f"FIELDTERMINATOR = '{field_terminator}'")
+            options.append(f"ROWTERMINATOR = '{row_terminator}'")
+        if tablock:
+            options.append("TABLOCK")
+        if batch_size:
+            options.append(f"BATCHSIZE = {int(batch_size)}")
+        query = (f"BULK INSERT [{schema}].[{table_name}] FROM '{data_path.replace("'", "''")}' "
+                 f"WITH ({', '.join(options)})")
 
-    def execute_queries(self, queries):
         cursor = self.conn.cursor()
+        autocommit = self.conn.autocommit
+        self.conn.autocommit = False
+        started_at = time.perf_counter()
         try:
-            for query in queries:
+            with self.metrics.stage('insert'):
                 cursor.execute(query)
-            self.conn.commit()
-            messagebox.showinfo("Успех", f"Успешно выполнено {len(queries)} запросов.")
-            logging.info(f"Успешно выполнено {len(queries)} запросов.")
+                inserted = cursor.rowcount
+                self.conn.commit()
+            self.metrics.record_batch(max(inserted, 0), time.perf_counter() - started_at)
+            logging.info(f"BULK INSERT в таблицу {schema}.{table_name} из файла {data_path}: {inserted} записей")
+            return inserted
         except Exception as e:
             self.conn.rollback()
-            messagebox.showerror("Ошибка", f"Ошибка при выполнении запросов: {e}")
-            logging.error(f"Ошибка при выполнении запросов: {e}")
+            logging.error(f"Ошибка BULK INSERT в таблицу {schema}.{table_name} из файла {data_path}: {e}")
+            raise
         finally:
             cursor.close()
+            self.conn.autocommit = autocommit
 
     def close_connection(self):
         if self.conn:
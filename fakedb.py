@@ -0,0 +1,490 @@
+# fakedb.py
+
+import hashlib
+import re
+import threading
+import time
+
+from schema import Column, ForeignKey, UniqueKey
+
+_INSERT_RE = re.compile(r"INSERT INTO \[(\w+)\]\.\[(\w+)\](?: WITH \(TABLOCK\))? \(([^)]*)\) VALUES ")
+_SELECT_COLUMN_RE = re.compile(r"SELECT \[(\w+)\] FROM \[(\w+)\]\.\[(\w+)\]")
+_SELECT_DISTINCT_RE = re.compile(r"SELECT DISTINCT ((?:\[\w+\](?:, )?)+) FROM \[(\w+)\]\.\[(\w+)\]")
+_UPDATE_RE = re.compile(r"UPDATE \[(\w+)\]\.\[(\w+)\] SET \[(\w+)\] = \? WHERE \[(\w+)\] = \?")
+_SELECT_TOP_RE = re.compile(r"SELECT TOP \((\d+)\) \[(\w+)\], \[(\w+)\] FROM \[(\w+)\]\.\[(\w+)\] "
+                            r"WHERE \[(\w+)\] IS NULL(?: AND \[\w+\] > \?)? ORDER BY ")
+_SELECT_MAX_RE = re.compile(r"SELECT MAX\(\[(\w+)\]\) FROM \[(\w+)\]\.\[(\w+)\]")
+_PROCEDURE_RE = re.compile(r"CREATE PROCEDURE (\[\w+\]\.\[\w+\]) .*?"
+                           r"(INSERT INTO \[\w+\]\.\[\w+\](?: WITH \(TABLOCK\))? \([^)]*\)) SELECT ")
+_CALL_RE = re.compile(r"\{CALL (\[\w+\]\.\[\w+\]) \(\?\)\}")
+_CONSTRAINT_RE = re.compile(r"ALTER TABLE \[(\w+)\]\.\[(\w+)\] (?:WITH CHECK )?(NO)?CHECK CONSTRAINT (.*)")
+_TRY_CAST_RE = re.compile(r"SELECT MAX\(TRY_CAST\(RIGHT\(\[(\w+)\].*FROM \[(\w+)\]\.\[(\w+)\]")
+
+
+class FakeError(Exception):
+    pass
+
+
+# Строка результата: доступ по индексу и по имени столбца, как у pyodbc.Row
+class FakeRow(tuple):
+    def __new__(cls, names, values):
+        row = tuple.__new__(cls, values)
+        row._names = names
+        return row
+
+    def __getattr__(self, name):
+        try:
+            return self[self._names.index(name)]
+        except ValueError:
+            raise AttributeError(name)
+
+
+class FakeTable:
+    def __init__(self, schema, name, columns, foreign_keys=(), unique_keys=()):
+        self.schema = schema
+        self.name = name
+        self.columns = list(columns)
+        self.foreign_keys = list(foreign_keys)
+        self.unique_keys = list(unique_keys)
+        self.rows = []
+        self.row_count = 0
+        self.next_identity = 1
+        self.retain_rows = False
+        # Значения уникальных ключей (кроме ключей на identity) и столбцов,
+        # на которые ссылаются внешние ключи
+        self.unique_values = {key.name: set() for key in self.checked_unique_keys}
+        self.referenced_values = {}
+        # Внешние ключи, отключённые через NOCHECK CONSTRAINT
+        self.nochecked = set()
+
+    @property
+    def checked_unique_keys(self):
+        identity = {column.name for column in self.columns if column.is_identity}
+        return [key for key in self.unique_keys if identity.isdisjoint(key.columns)]
+
+    def column_index(self, column_name):
+        return [column.name for column in self.columns].index(column_name)
+
+
+# Счётчики обращений к серверу. Каждый execute, executemany, commit и rollback —
+# один обмен с сервером; запросы к каталогу считаются отдельно.
+class RoundTripStats:
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.round_trips = 0
+        self.catalog_queries = 0
+        self.statements = 0
+        self.rows_inserted = 0
+        self.commits = 0
+        self.rollbacks = 0
+        self.server_seconds = 0.0
+
+    def snapshot(self):
+        return {'round_trips': self.round_trips, 'catalog_queries': self.catalog_queries,
+                'statements': self.statements, 'rows_inserted': self.rows_inserted, 'commits': self.commits,
+                'rollbacks': self.rollbacks, 'server_seconds': self.server_seconds}
+
+
+# Заменитель SQL Server в памяти с интерфейсом модуля pyodbc (connect), понимающий
+# запросы, которые отправляет DatabaseManager. Строки хранятся только у таблиц,
+# на которые ссылаются внешние ключи, остальные лишь подсчитываются. Уникальные
+# и внешние ключи проверяются, rollback отменяет изменения транзакции, поэтому
+# замеры включают обработку отклонённых строк.
+# latency — искусственная задержка одного обмена с сервером в секундах.
+class FakeDatabase:
+    # Как pyodbc.Error: базовый класс ошибок драйвера
+    Error = FakeError
+
+    def __init__(self, name='Benchmark', latency=0.0):
+        self.name = name
+        self.latency = latency
+        self.recovery_model = 'FULL'
+        # Выполненные ALTER в порядке выполнения, для проверки быстрой загрузки
+        self.ddl = []
+        # Процедуры режима tvp: имя -> INSERT, которым процедура вставляет строки
+        self.procedures = {}
+        self.types = set()
+        self.tables = {}
+        self.stats = RoundTripStats()
+        self._lock = threading.Lock()
+
+    def add_table(self, name, columns, foreign_keys=(), unique_keys=(), schema='dbo'):
+        columns = [column if isinstance(column, Column) else Column(*column) for column in columns]
+        foreign_keys = [fk if isinstance(fk, ForeignKey) else ForeignKey(*fk) for fk in foreign_keys]
+        unique_keys = [key if isinstance(key, UniqueKey) else UniqueKey(*key) for key in unique_keys]
+        table = FakeTable(schema, name, columns, foreign_keys, unique_keys)
+        self.tables[(schema, name)] = table
+        for other in self.tables.values():
+            for fk in other.foreign_keys:
+                if (other.schema, fk.referenced_table) in self.tables:
+                    referenced = self.tables[(other.schema, fk.referenced_table)]
+                    referenced.retain_rows = True
+                    referenced.referenced_values.setdefault(fk.referenced_column, set())
+        return table
+
+    def connect(self, connection_string=None, **kwargs):
+        return FakeConnection(self)
+
+    def table(self, schema, name):
+        table = self.tables.get((schema, name))
+        if table is None:
+            raise FakeError(f"Invalid object name '{schema}.{name}'")
+        return table
+
+    def round_trip(self, catalog=False):
+        with self._lock:
+            self.stats.round_trips += 1
+            if catalog:
+                self.stats.catalog_queries += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    # undo — журнал открытой транзакции соединения, None в режиме autocommit
+    def execute(self, sql, params=(), many=False, undo=None):
+        text = ' '.join(sql.split())
+        catalog = 'INFORMATION_SCHEMA' in text or 'sys.' in text
+        self.round_trip(catalog)
+        started_at = time.perf_counter()
+        with self._lock:
+            self.stats.statements += 1
+            try:
+                if many and text.startswith('UPDATE'):
+                    return self._update(text, params, undo)
+                if many:
+                    return self._insert(text, params, many=True, undo=undo)
+                return self._dispatch(text, params, undo)
+            finally:
+                self.stats.server_seconds += time.perf_counter() - started_at
+
+    # Откат транзакции: вставленные строки удаляются, обновлённые возвращаются.
+    # Счётчик identity, как и у SQL Server, не откатывается.
+    def rollback(self, undo):
+        with self._lock:
+            for action, table, rows, keys in reversed(undo):
+                if action == 'insert':
+                    inserted = {id(row) for row in rows}
+                    table.rows = [row for row in table.rows if id(row) not in inserted]
+                    table.row_count -= keys.pop('count')
+                    for name, values in keys.items():
+                        target = table.unique_values.get(name, table.referenced_values.get(name))
+                        target.difference_update(values)
+                else:
+                    restored = dict(rows)
+                    table.rows = [restored.get(id(row), row) for row in table.rows]
+
+    def _dispatch(self, text, params, undo=None):
+        if text.startswith('INSERT'):
+            return self._insert(text, params, undo=undo)
+        if text.startswith('USE') or text.startswith('UPDATE'):
+            return [], 0
+        if text.startswith('{CALL'):
+            match = _CALL_RE.match(text)
+            if match is None or match.group(1) not in self.procedures:
+                raise FakeError(f"Could not find stored procedure '{text[6:80]}'")
+            return self._insert(self.procedures[match.group(1)], params[0], many=True, undo=undo)
+        if text.startswith('CREATE TYPE'):
+            self.ddl.append(text)
+            self.types.add(text.split()[2])
+            return [], -1
+        if text.startswith('CREATE PROCEDURE'):
+            match = _PROCEDURE_RE.match(text)
+            if match is None:
+                raise FakeError(f"Запрос не поддерживается заменителем сервера: {text[:80]}")
+            self.ddl.append(text)
+            self.procedures[match.group(1)] = match.group(2) + ' VALUES '
+            return [], -1
+        if text.startswith('DROP'):
+            self.ddl.append(text)
+            kind, name = text.split()[1:3]
+            objects = self.procedures if kind == 'PROCEDURE' else self.types
+            if name not in objects:
+                raise FakeError(f"Cannot drop the {kind.lower()} '{name}'")
+            if kind == 'PROCEDURE':
+                del self.procedures[name]
+            else:
+                self.types.discard(name)
+            return [], -1
+        if text.startswith('ALTER'):
+            self.ddl.append(text)
+            if text.startswith('ALTER DATABASE'):
+                self.recovery_model = text.rsplit(' ', 1)[1]
+            match = _CONSTRAINT_RE.match(text)
+            if match:
+                table = self.table(match.group(1), match.group(2))
+                names = {name.strip(' []') for name in match.group(4).split(',')}
+                if match.group(3):
+                    table.nochecked |= names
+                else:
+                    table.nochecked -= names
+            return [], -1
+        if 'recovery_model_desc' in text:
+            return [FakeRow(['recovery_model_desc'], (self.recovery_model,))], -1
+        if "type_desc = 'NONCLUSTERED'" in text:
+            # Неуникальных индексов у таблиц заменителя нет
+            return [], -1
+        if 'sys.check_constraints' in text:
+            table = self._object(params[0])
+            return [FakeRow(['ConstraintName'], (fk.name,)) for fk in (table.foreign_keys if table else [])], -1
+        if 'FROM sys.databases' in text:
+            return [FakeRow(['name'], (self.name,))], -1
+        if 'INFORMATION_SCHEMA.TABLES' in text:
+            return [FakeRow(['TABLE_NAME'], (table.name,)) for table in self.tables.values()], -1
+        if 'FROM sys.objects' in text:
+            # Вместо даты изменения — хэш определений, чтобы снимок схемы
+            # не совпал у разных наборов таблиц
+            definition = repr(sorted((key, table.columns, table.foreign_keys, table.unique_keys)
+                                     for key, table in self.tables.items()))
+            return [FakeRow(['count', 'modify_date'],
+                            (len(self.tables), hashlib.sha1(definition.encode()).hexdigest()))], -1
+        if 'TYPE_NAME(c.system_type_id)' in text:
+            names = ['SchemaName', 'TableName', 'ColumnName', 'DataType', 'MaxLength', 'IsNullable', 'IsIdentity']
+            return [FakeRow(names, (table.schema, table.name, column.name, column.data_type.lower(),
+                                    column.max_length, column.is_nullable, column.is_identity))
+                    for table in self.tables.values() for column in table.columns], -1
+        if 'sys.foreign_keys' in text and not params:
+            names = ['SchemaName', 'TableName', 'ForeignKey', 'ParentColumn', 'ReferencedTable', 'ReferencedColumn']
+            return [FakeRow(names, (table.schema, table.name) + tuple(fk))
+                    for table in self.tables.values() for fk in table.foreign_keys], -1
+        if 'sys.indexes' in text and not params:
+            names = ['SchemaName', 'TableName', 'IndexName', 'IsPrimaryKey', 'ColumnName']
+            return [FakeRow(names, (table.schema, table.name, key.name, key.is_primary_key, column_name))
+                    for table in self.tables.values() for key in table.unique_keys
+                    for column_name in key.columns], -1
+        if 'INFORMATION_SCHEMA.COLUMNS' in text:
+            table = self.tables.get((params[1], params[0]))
+            if table is None:
+                return [], -1
+            names = ['COLUMN_NAME', 'DATA_TYPE', 'CHARACTER_MAXIMUM_LENGTH', 'IS_NULLABLE', 'IsIdentity']
+            return [FakeRow(names, (column.name, column.data_type.lower(), column.max_length,
+                                    'YES' if column.is_nullable else 'NO', 1 if column.is_identity else 0))
+                    for column in table.columns], -1
+        if 'sys.foreign_keys' in text:
+            table = self._object(params[0])
+            names = ['ForeignKey', 'ParentColumn', 'ReferencedTable', 'ReferencedColumn']
+            return [FakeRow(names, tuple(fk)) for fk in table.foreign_keys] if table else [], -1
+        if 'sys.indexes' in text:
+            table = self._object(params[0])
+            names = ['IndexName', 'IsPrimaryKey', 'ColumnName']
+            return [FakeRow(names, (key.name, key.is_primary_key, column_name))
+                    for key in (table.unique_keys if table else []) for column_name in key.columns], -1
+        if 'sys.partitions' in text:
+            table = self._object(params[0])
+            return [FakeRow(['rows'], (table.row_count if table else None,))], -1
+
+        match = _TRY_CAST_RE.match(text)
+        if match:
+            values = self._column_values(*match.groups())
+            suffixes = [int(value.rsplit('-', 1)[1]) for value in values
+                        if isinstance(value, str) and '-' in value and value.rsplit('-', 1)[1].isdigit()]
+            return [FakeRow(['value'], (max(suffixes) if suffixes else None,))], -1
+        match = _SELECT_TOP_RE.match(text)
+        if match:
+            limit, key_name, value_name, schema, table_name, null_name = match.groups()
+            table = self.table(schema, table_name)
+            key_index, value_index, null_index = (table.column_index(key_name), table.column_index(value_name),
+                                                  table.column_index(null_name))
+            rows = sorted((row[key_index], row[value_index]) for row in table.rows
+                          if row[null_index] is None and (not params or row[key_index] > params[0]))
+            return [FakeRow([key_name, value_name], values) for values in rows[:int(limit)]], -1
+        match = _SELECT_DISTINCT_RE.match(text)
+        if match:
+            column_names = [column.strip(' []') for column in match.group(1).split(',')]
+            columns = [self._column_values(column_name, *match.groups()[1:]) for column_name in column_names]
+            rows = {values for values in zip(*columns) if None not in values}
+            return [FakeRow(column_names, values) for values in sorted(rows)], -1
+        match = _SELECT_MAX_RE.match(text)
+        if match:
+            values = [value for value in self._column_values(*match.groups()) if value is not None]
+            return [FakeRow(['value'], (max(values) if values else None,))], -1
+        match = _SELECT_COLUMN_RE.match(text)
+        if match:
+            column_name = match.group(1)
+            return [FakeRow([column_name], (value,)) for value in self._column_values(*match.groups())
+                    if value is not None], -1
+        raise FakeError(f"Запрос не поддерживается заменителем сервера: {text[:80]}")
+
+    def _object(self, object_name):
+        schema, _, name = object_name.rpartition('.')
+        return self.tables.get((schema or 'dbo', name))
+
+    def _column_values(self, column_name, schema, table_name):
+        table = self.table(schema, table_name)
+        index = table.column_index(column_name)
+        return [row[index] for row in table.rows]
+
+    # Обновление одного столбца по ключу через executemany
+    def _update(self, text, params, undo=None):
+        match = _UPDATE_RE.match(text)
+        if match is None:
+            raise FakeError(f"Запрос не поддерживается заменителем сервера: {text[:80]}")
+        schema, table_name, column_name, key_name = match.groups()
+        table = self.table(schema, table_name)
+        fk = next((fk for fk in table.foreign_keys if fk.column == column_name), None)
+        if fk is not None:
+            self._check_references(table, fk, [value for value, _ in params])
+        if not table.retain_rows:
+            return [], len(params)
+        column_index, key_index = table.column_index(column_name), table.column_index(key_name)
+        positions = {row[key_index]: position for position, row in enumerate(table.rows)}
+        replaced = []
+        for value, key in params:
+            position = positions.get(key)
+            if position is not None:
+                row = list(table.rows[position])
+                row[column_index] = value
+                replaced.append((table.rows[position], tuple(row)))
+                table.rows[position] = replaced[-1][1]
+        if undo is not None:
+            undo.append(('update', table, [(id(new), old) for old, new in replaced], None))
+        return [], len(replaced)
+
+    # Проверки ограничений выполняются до вставки: при нарушении, как у
+    # SQL Server, не вставляется ни одна строка запроса.
+    def _check_unique(self, table, columns, rows):
+        added = {}
+        for key in table.checked_unique_keys:
+            positions = [columns.index(name) if name in columns else None for name in key.columns]
+            values = [tuple(None if position is None else row[position] for position in positions)
+                      for row in rows]
+            existing = table.unique_values[key.name]
+            batch = set()
+            for value in values:
+                if value in existing or value in batch:
+                    kind = 'PRIMARY KEY' if key.is_primary_key else 'UNIQUE KEY'
+                    raise FakeError('23000', f"Violation of {kind} constraint '{key.name}'. Cannot insert duplicate "
+                                             f"key in object '{table.schema}.{table.name}'. The duplicate key value "
+                                             f"is ({', '.join(map(str, value))}). (2627)")
+                batch.add(value)
+            added[key.name] = batch
+        return added
+
+    def _check_references(self, table, fk, values, pending=()):
+        if fk.name in table.nochecked:
+            return
+        referenced = self.table(table.schema, fk.referenced_table)
+        allowed = referenced.referenced_values[fk.referenced_column]
+        for value in values:
+            if value is not None and value not in allowed and value not in pending:
+                raise FakeError('23000', f"The INSERT statement conflicted with the FOREIGN KEY constraint "
+                                         f"\"{fk.name}\". The conflict occurred in table "
+                                         f"\"{referenced.schema}.{referenced.name}\", column "
+                                         f"'{fk.referenced_column}'. (547)")
+
+    def _insert(self, text, params, many=False, undo=None):
+        match = _INSERT_RE.match(text)
+        if match is None:
+            raise FakeError(f"Запрос не поддерживается заменителем сервера: {text[:80]}")
+        table = self.table(match.group(1), match.group(2))
+        columns = [column.strip(' []') for column in match.group(3).split(',')]
+        if many:
+            rows = [tuple(row) for row in params]
+        else:
+            width = len(columns)
+            rows = [tuple(params[start:start + width]) for start in range(0, len(params), width)]
+
+        added = self._check_unique(table, columns, rows)
+        stored_rows = []
+        if table.retain_rows:
+            positions = [table.column_index(column_name) for column_name in columns]
+            identity = next((index for index, column in enumerate(table.columns) if column.is_identity), None)
+            for offset, row in enumerate(rows):
+                stored = [None] * len(table.columns)
+                for position, value in zip(positions, row):
+                    stored[position] = value
+                if identity is not None:
+                    stored[identity] = table.next_identity + offset
+                stored_rows.append(tuple(stored))
+            for column_name in table.referenced_values:
+                index = table.column_index(column_name)
+                added[column_name] = {row[index] for row in stored_rows}
+        for fk in table.foreign_keys:
+            if fk.column in columns:
+                index = columns.index(fk.column)
+                # Ссылка на строку той же вставки допустима, как у SQL Server
+                pending = added.get(fk.referenced_column, ()) if fk.referenced_table == table.name else ()
+                self._check_references(table, fk, [row[index] for row in rows], pending)
+
+        if any(column.is_identity for column in table.columns):
+            table.next_identity += len(rows)
+        table.rows.extend(stored_rows)
+        for name, values in added.items():
+            table.unique_values.get(name, table.referenced_values.get(name)).update(values)
+        if undo is not None:
+            added['count'] = len(rows)
+            undo.append(('insert', table, stored_rows, added))
+        table.row_count += len(rows)
+        self.stats.rows_inserted += len(rows)
+        return [], len(rows)
+
+
+class FakeConnection:
+    def __init__(self, database):
+        self.database = database
+        self.autocommit = True
+        self.closed = False
+        # Изменения открытой транзакции, которые отменяет rollback
+        self.undo = []
+
+    @property
+    def transaction(self):
+        return None if self.autocommit else self.undo
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def execute(self, sql, *params):
+        return self.cursor().execute(sql, *params)
+
+    def commit(self):
+        self.database.round_trip()
+        self.database.stats.commits += 1
+        self.undo = []
+
+    def rollback(self):
+        self.database.round_trip()
+        self.database.stats.rollbacks += 1
+        self.database.rollback(self.undo)
+        self.undo = []
+
+    def close(self):
+        self.closed = True
+
+
+class FakeCursor:
+    def __init__(self, connection):
+        self.connection = connection
+        self.fast_executemany = False
+        self.rowcount = -1
+        self._rows = []
+
+    def execute(self, sql, *params):
+        if len(params) == 1 and isinstance(params[0], (list, tuple)):
+            params = params[0]
+        self._rows, self.rowcount = self.connection.database.execute(sql, tuple(params),
+                                                                     undo=self.connection.transaction)
+        return self
+
+    def executemany(self, sql, seq_of_params):
+        if self.fast_executemany:
+            self._rows, self.rowcount = self.connection.database.execute(sql, list(seq_of_params), many=True,
+                                                                         undo=self.connection.transaction)
+        else:
+            # Без fast_executemany каждая строка — отдельный обмен с сервером
+            for params in seq_of_params:
+                self.execute(sql, params)
+
+    def fetchone(self):
+        return self._rows.pop(0) if self._rows else None
+
+    def fetchmany(self, size=1):
+        rows, self._rows = self._rows[:size], self._rows[size:]
+        return rows
+
+    def fetchall(self):
+        rows, self._rows = self._rows, []
+        return rows
+
+    def close(self):
+        self._rows = []
@@ -0,0 +1,161 @@
+# fast_load.py
+
+import contextlib
+import logging
+import time
+
+RECOVERY_MODEL_QUERY = "SELECT recovery_model_desc FROM sys.databases WHERE name = DB_NAME()"
+# Уникальные индексы не отключаются: они обеспечивают ключи и на них могут
+# ссылаться внешние ключи, которые SQL Server отключил бы вместе с индексом.
+NONCLUSTERED_INDEXES_QUERY = """
+    SELECT i.name AS IndexName
+    FROM sys.indexes i
+    WHERE i.object_id = OBJECT_ID(?) AND i.type_desc = 'NONCLUSTERED'
+      AND i.is_disabled = 0 AND i.is_unique = 0 AND i.is_hypothetical = 0
+"""
+ENABLED_CONSTRAINTS_QUERY = """
+    SELECT name AS ConstraintName FROM sys.foreign_keys WHERE parent_object_id = OBJECT_ID(?) AND is_disabled = 0
+    UNION ALL
+    SELECT name FROM sys.check_constraints WHERE parent_object_id = OBJECT_ID(?) AND is_disabled = 0
+"""
+
+
+# Что было изменено режимом быстрой загрузки; всё перечисленное здесь
+# возвращается в исходное состояние, даже если подготовка прервалась.
+class FastLoadState:
+    def __init__(self, tablock):
+        self.tablock = tablock
+        self.recovery_model = None
+        self.disabled_indexes = []
+        self.nochecked_constraints = []
+        self.errors = []
+
+
+def _execute(conn, query, *params):
+    cursor = conn.cursor()
+    try:
+        cursor.execute(query, *params)
+    finally:
+        cursor.close()
+
+
+def _fetch_column(conn, query, *params):
+    cursor = conn.cursor()
+    try:
+        cursor.execute(query, *params)
+        return [row[0] for row in cursor.fetchall()]
+    finally:
+        cursor.close()
+
+
+# Режим быстрой загрузки для заполнения таблиц: INSERT с TABLOCK, отключённые
+# неуникальные некластерные индексы, внешние ключи и CHECK без проверки
+# (NOCHECK) и модель восстановления BULK_LOGGED вместо FULL, если хватает прав.
+# При выходе индексы перестраиваются, ограничения проверяются заново
+# (WITH CHECK CHECK CONSTRAINT), модель восстановления возвращается.
+@contextlib.contextmanager
+def fast_load(db_manager, table_names, schema='dbo', tablock=True, disable_indexes=True, defer_constraints=True,
+              bulk_logged=True):
+    state = FastLoadState(db_manager.tablock)
+    # Отдельное соединение в режиме autocommit: ALTER DATABASE нельзя выполнить
+    # внутри транзакции, а соединения загрузки могут быть посреди порции.
+    conn = db_manager.open_connection()
+    try:
+        if bulk_logged:
+            _switch_recovery_model(db_manager, conn, state)
+        for table_name in table_names:
+            full_name = f"[{schema}].[{table_name}]"
+            if disable_indexes:
+                _disable_indexes(conn, schema, table_name, full_name, state)
+            if defer_constraints:
+                _nocheck_constraints(conn, schema, table_name, full_name, state)
+        if tablock:
+            db_manager.tablock = True
+        logging.info(f"Быстрая загрузка включена для таблиц {', '.join(table_names)}: TABLOCK={tablock}, "
+                     f"отключено индексов: {len(state.disabled_indexes)}, "
+                     f"ограничений без проверки: {sum(len(names) for _, names in state.nochecked_constraints)}")
+        yield state
+    finally:
+        try:
+            _restore(db_manager, conn, state)
+        finally:
+            conn.close()
+        if state.errors:
+            message = '\n'.join(state.errors)
+            logging.error(f"Ошибки при восстановлении после быстрой загрузки:\n{message}")
+            db_manager.show_error("Ошибка", f"Не удалось полностью восстановить состояние после быстрой загрузки:\n{message}")
+
+
+def _switch_recovery_model(db_manager, conn, state):
+    try:
+        models = _fetch_column(conn, RECOVERY_MODEL_QUERY)
+        if not models or models[0] != 'FULL':
+            # В SIMPLE и BULK_LOGGED вставка с TABLOCK и так минимально журналируется
+            return
+        _execute(conn, f"ALTER DATABASE [{db_manager.database}] SET RECOVERY BULK_LOGGED")
+        state.recovery_model = 'FULL'
+        logging.info(f"База данных {db_manager.database} переведена в модель восстановления BULK_LOGGED")
+    except Exception as e:
+        logging.warning(f"Модель восстановления базы данных {db_manager.database} не изменена: {e}")
+
+
+def _disable_indexes(conn, schema, table_name, full_name, state):
+    try:
+        index_names = _fetch_column(conn, NONCLUSTERED_INDEXES_QUERY, (f"{schema}.{table_name}",))
+    except Exception as e:
+        logging.warning(f"Не удалось получить индексы таблицы {schema}.{table_name}: {e}")
+        return
+    for index_name in index_names:
+        try:
+            _execute(conn, f"ALTER INDEX [{index_name}] ON {full_name} DISABLE")
+            state.disabled_indexes.append((full_name, index_name))
+        except Exception as e:
+            logging.warning(f"Индекс {index_name} таблицы {schema}.{table_name} не отключён: {e}")
+
+
+def _nocheck_constraints(conn, schema, table_name, full_name, state):
+    try:
+        object_name = f"{schema}.{table_name}"
+        constraint_names = _fetch_column(conn, ENABLED_CONSTRAINTS_QUERY, (object_name, object_name))
+        if not constraint_names:
+            return
+        names = ', '.join(f"[{name}]" for name in constraint_names)
+        _execute(conn, f"ALTER TABLE {full_name} NOCHECK CONSTRAINT {names}")
+        state.nochecked_constraints.append((full_name, constraint_names))
+    except Exception as e:
+        logging.warning(f"Ограничения таблицы {schema}.{table_name} остаются включёнными: {e}")
+
+
+def _restore(db_manager, conn, state):
+    db_manager.tablock = state.tablock
+
+    for full_name, index_name in state.disabled_indexes:
+        started_at = time.perf_counter()
+        try:
+            _execute(conn, f"ALTER INDEX [{index_name}] ON {full_name} REBUILD")
+            logging.info(f"Индекс {index_name} таблицы {full_name} перестроен за {time.perf_counter() - started_at:.1f} с")
+        except Exception as e:
+            state.errors.append(f"Индекс {index_name} таблицы {full_name} не перестроен и остаётся отключённым: {e}")
+
+    for full_name, constraint_names in state.nochecked_constraints:
+        names = ', '.join(f"[{name}]" for name in constraint_names)
+        try:
+            _execute(conn, f"ALTER TABLE {full_name} WITH CHECK CHECK CONSTRAINT {names}")
+            logging.info(f"Ограничения таблицы {full_name} проверены и включены: {', '.join(constraint_names)}")
+        except Exception as e:
+            # Данные нарушают ограничение: включаем его хотя бы для новых строк
+            state.errors.append(f"Проверка ограничений {', '.join(constraint_names)} таблицы {full_name} "
+                                f"не пройдена: {e}")
+            try:
+                _execute(conn, f"ALTER TABLE {full_name} CHECK CONSTRAINT {names}")
+            except Exception as e:
+                state.errors.append(f"Ограничения таблицы {full_name} остаются отключёнными: {e}")
+
+    if state.recovery_model:
+        try:
+            _execute(conn, f"ALTER DATABASE [{db_manager.database}] SET RECOVERY {state.recovery_model}")
+            logging.info(f"Модель восстановления базы данных {db_manager.database} возвращена в {state.recovery_model}; "
+                         f"сделайте резервную копию журнала, чтобы восстановить точку во времени")
+        except Exception as e:
+            state.errors.append(f"Модель восстановления базы данных {db_manager.database} "
+                                f"не возвращена в {state.recovery_model}: {e}")
@@ -0,0 +1,154 @@
+# fk_pool.py
+
+import logging
+import math
+import random
+import threading
+from array import array
+
+from schema import INTEGER_TYPES
+
+# Сколько значений родительского ключа держать в памяти на один столбец
+FK_SAMPLE_LIMIT = 1000000
+FETCH_BATCH_SIZE = 10000
+
+
+# Пул значений внешних ключей на один запуск генерации: каждый родительский
+# столбец читается один раз, целочисленные ключи хранятся в array('q').
+# Ключи, сгенерированные в этом же запуске, добавляются в пул напрямую.
+class ForeignKeyPool:
+    def __init__(self, db_manager, sample_limit=FK_SAMPLE_LIMIT, seed=None):
+        self.db_manager = db_manager
+        self.sample_limit = sample_limit
+        self._random = random.Random(seed)
+        self._values = {}
+        self._seen = {}
+        self._tracked = set()
+        self._lock = threading.RLock()
+
+    def get_values(self, referenced_table, referenced_column, schema='dbo'):
+        key = (schema, referenced_table, referenced_column)
+        with self._lock:
+            values = self._values.get(key)
+            if values is None:
+                values = self._load(referenced_table, referenced_column, schema)
+                self._values[key] = values
+            return values
+
+    # Отмечает родительский столбец, значения которого нужно брать из
+    # сгенерированных в этом запуске строк, а не читать с сервера
+    def track(self, referenced_table, referenced_column, schema='dbo'):
+        self._tracked.add((schema, referenced_table, referenced_column))
+
+    def record_chunk(self, table_name, batch, schema='dbo'):
+        for column_name, values in batch.items():
+            if (schema, table_name, column_name) in self._tracked:
+                self.extend(table_name, column_name, values, schema)
+
+    def extend(self, referenced_table, referenced_column, values, schema='dbo'):
+        key = (schema, referenced_table, referenced_column)
+        with self._lock:
+            buffer = self._values.get(key)
+            if buffer is None:
+                buffer = self._new_buffer(referenced_table, referenced_column, schema)
+                self._values[key] = buffer
+            self._seen[key] = self._reservoir_add(buffer, self._seen.get(key, len(buffer)),
+                                                  (value for value in values if value is not None))
+
+    def choice(self, referenced_table, referenced_column, schema='dbo'):
+        values = self.get_values(referenced_table, referenced_column, schema)
+        if not values:
+            return None
+        return values[self._random.randrange(len(values))]
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+            self._seen.clear()
+
+    # Копия уже загруженных значений для процессов генерации
+    def snapshot(self):
+        with self._lock:
+            return KeySnapshot(dict(self._values))
+
+    def _new_buffer(self, referenced_table, referenced_column, schema):
+        table = self.db_manager.catalog.get_table(referenced_table, schema)
+        if table is not None and table.data_type(referenced_column) in INTEGER_TYPES:
+            return array('q')
+        return []
+
+    def _count_rows(self, cursor, referenced_table, schema):
+        cursor.execute("""
+            SELECT SUM(rows)
+            FROM sys.partitions
+            WHERE object_id = OBJECT_ID(?) AND index_id IN (0, 1)
+        """, (f"{schema}.{referenced_table}",))
+        row = cursor.fetchone()
+        return row[0] if row and row[0] is not None else 0
+
+    def _load(self, referenced_table, referenced_column, schema):
+        with self.db_manager.metrics.stage('fk_load'):
+            return self._read(referenced_table, referenced_column, schema)
+
+    def _read(self, referenced_table, referenced_column, schema):
+        cursor = self.db_manager.conn.cursor()
+        try:
+            values = self._new_buffer(referenced_table, referenced_column, schema)
+            query = f"SELECT [{referenced_column}] FROM [{schema}].[{referenced_table}]"
+            condition = f" WHERE [{referenced_column}] IS NOT NULL"
+
+            total_rows = self._count_rows(cursor, referenced_table, schema)
+            if total_rows > self.sample_limit:
+                # Большая родительская таблица: читаем выборку TABLESAMPLE
+                # и ограничиваем её резервуарной выборкой.
+                percent = min(100, math.ceil(self.sample_limit * 200 / total_rows))
+                cursor.execute(f"{query} TABLESAMPLE ({percent} PERCENT){condition}")
+                seen = self._reservoir_fill(cursor, values)
+                if seen == 0:
+                    cursor.execute(query + condition)
+                    seen = self._reservoir_fill(cursor, values)
+                logging.info(f"Выборка {len(values)} из {seen} значений для внешнего ключа {referenced_column} "
+                             f"из таблицы {schema}.{referenced_table} (всего строк: {total_rows})")
+            else:
+                cursor.execute(query + condition)
+                self._reservoir_fill(cursor, values)
+                logging.info(f"Загружено {len(values)} значений для внешнего ключа {referenced_column} "
+                             f"из таблицы {schema}.{referenced_table}")
+            return values
+        except Exception as e:
+            logging.error(f"Ошибка при получении существующих значений из таблицы {schema}.{referenced_table}: {e}")
+            self.db_manager.show_error("Ошибка", f"Ошибка при получении существующих значений из таблицы {referenced_table}: {e}")
+            return []
+        finally:
+            cursor.close()
+
+    def _reservoir_fill(self, cursor, values):
+        seen = 0
+        while True:
+            rows = cursor.fetchmany(FETCH_BATCH_SIZE)
+            if not rows:
+                break
+            seen = self._reservoir_add(values, seen, (row[0] for row in rows))
+        return seen
+
+    def _reservoir_add(self, values, seen, items):
+        limit = self.sample_limit
+        for item in items:
+            if seen < limit:
+                values.append(item)
+            else:
+                j = self._random.randrange(seen + 1)
+                if j < limit:
+                    values[j] = item
+            seen += 1
+        return seen
+
+
+# Неизменяемый пул значений без соединения и блокировок; передаётся в другие
+# процессы вместе с генератором. Читает только то, что было загружено заранее.
+class KeySnapshot:
+    def __init__(self, values):
+        self._values = values
+
+    def get_values(self, referenced_table, referenced_column, schema='dbo'):
+        return self._values.get((schema, referenced_table, referenced_column), [])
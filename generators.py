@@ -0,0 +1,264 @@
+# generators.py
+
+import datetime
+import decimal
+import hashlib
+import logging
+import re
+import secrets
+import uuid
+
+import numpy as np
+
+from record_batch import RecordBatch
+from schema import TEXT_TYPES, INTEGER_TYPES, FLOAT_TYPES, DATETIME_TYPES
+from vocabulary import get_names, get_vocabulary
+
+DATE_RANGE_DAYS = 30 * 365
+INTEGER_RANGES = {
+    'TINYINT': (0, 255),
+    'SMALLINT': (1, 32767),
+    'INT': (1, 1000000),
+    'BIGINT': (1, 1000000),
+}
+BINARY_LENGTH = 16
+# MONEY и SMALLMONEY хранят 4 знака после запятой
+MONEY_SCALE = 4
+MONEY_MAX = 1000
+MICROSECONDS_PER_DAY = 86400 * 10 ** 6
+# Смещения DATETIMEOFFSET: от -12:00 до +14:00 с шагом 15 минут
+OFFSET_STEP_MINUTES = 15
+OFFSET_RANGE = (-12 * 60 // OFFSET_STEP_MINUTES, 14 * 60 // OFFSET_STEP_MINUTES)
+# Типы, которые заполняются словами словаря
+CHARACTER_TYPES = TEXT_TYPES + ('NTEXT', 'XML')
+# Столбцы с именами людей по названию столбца: имя, фамилия или «Фамилия Имя»
+NAME_COLUMN_PATTERNS = (
+    ('first', re.compile(r'(first|given)_?name|^имя$', re.IGNORECASE)),
+    ('last', re.compile(r'(last|family|sur)_?name|фамилия', re.IGNORECASE)),
+    ('full', re.compile(r'full_?name|^fio$|фио|(person|contact|customer|employee|client)_?name', re.IGNORECASE)),
+)
+# Строки таблицы делятся на блоки; случайный поток блока зависит только от
+# (seed, таблица, столбец, номер блока), поэтому любую часть строк можно
+# сгенерировать отдельно и получить те же значения, что и при полном проходе.
+BLOCK_SIZE = 1000
+
+
+def new_seed():
+    return secrets.randbits(63)
+
+
+def stream_key(seed, *parts):
+    digest = hashlib.blake2b(repr((seed,) + parts).encode('utf-8'), digest_size=16).digest()
+    return int.from_bytes(digest, 'little')
+
+
+def block_rng(key, block):
+    # Счётчик Philox: номер блока в старшем слове, младшее слово — позиция внутри блока
+    return np.random.Generator(np.random.Philox(key=key, counter=block << 64))
+
+
+def draw_rows(key, row_offset, n, draw):
+    # Значения строк [row_offset, row_offset + n) из блоков, которые они затрагивают
+    parts = []
+    row_stop = row_offset + n
+    for block in range(row_offset // BLOCK_SIZE, (row_stop - 1) // BLOCK_SIZE + 1):
+        block_start = block * BLOCK_SIZE
+        values = draw(block_rng(key, block), BLOCK_SIZE)
+        parts.append(values[max(row_offset, block_start) - block_start:min(row_stop, block_start + BLOCK_SIZE) - block_start])
+    return parts[0] if len(parts) == 1 else np.concatenate(parts)
+
+
+def _sorted_pool(values):
+    # Порядок значений в пуле зависит от порядка строк на сервере; после
+    # сортировки выбор по номеру строки воспроизводим.
+    if isinstance(values, list):
+        try:
+            return np.array(sorted(values), dtype=object)
+        except TypeError:
+            return np.array(values, dtype=object)
+    return np.sort(np.frombuffer(values, dtype=np.int64))
+
+
+def _time_of_day(microseconds):
+    seconds, microsecond = divmod(microseconds, 10 ** 6)
+    return datetime.time(seconds // 3600, seconds % 3600 // 60, seconds % 60, microsecond)
+
+
+def _with_offset(start, seconds, offset):
+    tz = datetime.timezone(datetime.timedelta(minutes=offset * OFFSET_STEP_MINUTES))
+    return (start + datetime.timedelta(seconds=seconds)).replace(tzinfo=tz)
+
+
+def _split_bytes(raw, size):
+    return [raw[i:i + size] for i in range(0, len(raw), size)]
+
+
+# Генерирует данные целыми столбцами: для каждого столбца один раз выбирается
+# функция, которая за вызов возвращает список из n значений. Строка i таблицы
+# определяется только seed, таблицей и i (при тех же данных родительских таблиц),
+# поэтому запуск с тем же seed и датой отсчёта повторяет данные в точности.
+# С профилем данных (data_profile.TableProfile) обычные столбцы повторяют
+# распределения, снятые с существующей таблицы.
+class ColumnarGenerator:
+    def __init__(self, table, fk_pool, unique_values=None, seed=None, null_columns=(), reference_date=None,
+                 profile=None):
+        self.table = table
+        self.null_columns = set(null_columns)
+        self.fk_pool = fk_pool
+        self.unique_values = unique_values
+        self.profile = profile
+        self.seed = new_seed() if seed is None else seed
+        self.reference_date = reference_date or datetime.date.today()
+        self.vocabulary = get_vocabulary()
+        self.columns = table.insertable_columns
+        self.column_names = [column.name for column in self.columns]
+        # Столбцы составных уникальных ключей из внешних ключей заполняются вместе
+        self.key_groups = table.composite_fk_keys if unique_values is not None else []
+        self._key_columns = {column_name for key in self.key_groups for column_name in key.columns}
+        self._generators = [self._column_generator(column) for column in self.columns]
+        logging.info(f"Генератор таблицы {table.schema}.{table.name}: seed={self.seed}, "
+                     f"дата отсчёта={self.reference_date.isoformat()}"
+                     + (f", профиль данных от {profile.created}" if profile is not None else ""))
+
+    def generate(self, n, row_offset=0):
+        key_data = {}
+        for key in self.key_groups:
+            key_rows = self.unique_values.key_values(key.name, row_offset, n)
+            for column_name, values in zip(key.columns, zip(*key_rows)):
+                key_data[column_name] = list(values)
+        return RecordBatch(self.column_names, [key_data[column.name] if generate is None else generate(n, row_offset)
+                                               for column, generate in zip(self.columns, self._generators)])
+
+    def _key(self, column_name, *parts):
+        return stream_key(self.seed, self.table.schema, self.table.name, column_name, *parts)
+
+    def _column_generator(self, column):
+        if column.name in self._key_columns:
+            return None
+        if column.name in self.null_columns:
+            # Отложенные внешние ключи заполняются позже отдельным UPDATE
+            return lambda n, row_offset: [None] * n
+        fk = self.table.fk_columns.get(column.name)
+        if fk is not None:
+            return self._foreign_key_generator(fk, self._key(column.name))
+        if column.name in self.table.unique_column_names and self.unique_values is not None:
+            return self._unique_generator(column)
+        generate = self._value_generator(column)
+        column_profile = self.profile.column(column.name) if self.profile is not None else None
+        if column_profile is not None:
+            return column_profile.sampler(column, self._key(column.name, 'profile'), self.vocabulary, generate)
+        return generate
+
+    def _foreign_key_generator(self, fk, key):
+        values = self.fk_pool.get_values(fk.referenced_table, fk.referenced_column, self.table.schema)
+        if not values:
+            raise ValueError(f"Нет существующих значений для внешнего ключа {fk.column} в таблице {fk.referenced_table}.")
+        # Копия, а не представление: пул может пополняться, пока генератор жив
+        values = _sorted_pool(values)
+        size = len(values)
+        return lambda n, row_offset: values[draw_rows(key, row_offset, n,
+                                                      lambda rng, count: rng.integers(0, size, count))].tolist()
+
+    def _unique_generator(self, column):
+        column_name = column.name
+        if column.data_type in TEXT_TYPES:
+            key = self._key(column_name)
+            return lambda n, row_offset: self.unique_values.values(
+                column_name, row_offset, n, self._draw_words(self.vocabulary, key, n, row_offset))
+        return lambda n, row_offset: self.unique_values.values(column_name, row_offset, n)
+
+    def _value_generator(self, column):
+        data_type = column.data_type
+        key = self._key(column.name)
+        if data_type in INTEGER_TYPES:
+            low, high = INTEGER_RANGES[data_type]
+            return lambda n, row_offset: draw_rows(
+                key, row_offset, n, lambda rng, count: rng.integers(low, high, count, endpoint=True)).tolist()
+        if data_type in FLOAT_TYPES:
+            return lambda n, row_offset: draw_rows(
+                key, row_offset, n, lambda rng, count: np.round(rng.uniform(1.0, 1000.0, count), 2)).tolist()
+        if data_type == 'BIT':
+            return lambda n, row_offset: draw_rows(
+                key, row_offset, n, lambda rng, count: rng.integers(0, 2, count)).tolist()
+        if data_type == 'DATE':
+            start = np.datetime64(self.reference_date - datetime.timedelta(days=DATE_RANGE_DAYS), 'D')
+            return lambda n, row_offset: (start + draw_rows(
+                key, row_offset, n, lambda rng, count: rng.integers(0, DATE_RANGE_DAYS, count, endpoint=True))).tolist()
+        if data_type in DATETIME_TYPES:
+            reference = datetime.datetime.combine(self.reference_date, datetime.time())
+            start = np.datetime64(reference - datetime.timedelta(days=DATE_RANGE_DAYS), 's')
+            span = DATE_RANGE_DAYS * 86400
+            return lambda n, row_offset: (start + draw_rows(
+                key, row_offset, n, lambda rng, count: rng.integers(0, span, count, endpoint=True))).tolist()
+        if data_type == 'UNIQUEIDENTIFIER':
+            return lambda n, row_offset: [str(uuid.UUID(bytes=raw, version=4))
+                                          for raw in _split_bytes(self._draw_bytes(key, 16, n, row_offset), 16)]
+        if data_type in ('BINARY', 'VARBINARY', 'IMAGE'):
+            length = min(BINARY_LENGTH, column.max_length) if column.max_length and column.max_length > 0 \
+                else BINARY_LENGTH
+            return lambda n, row_offset: _split_bytes(self._draw_bytes(key, length, n, row_offset), length)
+        if data_type in ('MONEY', 'SMALLMONEY'):
+            return lambda n, row_offset: [decimal.Decimal(value).scaleb(-MONEY_SCALE) for value in draw_rows(
+                key, row_offset, n,
+                lambda rng, count: rng.integers(0, MONEY_MAX * 10 ** MONEY_SCALE, count, endpoint=True)).tolist()]
+        if data_type == 'TIME':
+            return lambda n, row_offset: [_time_of_day(value) for value in draw_rows(
+                key, row_offset, n, lambda rng, count: rng.integers(0, MICROSECONDS_PER_DAY, count)).tolist()]
+        if data_type == 'DATETIMEOFFSET':
+            reference = datetime.datetime.combine(self.reference_date, datetime.time())
+            start = reference - datetime.timedelta(days=DATE_RANGE_DAYS)
+            span = DATE_RANGE_DAYS * 86400
+            # Секунды от начала диапазона и смещение часового пояса из одного потока строки
+            return lambda n, row_offset: [_with_offset(start, seconds, offset) for seconds, offset in draw_rows(
+                key, row_offset, n, lambda rng, count: rng.integers(
+                    (0, OFFSET_RANGE[0]), (span, OFFSET_RANGE[1]), (count, 2), endpoint=True)).tolist()]
+        if data_type not in CHARACTER_TYPES:
+            if column.is_nullable:
+                logging.warning(f"Тип {data_type} столбца {self.table.schema}.{self.table.name}.{column.name} "
+                                f"не поддерживается генератором, столбец заполняется NULL")
+                return lambda n, row_offset: [None] * n
+            raise ValueError(f"Тип {data_type} столбца {column.name} не поддерживается генератором")
+
+        name_kind = next((kind for kind, pattern in NAME_COLUMN_PATTERNS if pattern.search(column.name)), None)
+        if name_kind is not None and data_type in TEXT_TYPES:
+            return self._name_generator(name_kind, key, column.max_length)
+
+        # Строки берутся из словаря, заранее обрезанного под длину столбца
+        vocabulary = self.vocabulary
+        if column.max_length and column.max_length > 0:
+            vocabulary = np.array([word[:column.max_length] for word in vocabulary], dtype=object)
+        return lambda n, row_offset: self._draw_words(vocabulary, key, n, row_offset)
+
+    def _name_generator(self, kind, key, max_length):
+        names = get_names()
+        if kind != 'full':
+            vocabulary = np.concatenate([names[f"{kind}_names_male"], names[f"{kind}_names_female"]])
+            if max_length and max_length > 0:
+                vocabulary = np.array([name[:max_length] for name in vocabulary], dtype=object)
+            return lambda n, row_offset: self._draw_words(vocabulary, key, n, row_offset)
+
+        pools = [(names['last_names_male'], names['first_names_male']),
+                 (names['last_names_female'], names['first_names_female'])]
+
+        # Пол, фамилия и имя берутся из одного потока строки, чтобы они согласовывались
+        def generate(n, row_offset):
+            draws = draw_rows(key, row_offset, n, lambda rng, count: rng.integers(0, 2 ** 31, (count, 3)))
+            female = draws[:, 0] % 2 == 1
+            full_names = np.empty(n, dtype=object)
+            for is_female, (last_names, first_names) in zip((False, True), pools):
+                rows = draws[female == is_female]
+                full_names[female == is_female] = (last_names[rows[:, 1] % len(last_names)] + ' '
+                                                   + first_names[rows[:, 2] % len(first_names)])
+            if max_length and max_length > 0:
+                return [name[:max_length] for name in full_names.tolist()]
+            return full_names.tolist()
+        return generate
+
+    def _draw_words(self, vocabulary, key, n, row_offset):
+        size = len(vocabulary)
+        return vocabulary[draw_rows(key, row_offset, n, lambda rng, count: rng.integers(0, size, count))].tolist()
+
+    def _draw_bytes(self, key, length, n, row_offset):
+        def draw(rng, count):
+            return np.frombuffer(rng.bytes(length * count), dtype=np.uint8).reshape(count, length)
+        return draw_rows(key, row_offset, n, draw).tobytes()
@@ -1,27 +1,52 @@
 # gui.py
 
+import datetime
 import tkinter as tk
-from tkinter import ttk
+from tkinter import ttk, filedialog
 import tkinter.messagebox as messagebox
-from database import DatabaseManager
-from faker import Faker
+from database import DatabaseManager, MAX_RECORDS
+from vocabulary import prewarm
 import logging
+import os
+import queue
+import threading
 
-fake = Faker('ru_RU')
-MAX_RECORDS = 1000
+POLL_INTERVAL_MS = 100
+# Профилирование фоновых заполнений: cprofile или tracemalloc
+PROFILE_ENV = 'DATA_GENERATOR_PROFILE'
+MAX_CONNECTIONS = 16
 
 
 class Application:
     def __init__(self):
-        self.db_manager = DatabaseManager()
+        self.db_manager = DatabaseManager(error_callback=self.show_error, info_callback=self.show_info)
+        self.db_manager.profile_mode = os.environ.get(PROFILE_ENV) or None
+        self.events = queue.Queue()
+        self.worker = None
         self.root = tk.Tk()
         self.root.title("SQL Server Data Generator")
         self.current_frame = None
         self.create_connection_frame()
+        # Генераторы, numpy и Faker импортируются при первом использовании, а
+        # словарь загружается в фоне уже после того, как окно показано
+        self.root.after_idle(prewarm)
 
     def run(self):
         self.root.mainloop()
 
+    def show_error(self, title, message):
+        # Ошибки из фонового потока показываются главным потоком Tk
+        if threading.current_thread() is threading.main_thread():
+            messagebox.showerror(title, message)
+        else:
+            self.events.put(('error', (title, message)))
+
+    def show_info(self, title, message):
+        if threading.current_thread() is threading.main_thread():
+            messagebox.showinfo(title, message)
+        else:
+            self.events.put(('info', (title, message)))
+
     def create_connection_frame(self):
         if self.current_frame:
             self.current_frame.destroy()
@@ -144,59 +169,413 @@ class Application:
         tk.Label(self.current_frame, text=f"Максимально допустимое количество записей: {MAX_RECORDS}",
                  foreground='red').pack(pady=5)
 
-        tk.Button(self.current_frame, text="Генерировать и Вставить", command=self.generate_and_insert).pack(pady=10)
-        tk.Button(self.current_frame, text="Назад", command=self.create_database_selection_frame).pack(pady=5)
+        tk.Label(self.current_frame, text="Параллельных соединений:").pack(pady=5)
+        self.connections_spinbox = tk.Spinbox(self.current_frame, from_=1, to=MAX_CONNECTIONS, width=5)
+        self.connections_spinbox.pack(pady=5)
+
+        from process_pool import GENERATION_PROCESSES
+        tk.Label(self.current_frame, text="Процессов генерации:").pack(pady=5)
+        self.processes_spinbox = tk.Spinbox(self.current_frame, from_=1, to=GENERATION_PROCESSES, width=5)
+        self.processes_spinbox.pack(pady=5)
+
+        # С тем же seed и датой отсчёта набор данных повторяется в точности
+        tk.Label(self.current_frame, text="Seed (пусто — случайный):").pack(pady=5)
+        self.seed_entry = tk.Entry(self.current_frame)
+        self.seed_entry.pack(pady=5)
+        tk.Label(self.current_frame, text="Дата отсчёта ГГГГ-ММ-ДД (пусто — сегодня):").pack(pady=5)
+        self.reference_date_entry = tk.Entry(self.current_frame)
+        self.reference_date_entry.pack(pady=5)
+
+        # TABLOCK, отключение неуникальных индексов и проверок ограничений на время заполнения
+        self.fast_load_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(self.current_frame, text="Быстрая загрузка (индексы и ограничения после вставки)",
+                       variable=self.fast_load_var).pack(pady=5)
+        self.use_profile_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(self.current_frame, text="Генерировать по профилю данных таблицы",
+                       variable=self.use_profile_var).pack(pady=5)
+
+        self.generate_button = tk.Button(self.current_frame, text="Генерировать и Вставить",
+                                         command=self.generate_and_insert)
+        self.generate_button.pack(pady=10)
+        self.cancel_button = tk.Button(self.current_frame, text="Отменить", command=self.cancel_fill,
+                                       state='disabled')
+        self.cancel_button.pack(pady=5)
+        self.export_button = tk.Button(self.current_frame, text="Экспорт в SQL-скрипт",
+                                       command=self.generate_and_export)
+        self.export_button.pack(pady=5)
+        self.bulk_button = tk.Button(self.current_frame, text="Массовая загрузка (BULK INSERT)",
+                                     command=self.generate_and_bulk_load)
+        self.bulk_button.pack(pady=5)
+        self.profile_button = tk.Button(self.current_frame, text="Снять профиль данных",
+                                        command=self.profile_selected_table)
+        self.profile_button.pack(pady=5)
+        self.fill_database_button = tk.Button(self.current_frame, text="Заполнить всю базу данных",
+                                              command=lambda: self.open_database_fill_dialog(tables))
+        self.fill_database_button.pack(pady=5)
+        self.back_button = tk.Button(self.current_frame, text="Назад", command=self.create_database_selection_frame)
+        self.back_button.pack(pady=5)
         tk.Button(self.current_frame, text="Выйти", command=self.exit_app).pack(pady=5)
 
+        self.progress_bar = ttk.Progressbar(self.current_frame, length=400, maximum=100)
+        self.progress_bar.pack(pady=5)
+        self.progress_label = tk.Label(self.current_frame, text="")
+        self.progress_label.pack(pady=5)
+
         tk.Label(self.current_frame, text="Лог:").pack(pady=5)
         self.log_text = tk.Text(self.current_frame, height=10)
         self.log_text.pack(pady=5)
 
-    def generate_and_insert(self):
+    def read_generation_params(self):
         table = self.table_combo.get()
         num_records = self.num_records_entry.get()
 
         if not table:
             messagebox.showerror("Ошибка", "Пожалуйста, выберите таблицу.")
-            return
+            return None
 
         if not num_records:
             messagebox.showerror("Ошибка", "Пожалуйста, введите количество записей.")
-            return
+            return None
 
         try:
             num = int(num_records)
             if num <= 0:
                 messagebox.showerror("Ошибка", "Количество записей должно быть положительным числом.")
-                return
+                return None
             if num > MAX_RECORDS:
                 messagebox.showerror("Ошибка", f"Максимально допустимое количество записей: {MAX_RECORDS}.")
-                return
+                return None
         except ValueError:
             messagebox.showerror("Ошибка", "Пожалуйста, введите корректное числовое значение для количества записей.")
+            return None
+
+        return table, num
+
+    def read_connections(self):
+        try:
+            connections = int(self.connections_spinbox.get())
+        except ValueError:
+            return 1
+        return max(1, min(connections, MAX_CONNECTIONS))
+
+    def read_processes(self):
+        from process_pool import GENERATION_PROCESSES
+        try:
+            processes = int(self.processes_spinbox.get())
+        except ValueError:
+            return 1
+        return max(1, min(processes, GENERATION_PROCESSES))
+
+    # Seed и дата отсчёта генерации; пустые поля заполняются случайным seed и
+    # сегодняшней датой. Значения пишутся в лог окна, чтобы набор данных
+    # можно было повторить. None — введены некорректные значения.
+    def read_generation_options(self, seed=None):
+        from generators import new_seed
+        seed_text = self.seed_entry.get().strip()
+        date_text = self.reference_date_entry.get().strip()
+        try:
+            if seed is None:
+                seed = int(seed_text) if seed_text else new_seed()
+        except ValueError:
+            messagebox.showerror("Ошибка", "Seed должен быть целым числом.")
+            return None
+        try:
+            reference_date = datetime.date.fromisoformat(date_text) if date_text else datetime.date.today()
+        except ValueError:
+            messagebox.showerror("Ошибка", "Дата отсчёта должна быть в формате ГГГГ-ММ-ДД.")
+            return None
+        self.write_log(f"Seed: {seed}, дата отсчёта: {reference_date.isoformat()} — введите их, "
+                       f"чтобы повторить этот набор данных.")
+        return {'seed': seed, 'reference_date': reference_date}
+
+    # Профиль данных таблицы, если включена генерация по профилю; False — профиль
+    # нужен, но не найден
+    def read_profile(self, table):
+        if not self.use_profile_var.get():
+            return None
+        from data_profile import TableProfile
+        profile = TableProfile.for_table(self.db_manager.database, 'dbo', table)
+        if profile is None:
+            messagebox.showerror("Ошибка", f"Профиль данных таблицы '{table}' не найден. Сначала снимите профиль.")
+            return False
+        return profile
+
+    def profile_selected_table(self):
+        table = self.table_combo.get()
+        if not table:
+            messagebox.showerror("Ошибка", "Пожалуйста, выберите таблицу.")
+            return
+        from worker import ProfileWorker
+        self.write_log(f"Начато профилирование таблицы '{table}'...")
+        self.start_worker(ProfileWorker(self.db_manager, table, self.events, schema='dbo'))
+
+    def generate_and_insert(self):
+        params = self.read_generation_params()
+        if params is None:
+            return
+        table, num = params
+        profile = self.read_profile(table)
+        if profile is False:
+            return
+        from pipeline import Checkpoint
+        from worker import FillWorker
+
+        connections = self.read_connections()
+        processes = self.read_processes()
+        if connections > 1 and processes > 1:
+            # Как в консольном режиме: процессы генерации работают только с одним соединением
+            messagebox.showerror("Ошибка", "Процессы генерации поддерживаются только при одном соединении. "
+                                           "Укажите 1 соединение или 1 процесс.")
+            return
+        if connections > 1:
+            options = self.read_generation_options()
+            if options is None:
+                return
+            self.write_log(f"Начата генерация {num} записей для таблицы '{table}' через {connections} соединений...")
+            self.start_worker(FillWorker(self.db_manager, table, num, self.events, schema='dbo',
+                                         connections=connections, fast_load=self.fast_load_var.get(),
+                                         profile=profile, **options))
+            return
+
+        checkpoint = Checkpoint.for_table(self.db_manager.database, 'dbo', table, num)
+        if checkpoint.processed:
+            resume = messagebox.askyesno(
+                "Продолжить?",
+                f"Предыдущее заполнение таблицы '{table}' прервано после обработки {checkpoint.processed} из {num} "
+                f"записей (вставленные и пропущенные из-за ошибок строки). Продолжить с этого места?")
+            if not resume:
+                checkpoint.processed = 0
+        # Продолжение использует seed прерванного заполнения, иначе дописанные строки будут другими
+        options = self.read_generation_options(checkpoint.seed if checkpoint.processed else None)
+        if options is None:
             return
 
-        self.log_text.insert(tk.END, f"Начата генерация {num} записей для таблицы '{table}'...\n")
+        self.write_log(f"Начата генерация {checkpoint.remaining} записей для таблицы '{table}'"
+                       + (f" в {processes} процессах..." if processes > 1 else "..."))
+
+        self.start_worker(FillWorker(self.db_manager, table, num, self.events, schema='dbo', checkpoint=checkpoint,
+                                     processes=processes, fast_load=self.fast_load_var.get(), profile=profile,
+                                     **options))
+
+    def start_worker(self, worker):
+        self.worker = worker
+        self.set_running(True)
+        self.worker.start()
+        self.root.after(POLL_INTERVAL_MS, self.poll_events)
+
+    def cancel_fill(self):
+        if self.worker and self.worker.is_alive():
+            self.worker.cancel()
+            self.cancel_button.config(state='disabled')
+            self.write_log("Отмена... текущая порция будет откатана.")
+
+    def set_running(self, running):
+        state = 'disabled' if running else 'normal'
+        self.generate_button.config(state=state)
+        self.export_button.config(state=state)
+        self.bulk_button.config(state=state)
+        self.profile_button.config(state=state)
+        self.fill_database_button.config(state=state)
+        self.back_button.config(state=state)
+        self.cancel_button.config(state='normal' if running else 'disabled')
+        if running:
+            self.progress_bar['value'] = 0
+            self.progress_label.config(text="")
+
+    def poll_events(self):
+        while True:
+            try:
+                kind, payload = self.events.get_nowait()
+            except queue.Empty:
+                break
+            self.handle_event(kind, payload)
+
+        if self.worker is not None:
+            self.root.after(POLL_INTERVAL_MS, self.poll_events)
+
+    def handle_event(self, kind, payload):
+        table = self.worker.table_name if self.worker else ''
+        if kind == 'progress':
+            self.show_progress(payload)
+        elif kind == 'plan':
+            self.write_log(f"План заполнения:\n{payload}")
+        elif kind == 'metrics':
+            self.write_log(f"Метрики:\n{payload}")
+        elif kind == 'error':
+            messagebox.showerror(*payload)
+        elif kind == 'info':
+            messagebox.showinfo(*payload)
+        elif kind == 'done':
+            self.finish_worker()
+            self.write_log(f"Завершена генерация и вставка данных для таблицы '{table}'.")
+            messagebox.showinfo("Успех", f"Успешно вставлено {payload} записей.")
+        elif kind == 'exported':
+            exported, file_path = payload
+            self.finish_worker()
+            self.write_log(f"SQL-скрипт для таблицы '{table}' ({exported} записей) сохранён в {file_path}.")
+        elif kind == 'profiled':
+            sampled_rows, rows, path = payload
+            self.finish_worker()
+            self.write_log(f"Профиль данных таблицы '{table}' ({sampled_rows} из {rows} строк) сохранён в {path}.")
+        elif kind == 'cancelled':
+            self.finish_worker()
+            self.write_log(f"Заполнение таблицы '{table}' отменено, зафиксировано {payload} записей.")
+        elif kind == 'failed':
+            self.finish_worker()
+            self.write_log(f"Заполнение таблицы '{table}' прервано: {payload}")
+            messagebox.showerror("Ошибка", f"Ошибка при заполнении таблицы: {payload}")
+
+    def finish_worker(self):
+        self.worker = None
+        self.set_running(False)
+
+    def show_progress(self, progress):
+        total = progress['total']
+        self.progress_bar['value'] = progress['inserted'] * 100 / total if total else 0
+        eta = progress['eta']
+        eta_text = f"{int(eta // 60)} мин {int(eta % 60)} с" if eta is not None else "—"
+        table_prefix = f"{progress['table']}: " if 'table' in progress else ""
+        self.progress_label.config(
+            text=f"{table_prefix}Сгенерировано: {progress['generated']}  Вставлено: {progress['inserted']} из {total}  "
+                 f"Скорость: {progress['rows_per_sec']:.0f} записей/с  Осталось: {eta_text}")
+
+    def write_log(self, message):
+        self.log_text.insert(tk.END, message + "\n")
         self.log_text.see(tk.END)
 
-        records = self.db_manager.generate_records(table, num, schema='dbo')
-        if not records:
-            self.log_text.insert(tk.END, f"Нет данных для вставки в таблицу '{table}'.\n")
-            self.log_text.see(tk.END)
+    def generate_and_export(self):
+        params = self.read_generation_params()
+        if params is None:
+            return
+        table, num = params
+        profile = self.read_profile(table)
+        if profile is False:
             return
 
-        queries = self.db_manager.generate_insert_queries(table, records, schema='dbo')
-        if not queries:
-            self.log_text.insert(tk.END, f"Нет запросов для выполнения для таблицы '{table}'.\n")
-            self.log_text.see(tk.END)
+        file_path = filedialog.asksaveasfilename(defaultextension='.sql', initialfile=f"{table}.sql",
+                                                 filetypes=[('SQL-скрипт', '*.sql'), ('Сжатый SQL-скрипт', '*.sql.gz'),
+                                                            ('Все файлы', '*.*')])
+        if not file_path:
             return
 
-        self.db_manager.execute_queries(queries)
-        fake.unique.clear()
+        options = self.read_generation_options()
+        if options is None:
+            return
+        from worker import ExportWorker
+        self.write_log(f"Начат экспорт {num} записей для таблицы '{table}' в {file_path}...")
+        self.start_worker(ExportWorker(self.db_manager, table, num, file_path, self.events, schema='dbo',
+                                       profile=profile, **options))
+
+    def generate_and_bulk_load(self):
+        params = self.read_generation_params()
+        if params is None:
+            return
+        table, num = params
+        profile = self.read_profile(table)
+        if profile is False:
+            return
 
-        self.log_text.insert(tk.END, f"Завершена генерация и вставка данных для таблицы '{table}'.\n")
-        self.log_text.see(tk.END)
+        data_path = filedialog.asksaveasfilename(
+            title="Файл данных (должен быть доступен службе SQL Server)", defaultextension='.tsv',
+            initialfile=f"{table}.tsv", filetypes=[('Файл данных', '*.tsv'), ('Все файлы', '*.*')])
+        if not data_path:
+            return
+
+        options = self.read_generation_options()
+        if options is None:
+            return
+        from worker import BulkLoadWorker
+        self.write_log(f"Начата выгрузка {num} записей для таблицы '{table}' в {data_path} и загрузка BULK INSERT...")
+        self.start_worker(BulkLoadWorker(self.db_manager, table, num, data_path, self.events, schema='dbo',
+                                         fast_load=self.fast_load_var.get(), profile=profile, **options))
+
+    def open_database_fill_dialog(self, tables):
+        dialog = tk.Toplevel(self.root)
+        dialog.title("Заполнение всей базы данных")
+        dialog.transient(self.root)
+
+        tk.Label(dialog, text="Количество записей для каждой таблицы (0 — не заполнять):").pack(pady=5)
+
+        all_frame = tk.Frame(dialog)
+        all_frame.pack(pady=5)
+        tk.Label(all_frame, text="Для всех:").pack(side='left')
+        all_entry = tk.Entry(all_frame, width=10)
+        all_entry.pack(side='left', padx=5)
+
+        list_frame = tk.Frame(dialog)
+        list_frame.pack(fill='both', expand=True, padx=5)
+        canvas = tk.Canvas(list_frame, height=300)
+        scrollbar = tk.Scrollbar(list_frame, orient='vertical', command=canvas.yview)
+        tables_frame = tk.Frame(canvas)
+        tables_frame.bind('<Configure>', lambda event: canvas.configure(scrollregion=canvas.bbox('all')))
+        canvas.create_window((0, 0), window=tables_frame, anchor='nw')
+        canvas.configure(yscrollcommand=scrollbar.set)
+        canvas.pack(side='left', fill='both', expand=True)
+        scrollbar.pack(side='left', fill='y')
+
+        entries = {}
+        for row, table in enumerate(tables):
+            tk.Label(tables_frame, text=table).grid(row=row, column=0, sticky='w', padx=5)
+            entry = tk.Entry(tables_frame, width=10)
+            entry.insert(0, '0')
+            entry.grid(row=row, column=1, padx=5)
+            entries[table] = entry
+
+        def apply_to_all():
+            for entry in entries.values():
+                entry.delete(0, tk.END)
+                entry.insert(0, all_entry.get())
+
+        tk.Button(all_frame, text="Применить", command=apply_to_all).pack(side='left')
+
+        def start():
+            row_counts = {}
+            for table, entry in entries.items():
+                try:
+                    count = int(entry.get() or 0)
+                except ValueError:
+                    messagebox.showerror("Ошибка", f"Некорректное количество записей для таблицы '{table}'.",
+                                         parent=dialog)
+                    return
+                if count < 0 or count > MAX_RECORDS:
+                    messagebox.showerror("Ошибка", f"Количество записей для таблицы '{table}' должно быть "
+                                                   f"от 0 до {MAX_RECORDS}.", parent=dialog)
+                    return
+                row_counts[table] = count
+            if not any(row_counts.values()):
+                messagebox.showerror("Ошибка", "Укажите количество записей хотя бы для одной таблицы.", parent=dialog)
+                return
+            if self.read_processes() > 1:
+                messagebox.showerror("Ошибка", "Процессы генерации поддерживаются только для одной таблицы. "
+                                               "Укажите 1 процесс.", parent=dialog)
+                return
+            options = self.read_generation_options()
+            if options is None:
+                return
+            dialog.destroy()
+            from data_profile import TableProfile
+            from worker import DatabaseFillWorker
+            profiles = {}
+            if self.use_profile_var.get():
+                # Таблицы без профиля заполняются встроенными распределениями
+                for table, count in row_counts.items():
+                    profile = TableProfile.for_table(self.db_manager.database, 'dbo', table) if count else None
+                    if profile is not None:
+                        profiles[table] = profile
+                self.write_log(f"Профили данных найдены для таблиц: {', '.join(profiles) or 'нет'}")
+            self.write_log(f"Начато заполнение базы данных: {sum(row_counts.values())} записей "
+                           f"в {sum(1 for count in row_counts.values() if count)} таблиц...")
+            self.start_worker(DatabaseFillWorker(self.db_manager, row_counts, self.events, schema='dbo',
+                                                 connections=self.read_connections(),
+                                                 fast_load=self.fast_load_var.get(), profiles=profiles,
+                                                 **options))
+
+        tk.Button(dialog, text="Запустить", command=start).pack(pady=10)
+        tk.Button(dialog, text="Отмена", command=dialog.destroy).pack(pady=5)
 
     def exit_app(self):
+        if self.worker is not None:
+            self.worker.cancel()
+            self.worker.join()
         self.db_manager.close_connection()
         self.root.destroy()
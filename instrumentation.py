@@ -0,0 +1,216 @@
+# instrumentation.py
+
+import contextlib
+import cProfile
+import datetime
+import io
+import json
+import logging
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+
+# Этапы заполнения в порядке их выполнения
+STAGES = ('schema', 'fk_load', 'generate', 'serialize', 'insert')
+STAGE_NAMES = {
+    'schema': "чтение схемы",
+    'fk_load': "загрузка внешних ключей",
+    'generate': "генерация значений",
+    'serialize': "подготовка строк",
+    'insert': "вставка",
+}
+PROFILE_MODES = ('cprofile', 'tracemalloc')
+PROFILE_DIR = 'profiles'
+PROFILE_TOP = 25
+
+
+# Метрики одного запуска: время по этапам, обмены с сервером и скорость вставки
+# по порциям. Один объект разделяется всеми соединениями запуска, поэтому время
+# этапов суммируется по потокам и при параллельной загрузке может превышать
+# общее время.
+class Instrumentation:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started_at = time.monotonic()
+            self.stage_seconds = {stage: 0.0 for stage in STAGES}
+            self.stage_calls = {stage: 0 for stage in STAGES}
+            self.round_trips = 0
+            self.round_trips_by_kind = {}
+            self.batches = 0
+            self.rows = 0
+            self.batch_rate_min = None
+            self.batch_rate_max = None
+            self.last_batch_rate = None
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_stage(name, time.perf_counter() - started_at)
+
+    def add_stage(self, name, seconds):
+        with self._lock:
+            self.stage_seconds[name] = self.stage_seconds.get(name, 0.0) + seconds
+            self.stage_calls[name] = self.stage_calls.get(name, 0) + 1
+
+    def count_round_trip(self, kind):
+        with self._lock:
+            self.round_trips += 1
+            self.round_trips_by_kind[kind] = self.round_trips_by_kind.get(kind, 0) + 1
+
+    def record_batch(self, rows, seconds):
+        rate = rows / seconds if seconds > 0 else None
+        with self._lock:
+            self.batches += 1
+            self.rows += rows
+            if rate is not None:
+                self.last_batch_rate = rate
+                self.batch_rate_min = rate if self.batch_rate_min is None else min(self.batch_rate_min, rate)
+                self.batch_rate_max = rate if self.batch_rate_max is None else max(self.batch_rate_max, rate)
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self.started_at
+
+    def to_record(self):
+        with self._lock:
+            elapsed = self.elapsed
+            return {
+                'elapsed': round(elapsed, 4),
+                'rows': self.rows,
+                'rows_per_sec': round(self.rows / elapsed, 1) if elapsed > 0 else 0.0,
+                'batches': self.batches,
+                'batch_rows_per_sec': {'min': self.batch_rate_min, 'max': self.batch_rate_max,
+                                       'last': self.last_batch_rate},
+                'round_trips': self.round_trips,
+                'round_trips_by_kind': dict(self.round_trips_by_kind),
+                'stages': {stage: round(seconds, 4) for stage, seconds in self.stage_seconds.items()},
+                'stage_calls': dict(self.stage_calls),
+            }
+
+    def summary(self):
+        record = self.to_record()
+        lines = [f"Вставлено {record['rows']} записей за {record['elapsed']:.1f} с "
+                 f"({record['rows_per_sec']:.0f} записей/с), порций: {record['batches']}, "
+                 f"обменов с сервером: {record['round_trips']}"]
+        rates = record['batch_rows_per_sec']
+        if rates['min'] is not None:
+            lines.append(f"  Скорость порций: от {rates['min']:.0f} до {rates['max']:.0f} записей/с")
+        for stage, seconds in record['stages'].items():
+            if record['stage_calls'].get(stage):
+                lines.append(f"  {STAGE_NAMES.get(stage, stage)}: {seconds:.2f} с, вызовов: {record['stage_calls'][stage]}")
+        return '\n'.join(lines)
+
+    # Итог запуска в лог: читаемая сводка и одна строка JSON для разбора
+    def log(self, label, **fields):
+        logging.info(f"Метрики {label}:\n{self.summary()}")
+        logging.info(json.dumps({'event': 'fill_metrics', 'label': label, **fields, **self.to_record()},
+                                ensure_ascii=False, default=str))
+
+
+def _round_trip_kind(sql):
+    # {CALL ...} — вызов процедуры в синтаксисе ODBC
+    text = sql.lstrip().lstrip('{').upper()
+    if 'INFORMATION_SCHEMA' in text or 'SYS.' in text:
+        return 'catalog'
+    return text.split(None, 1)[0].lower() if text else 'other'
+
+
+# Обёртки над соединением и курсором pyodbc, считающие обмены с сервером.
+class InstrumentedConnection:
+    def __init__(self, conn, metrics):
+        object.__setattr__(self, '_conn', conn)
+        object.__setattr__(self, '_metrics', metrics)
+
+    def cursor(self):
+        return InstrumentedCursor(self._conn.cursor(), self._metrics)
+
+    def execute(self, sql, *params):
+        self._metrics.count_round_trip(_round_trip_kind(sql))
+        return self._conn.execute(sql, *params)
+
+    def commit(self):
+        self._metrics.count_round_trip('commit')
+        self._conn.commit()
+
+    def rollback(self):
+        self._metrics.count_round_trip('rollback')
+        self._conn.rollback()
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._conn, name, value)
+
+
+class InstrumentedCursor:
+    def __init__(self, cursor, metrics):
+        object.__setattr__(self, '_cursor', cursor)
+        object.__setattr__(self, '_metrics', metrics)
+
+    def execute(self, sql, *params):
+        self._metrics.count_round_trip(_round_trip_kind(sql))
+        self._cursor.execute(sql, *params)
+        return self
+
+    def executemany(self, sql, seq_of_params):
+        self._metrics.count_round_trip(_round_trip_kind(sql))
+        return self._cursor.executemany(sql, seq_of_params)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._cursor, name, value)
+
+
+# Необязательное профилирование запуска. cProfile видит только поток, в котором
+# он включён; параллельные соединения и планировщик работают в других потоках.
+@contextlib.contextmanager
+def profiled(mode, label, directory=PROFILE_DIR):
+    if not mode:
+        yield
+        return
+    if mode not in PROFILE_MODES:
+        raise ValueError(f"Неизвестный режим профилирования: {mode}")
+
+    stamp = datetime.datetime.now().strftime('%Y%m%d-%H%M%S')
+    if mode == 'cprofile':
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(directory, f"{label}-{stamp}.prof")
+            profiler.dump_stats(path)
+            output = io.StringIO()
+            pstats.Stats(profiler, stream=output).sort_stats('cumulative').print_stats(PROFILE_TOP)
+            logging.info(f"Профиль {label} сохранён в {path}:\n{output.getvalue()}")
+        return
+
+    started = not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+    try:
+        yield
+    finally:
+        snapshot = tracemalloc.take_snapshot()
+        peak = tracemalloc.get_traced_memory()[1]
+        if started:
+            tracemalloc.stop()
+        top = '\n'.join(str(stat) for stat in snapshot.statistics('lineno')[:PROFILE_TOP])
+        logging.info(f"Память {label}: пик {peak / 2 ** 20:.1f} МБ, крупнейшие выделения:\n{top}")
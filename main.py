@@ -2,18 +2,24 @@
 
 import sys
 import logging
-from database import DatabaseManager
-from gui import Application
-
-# Настройка логирования
-logging.basicConfig(filename='data_generator.log', level=logging.INFO,
-                    format='%(asctime)s:%(levelname)s:%(message)s')
+import multiprocessing
 
 
 def main():
+    if len(sys.argv) > 1:
+        # С аргументами запускается консольный режим без Tkinter
+        import cli
+        sys.exit(cli.main(sys.argv[1:]))
+
+    # Настройка логирования; консольный режим настраивает его сам по --log-file
+    logging.basicConfig(filename='data_generator.log', level=logging.INFO,
+                        format='%(asctime)s:%(levelname)s:%(message)s')
+    from gui import Application
     app = Application()
     app.run()
 
 
 if __name__ == '__main__':
+    # Процессы генерации запускаются через spawn, в том числе из собранного exe
+    multiprocessing.freeze_support()
     main()
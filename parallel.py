@@ -0,0 +1,141 @@
+# parallel.py
+
+import logging
+import random
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from database import OperationCancelled
+from fk_pool import ForeignKeyPool
+from generators import ColumnarGenerator, new_seed, stream_key
+from pipeline import CHUNK_SIZE, FillProgress, create_inserter, iter_batches
+from resilience import DEFAULT_ON_ERROR, RejectedRowsReport, ReplacementOffsets
+from unique_values import UniqueValueFactory
+
+PARALLEL_CONNECTIONS = 4
+
+WorkerResult = namedtuple('WorkerResult', ['worker', 'start', 'stop', 'inserted', 'error'])
+
+
+# Сводный результат параллельной загрузки по всем соединениям.
+class LoadReport:
+    def __init__(self, table_name, total, results, rejected_rows=None):
+        self.table_name = table_name
+        self.total = total
+        self.results = results
+        self.rejected_rows = rejected_rows
+
+    @property
+    def inserted(self):
+        return sum(result.inserted for result in self.results)
+
+    @property
+    def failed(self):
+        return [result for result in self.results if result.error is not None]
+
+    @property
+    def succeeded(self):
+        return not self.failed
+
+    def summary(self):
+        lines = [f"Таблица {self.table_name}: вставлено {self.inserted} из {self.total} записей "
+                 f"через {len(self.results)} соединений"]
+        if self.rejected_rows is not None and self.rejected_rows.rejected:
+            lines.append(f"  {self.rejected_rows.summary()}")
+        for result in self.failed:
+            lines.append(f"  соединение {result.worker} (строки {result.start}-{result.stop - 1}): "
+                         f"вставлено {result.inserted}, ошибка: {result.error}")
+        return '\n'.join(lines)
+
+
+def split_range(n, parts):
+    parts = max(1, min(parts, n))
+    size, extra = divmod(n, parts)
+    ranges = []
+    start = 0
+    for k in range(parts):
+        stop = start + size + (1 if k < extra else 0)
+        ranges.append((start, stop))
+        start = stop
+    return ranges
+
+
+# Заполняет одну таблицу через несколько соединений: диапазон строк делится
+# между ними, каждое вставляет свои порции в собственных транзакциях.
+def parallel_fill(db_manager, table_name, n, schema='dbo', connections=PARALLEL_CONNECTIONS,
+                  chunk_size=CHUNK_SIZE, insert_mode='fast_executemany', on_progress=None, cancel_event=None,
+                  seed=None, reference_date=None, profile=None, on_error=DEFAULT_ON_ERROR):
+    table = db_manager.catalog.get_table(table_name, schema)
+    if table is None:
+        raise ValueError(f"Схема таблицы {schema}.{table_name} недоступна")
+
+    # Один seed на все соединения: строка зависит только от своего номера,
+    # поэтому результат совпадает с последовательным заполнением
+    if seed is None:
+        seed = new_seed()
+    fk_pool = ForeignKeyPool(db_manager, seed=seed)
+    for fk in table.foreign_keys:
+        fk_pool.get_values(fk.referenced_table, fk.referenced_column, schema)
+    unique_values = UniqueValueFactory.for_table(db_manager, table, fk_pool,
+                                                 rnd=random.Random(stream_key(seed, schema, table_name)))
+
+    progress = FillProgress(n)
+    lock = threading.Lock()
+    # Номера строк для замен и отчёт об отклонённых строках общие для всех соединений
+    replacement_offsets = ReplacementOffsets(n)
+    rejected_rows = RejectedRowsReport.for_table(db_manager.database, schema, table_name)
+
+    ranges = split_range(n, connections)
+    # INSERT с TABLOCK держит исключительную блокировку таблицы до конца транзакции
+    # порции, и соединения, пишущие в одну таблицу, выполнялись бы по очереди
+    tablock = db_manager.tablock and len(ranges) == 1
+    if db_manager.tablock and not tablock:
+        logging.info(f"Таблица {schema}.{table_name} заполняется через {len(ranges)} соединений: "
+                     f"TABLOCK быстрой загрузки для неё не используется")
+
+    def load_range(worker, start, stop):
+        inserted = 0
+        try:
+            worker_manager = db_manager.clone()
+        except Exception as e:
+            logging.error(f"Соединение {worker}: не удалось подключиться: {e}")
+            return WorkerResult(worker, start, stop, 0, str(e))
+        worker_manager.tablock = tablock
+
+        try:
+            # У каждого соединения свой генератор: numpy.random.Generator не потокобезопасен
+            generator = ColumnarGenerator(table, fk_pool, unique_values, seed, reference_date=reference_date,
+                                          profile=profile)
+            inserter = create_inserter(worker_manager, generator, n, on_error, insert_mode, cancel_event,
+                                       replacement_offsets, rejected_rows)
+            row_offset = start
+            for batch in iter_batches(generator, stop - start, chunk_size, row_offset=start,
+                                      metrics=db_manager.metrics):
+                if cancel_event is not None and cancel_event.is_set():
+                    raise OperationCancelled()
+                count = len(inserter.insert(batch, row_offset))
+                row_offset += len(batch)
+                inserted += count
+                with lock:
+                    progress.generated += len(batch)
+                    progress.inserted += count
+                    progress.rejected += len(batch) - count
+                    if on_progress:
+                        on_progress(progress)
+            return WorkerResult(worker, start, stop, inserted, None)
+        except OperationCancelled:
+            return WorkerResult(worker, start, stop, inserted, "отменено")
+        except Exception as e:
+            logging.error(f"Соединение {worker}: ошибка при загрузке строк {start}-{stop - 1}: {e}")
+            return WorkerResult(worker, start, stop, inserted, str(e))
+        finally:
+            worker_manager.close_connection()
+
+    with ThreadPoolExecutor(max_workers=len(ranges), thread_name_prefix='loader') as executor:
+        futures = [executor.submit(load_range, worker, start, stop) for worker, (start, stop) in enumerate(ranges)]
+        results = [future.result() for future in futures]
+
+    report = LoadReport(f"{schema}.{table_name}", n, results, rejected_rows)
+    logging.info(report.summary())
+    return report
@@ -0,0 +1,295 @@
+# pipeline.py
+
+import gzip
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+
+from database import OperationCancelled
+from fk_pool import ForeignKeyPool
+from generators import ColumnarGenerator, new_seed, stream_key
+from resilience import DEFAULT_ON_ERROR, RejectedRowsReport, ReplacementOffsets, ResilientInserter
+from unique_values import UniqueValueFactory
+from utils import MAX_ROWS_PER_INSERT, format_insert_statements
+
+# Размер порции: столько записей одновременно находится в памяти
+# и фиксируется одной транзакцией
+CHUNK_SIZE = 10000
+CHECKPOINT_DIR = 'checkpoints'
+# Размер буфера записи SQL-скрипта
+SCRIPT_BUFFER_SIZE = 1024 * 1024
+
+
+# Контрольная точка заполнения таблицы: сколько записей уже зафиксировано,
+# чтобы прерванный запуск можно было продолжить с того же места.
+class Checkpoint:
+    def __init__(self, path, database, schema, table_name, total):
+        self.path = path
+        self.database = database
+        self.schema = schema
+        self.table_name = table_name
+        self.total = total
+        # Сколько строк заполнения обработано (вставлено или отклонено): с этой
+        # строки продолжается прерванный запуск
+        self.processed = 0
+        # Продолжение с тем же seed дописывает те же строки, что дал бы непрерывный запуск
+        self.seed = None
+
+    @classmethod
+    def for_table(cls, database, schema, table_name, total, directory=CHECKPOINT_DIR):
+        path = os.path.join(directory, f"{database}.{schema}.{table_name}.json")
+        checkpoint = cls(path, database, schema, table_name, total)
+        checkpoint.load()
+        return checkpoint
+
+    @property
+    def remaining(self):
+        return self.total - self.processed
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logging.warning(f"Не удалось прочитать контрольную точку {self.path}: {e}")
+            return
+        if (data.get('database'), data.get('schema'), data.get('table'), data.get('total')) == \
+                (self.database, self.schema, self.table_name, self.total):
+            # 'inserted' — имя поля в контрольных точках прежних версий
+            self.processed = data.get('processed', data.get('inserted', 0))
+            self.seed = data.get('seed')
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'database': self.database, 'schema': self.schema, 'table': self.table_name,
+                       'total': self.total, 'processed': self.processed, 'seed': self.seed}, f)
+        os.replace(tmp_path, self.path)
+
+    def remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+# Состояние выполнения заполнения; обновляется потоком генерации и потоком вставки.
+class FillProgress:
+    def __init__(self, total, start=0):
+        self.total = total
+        self.start = start
+        self.generated = start
+        self.inserted = start
+        # Строки, которые сервер отклонил и которые не удалось заменить
+        self.rejected = 0
+        self.started_at = time.monotonic()
+
+    # Сколько строк заполнения обработано: вставлено или отклонено
+    @property
+    def processed(self):
+        return self.inserted + self.rejected
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self.started_at
+
+    @property
+    def rows_per_sec(self):
+        elapsed = self.elapsed
+        return (self.inserted - self.start) / elapsed if elapsed > 0 else 0.0
+
+    @property
+    def eta(self):
+        rate = self.rows_per_sec
+        return (self.total - self.processed) / rate if rate > 0 else None
+
+    def snapshot(self):
+        return {'total': self.total, 'generated': self.generated, 'inserted': self.inserted,
+                'rejected': self.rejected, 'elapsed': self.elapsed, 'rows_per_sec': self.rows_per_sec,
+                'eta': self.eta}
+
+
+def iter_batches(generator, n, chunk_size=CHUNK_SIZE, row_offset=0, metrics=None):
+    done = 0
+    while done < n:
+        count = min(chunk_size, n - done)
+        if metrics is None:
+            batch = generator.generate(count, row_offset + done)
+        else:
+            with metrics.stage('generate'):
+                batch = generator.generate(count, row_offset + done)
+        yield batch
+        done += count
+
+
+def create_generator(db_manager, table_name, schema='dbo', fk_pool=None, unique_values=None, null_columns=(),
+                     seed=None, reference_date=None, profile=None):
+    table = db_manager.catalog.get_table(table_name, schema)
+    if table is None:
+        raise ValueError(f"Схема таблицы {schema}.{table_name} недоступна")
+    if seed is None:
+        seed = new_seed()
+    if fk_pool is None:
+        fk_pool = ForeignKeyPool(db_manager, seed=seed)
+    if unique_values is None:
+        unique_values = UniqueValueFactory.for_table(db_manager, table, fk_pool,
+                                                     rnd=random.Random(stream_key(seed, schema, table_name)))
+    return ColumnarGenerator(table, fk_pool, unique_values, seed, null_columns, reference_date, profile)
+
+
+# Выполняет итератор в отдельном потоке, держа наготове до depth элементов,
+# чтобы генерация следующей порции шла параллельно со вставкой текущей.
+def prefetch(iterable, depth=1):
+    items = queue.Queue(maxsize=depth)
+    stopped = threading.Event()
+
+    def put(message):
+        while not stopped.is_set():
+            try:
+                items.put(message, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put(('item', item)):
+                    return
+            put(('end', None))
+        except BaseException as e:
+            put(('error', e))
+
+    producer = threading.Thread(target=produce, name='prefetch', daemon=True)
+    producer.start()
+    try:
+        while True:
+            kind, payload = items.get()
+            if kind == 'end':
+                return
+            if kind == 'error':
+                raise payload
+            yield payload
+    finally:
+        stopped.set()
+        producer.join()
+
+
+def fill_table(db_manager, table_name, n, schema='dbo', chunk_size=CHUNK_SIZE, checkpoint=None,
+               insert_mode='fast_executemany', on_progress=None, cancel_event=None, overlap=False,
+               fk_pool=None, null_columns=(), seed=None, reference_date=None, profile=None, on_error=DEFAULT_ON_ERROR,
+               on_inserted=None):
+    start = checkpoint.processed if checkpoint else 0
+    if checkpoint:
+        if seed is None:
+            seed = checkpoint.seed if checkpoint.seed is not None and start else new_seed()
+        checkpoint.seed = seed
+    if start:
+        logging.info(f"Продолжение заполнения таблицы {schema}.{table_name} с записи {start} из {n}")
+
+    progress = FillProgress(n, start)
+    # Схема, значения внешних ключей и базы уникальных последовательностей
+    # загружаются здесь, поэтому сама генерация к серверу не обращается и
+    # при overlap может идти в отдельном потоке.
+    if fk_pool is None:
+        fk_pool = ForeignKeyPool(db_manager, seed=seed)
+    generator = create_generator(db_manager, table_name, schema, fk_pool, null_columns=null_columns, seed=seed,
+                                 reference_date=reference_date, profile=profile)
+    inserter = create_inserter(db_manager, generator, n, on_error, insert_mode, cancel_event)
+
+    def generated_chunks():
+        for batch in iter_batches(generator, n - start, chunk_size, row_offset=start,
+                                  metrics=db_manager.metrics):
+            progress.generated += len(batch)
+            if on_progress:
+                on_progress(progress)
+            yield batch
+            if cancel_event is not None and cancel_event.is_set():
+                return
+
+    chunks = generated_chunks()
+    if overlap:
+        chunks = prefetch(chunks)
+
+    row_offset = start
+    for batch in chunks:
+        if cancel_event is not None and cancel_event.is_set():
+            raise OperationCancelled()
+        inserted_batch = inserter.insert(batch, row_offset)
+        row_offset += len(batch)
+        progress.inserted += len(inserted_batch)
+        progress.rejected += len(batch) - len(inserted_batch)
+        fk_pool.record_chunk(table_name, inserted_batch, schema)
+        if on_inserted:
+            on_inserted(inserted_batch)
+        if checkpoint:
+            checkpoint.processed = row_offset
+            checkpoint.save()
+        if on_progress:
+            on_progress(progress)
+
+    if cancel_event is not None and cancel_event.is_set():
+        raise OperationCancelled()
+    if checkpoint:
+        checkpoint.remove()
+    inserted = progress.inserted - start
+    logging.info(f"Заполнение таблицы {schema}.{table_name} завершено: вставлено {inserted} записей "
+                 f"за {progress.elapsed:.1f} с ({progress.rows_per_sec:.0f} записей/с); {inserter.report.summary()}")
+    return inserted
+
+
+# Вставка порций таблицы с изоляцией отклонённых строк; замены берутся из
+# номеров строк после total, отчёт пишется в REJECTED_ROWS_DIR.
+def create_inserter(db_manager, generator, total, on_error=DEFAULT_ON_ERROR, insert_mode='fast_executemany',
+                    cancel_event=None, replacement_offsets=None, report=None):
+    table = generator.table
+    if report is None:
+        report = RejectedRowsReport.for_table(db_manager.database, table.schema, table.name)
+    return ResilientInserter(db_manager, table.name, table.schema, on_error, generator,
+                             replacement_offsets or ReplacementOffsets(total), report, insert_mode, cancel_event)
+
+
+def open_script(file_path, compress=None):
+    if compress is None:
+        compress = file_path.endswith('.gz')
+    if compress:
+        return gzip.open(file_path, 'wt', encoding='utf-8', newline='\n')
+    return open(file_path, 'w', encoding='utf-8', newline='\n', buffering=SCRIPT_BUFFER_SIZE)
+
+
+# Пишет SQL-скрипт заполнения таблицы потоком: каждая порция из chunk_size строк
+# становится многострочными INSERT по rows_per_insert строк и отдельным пакетом
+# до GO, так что в памяти одновременно только одна порция. Файл с расширением
+# .gz (или при compress=True) сжимается gzip.
+def export_script(db_manager, table_name, n, file_path, schema='dbo', chunk_size=CHUNK_SIZE, seed=None,
+                  reference_date=None, profile=None, rows_per_insert=MAX_ROWS_PER_INSERT, compress=None,
+                  on_progress=None, cancel_event=None):
+    generator = create_generator(db_manager, table_name, schema, seed=seed, reference_date=reference_date,
+                                 profile=profile)
+    table = generator.table
+    data_types = [column.data_type for column in generator.columns]
+    progress = FillProgress(n)
+    statements = 0
+    with open_script(file_path, compress) as f:
+        f.write("SET NOCOUNT ON;\nGO\n")
+        for batch in iter_batches(generator, n, chunk_size, metrics=db_manager.metrics):
+            if cancel_event is not None and cancel_event.is_set():
+                raise OperationCancelled()
+            with db_manager.metrics.stage('serialize'):
+                inserts = format_insert_statements(table.full_name, batch.columns, data_types, batch.data,
+                                                   rows_per_insert)
+                f.write('\n'.join(inserts) + '\nGO\n')
+            statements += len(inserts)
+            # Для скрипта записанные в файл строки считаются обработанными
+            progress.generated += len(batch)
+            progress.inserted = progress.generated
+            if on_progress:
+                on_progress(progress)
+    logging.info(f"Экспортировано {progress.generated} записей ({statements} INSERT) в файл {file_path}")
+    return progress.generated
@@ -0,0 +1,336 @@
+# planner.py
+
+import logging
+import random
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from database import OperationCancelled
+from fk_pool import ForeignKeyPool
+from schema import INTEGER_TYPES
+from pipeline import CHUNK_SIZE, fill_table
+from resilience import DEFAULT_ON_ERROR
+
+PLANNER_CONNECTIONS = 4
+# Сколько строк обновляется одной транзакцией при заполнении отложенного внешнего ключа
+DEFERRED_UPDATE_BATCH = 10000
+
+TableResult = namedtuple('TableResult', ['table_name', 'requested', 'inserted', 'error'])
+
+
+# План заполнения базы: уровни таблиц в порядке зависимостей по внешним ключам
+# (таблицы одного уровня независимы друг от друга) и отложенные внешние ключи,
+# которые заполняются UPDATE после загрузки всех таблиц.
+class FillPlan:
+    def __init__(self, schema, tables, levels, deferred):
+        self.schema = schema
+        self.tables = tables
+        self.levels = levels
+        self.deferred = deferred
+
+    @property
+    def order(self):
+        return [table_name for level in self.levels for table_name in level]
+
+    def deferred_columns(self, table_name):
+        return {fk.column for deferred_table, fk in self.deferred if deferred_table == table_name}
+
+    def describe(self):
+        lines = [f"Уровень {number}: {', '.join(level)}" for number, level in enumerate(self.levels, 1)]
+        for table_name, fk in self.deferred:
+            lines.append(f"Отложенный внешний ключ {table_name}.{fk.column} -> {fk.referenced_table}.{fk.referenced_column}")
+        return '\n'.join(lines)
+
+
+class DatabaseFillReport:
+    def __init__(self, results):
+        self.results = results
+
+    @property
+    def inserted(self):
+        return sum(result.inserted for result in self.results)
+
+    @property
+    def failed(self):
+        return [result for result in self.results if result.error is not None]
+
+    @property
+    def succeeded(self):
+        return not self.failed
+
+    def summary(self):
+        lines = [f"Вставлено {self.inserted} записей в {len(self.results)} таблиц"]
+        for result in self.results:
+            status = f"ошибка: {result.error}" if result.error else "готово"
+            lines.append(f"  {result.table_name}: {result.inserted} из {result.requested} ({status})")
+        return '\n'.join(lines)
+
+
+def _find_cycle(dependencies, remaining):
+    # У каждой оставшейся таблицы есть родитель среди оставшихся, поэтому
+    # проход по родителям обязательно замыкается в цикл.
+    node = min(remaining)
+    path = []
+    positions = {}
+    while node not in positions:
+        positions[node] = len(path)
+        path.append(node)
+        node = min(parent for parent in dependencies[node] if parent in remaining)
+    return path[positions[node]:]
+
+
+def build_plan(db_manager, tables=None, schema='dbo'):
+    if tables is None:
+        tables = db_manager.get_tables()
+
+    schemas = {}
+    for table_name in tables:
+        table = db_manager.catalog.get_table(table_name, schema)
+        if table is None:
+            raise ValueError(f"Схема таблицы {schema}.{table_name} недоступна")
+        schemas[table_name] = table
+
+    deferred = []
+    dependencies = {table_name: {} for table_name in schemas}
+    for table_name, table in schemas.items():
+        for fk in table.foreign_keys:
+            if fk.referenced_table == table_name:
+                # Ссылка на саму себя: NULL при вставке, значение — после загрузки
+                if table.column(fk.column).is_nullable:
+                    deferred.append((table_name, fk))
+                continue
+            if fk.referenced_table in dependencies:
+                dependencies[table_name].setdefault(fk.referenced_table, []).append(fk)
+
+    levels = []
+    remaining = set(schemas)
+    while remaining:
+        ready = sorted(table_name for table_name in remaining if not remaining & set(dependencies[table_name]))
+        if ready:
+            levels.append(ready)
+            remaining -= set(ready)
+            continue
+
+        cycle = _find_cycle(dependencies, remaining)
+        for position, child in enumerate(cycle):
+            parent = cycle[(position + 1) % len(cycle)]
+            fks = dependencies[child][parent]
+            if all(schemas[child].column(fk.column).is_nullable for fk in fks):
+                deferred.extend((child, fk) for fk in fks)
+                del dependencies[child][parent]
+                logging.info(f"Цикл {' -> '.join(cycle)} разорван отложенным внешним ключом {child} -> {parent}")
+                break
+        else:
+            raise ValueError(f"Циклическая зависимость без допускающих NULL внешних ключей: {' -> '.join(cycle)}")
+
+    plan = FillPlan(schema, schemas, levels, deferred)
+    logging.info(f"План заполнения базы данных:\n{plan.describe()}")
+    return plan
+
+
+# Заполняет таблицы по плану: уровень за уровнем, таблицы одного уровня —
+# параллельно через отдельные соединения. Ключи родительских таблиц, вставленные
+# в этом запуске, передаются дочерним таблицам через общий пул в памяти.
+def fill_database(db_manager, row_counts, plan=None, schema='dbo', connections=PLANNER_CONNECTIONS,
+                  chunk_size=CHUNK_SIZE, insert_mode='fast_executemany', on_progress=None, cancel_event=None,
+                  seed=None, reference_date=None, profiles=None, on_error=DEFAULT_ON_ERROR):
+    if plan is None:
+        plan = build_plan(db_manager, schema=schema)
+
+    fk_pool = ForeignKeyPool(db_manager, seed=seed)
+    for table_name, table in plan.tables.items():
+        if row_counts.get(table_name, 0) <= 0:
+            continue
+        for child_name, child in plan.tables.items():
+            for fk in child.foreign_keys:
+                if fk.referenced_table == table_name and not table.column(fk.referenced_column).is_identity:
+                    fk_pool.track(table_name, fk.referenced_column, schema)
+
+    # Строки этого запуска в таблицах с отложенными внешними ключами: диапазон
+    # целочисленного первичного ключа или ключи, записанные во время заполнения
+    run_rows = {table_name: DeferredRows.for_table(db_manager, plan.tables[table_name])
+                for table_name in {table_name for table_name, _ in plan.deferred}
+                if row_counts.get(table_name, 0) > 0}
+
+    results = {}
+    failed = set()
+    for level in plan.levels:
+        if cancel_event is not None and cancel_event.is_set():
+            break
+
+        to_fill = []
+        for table_name in level:
+            requested = row_counts.get(table_name, 0)
+            if requested <= 0:
+                continue
+            deferred_columns = plan.deferred_columns(table_name)
+            failed_parents = sorted({fk.referenced_table for fk in plan.tables[table_name].foreign_keys
+                                     if fk.referenced_table in failed and fk.column not in deferred_columns})
+            if failed_parents:
+                results[table_name] = TableResult(table_name, requested, 0,
+                                                  f"пропущено: не заполнены родительские таблицы {', '.join(failed_parents)}")
+                failed.add(table_name)
+                continue
+            # Значения родителей загружаются до запуска потоков, в основном соединении
+            for fk in plan.tables[table_name].foreign_keys:
+                if fk.column not in deferred_columns:
+                    fk_pool.get_values(fk.referenced_table, fk.referenced_column, schema)
+            if table_name in run_rows:
+                run_rows[table_name].start()
+            to_fill.append(table_name)
+
+        def fill_one(table_name):
+            requested = row_counts[table_name]
+            worker_manager = None
+            try:
+                worker_manager = db_manager.clone()
+                inserted = fill_table(worker_manager, table_name, requested, schema, chunk_size,
+                                      insert_mode=insert_mode, cancel_event=cancel_event, fk_pool=fk_pool,
+                                      null_columns=plan.deferred_columns(table_name), seed=seed,
+                                      reference_date=reference_date,
+                                      profile=(profiles or {}).get(table_name), on_error=on_error,
+                                      on_inserted=run_rows[table_name].record if table_name in run_rows else None,
+                                      on_progress=(lambda progress: on_progress(table_name, progress))
+                                      if on_progress else None)
+                return TableResult(table_name, requested, inserted, None)
+            except OperationCancelled:
+                return TableResult(table_name, requested, 0, "отменено")
+            except Exception as e:
+                logging.error(f"Ошибка при заполнении таблицы {schema}.{table_name}: {e}")
+                return TableResult(table_name, requested, 0, str(e))
+            finally:
+                if worker_manager is not None:
+                    worker_manager.close_connection()
+
+        if to_fill:
+            with ThreadPoolExecutor(max_workers=max(1, min(connections, len(to_fill))),
+                                    thread_name_prefix='planner') as executor:
+                for result in executor.map(fill_one, to_fill):
+                    results[result.table_name] = result
+                    if result.error is not None:
+                        failed.add(result.table_name)
+
+    if cancel_event is None or not cancel_event.is_set():
+        for table_name, fk in plan.deferred:
+            if table_name in results and table_name not in failed:
+                _fill_deferred_foreign_key(db_manager, plan.tables[table_name], fk, run_rows[table_name], fk_pool,
+                                           seed)
+
+    report = DatabaseFillReport([results[table_name] for table_name in plan.order if table_name in results])
+    logging.info(report.summary())
+    return report
+
+
+# Строки таблицы, вставленные в этом запуске. При целочисленном первичном
+# ключе (в том числе IDENTITY) новые строки — это ключи больше максимального
+# до заполнения: уникальные числа продолжаются после существующих. Иначе
+# ключи новых строк записываются по мере вставки порций.
+class DeferredRows:
+    def __init__(self, db_manager, table, key_column):
+        self.db_manager = db_manager
+        self.table = table
+        self.key_column = key_column
+        self.by_range = key_column is not None and table.data_type(key_column.name) in INTEGER_TYPES
+        self.low = None
+        self.keys = []
+
+    @classmethod
+    def for_table(cls, db_manager, table):
+        keys = [key for key in table.unique_keys if key.is_primary_key and len(key.columns) == 1]
+        return cls(db_manager, table, table.column(keys[0].columns[0]) if keys else None)
+
+    # Вызывается до заполнения таблицы
+    def start(self):
+        if not self.by_range:
+            return
+        cursor = self.db_manager.conn.cursor()
+        try:
+            cursor.execute(f"SELECT MAX([{self.key_column.name}]) FROM {self.table.full_name}")
+            row = cursor.fetchone()
+            self.low = row[0] if row and row[0] is not None else None
+        finally:
+            cursor.close()
+
+    # Вызывается с каждой вставленной порцией
+    def record(self, batch):
+        if not self.by_range and self.key_column is not None and self.key_column.name in batch:
+            self.keys.extend(batch.column(self.key_column.name))
+
+    # Порции строк этого запуска с NULL в столбце fk.column: ключ строки и её
+    # значение в столбце, на который ссылается внешний ключ
+    def batches(self, fk, batch_size=DEFERRED_UPDATE_BATCH):
+        key_name = self.key_column.name
+        if not self.by_range:
+            for start in range(0, len(self.keys), batch_size):
+                yield [(key, key) for key in self.keys[start:start + batch_size]]
+            return
+        last = self.low
+        while True:
+            condition = f"[{fk.column}] IS NULL" + (f" AND [{key_name}] > ?" if last is not None else "")
+            cursor = self.db_manager.conn.cursor()
+            try:
+                cursor.execute(f"SELECT TOP ({batch_size}) [{key_name}], [{fk.referenced_column}] "
+                               f"FROM {self.table.full_name} WHERE {condition} ORDER BY [{key_name}]",
+                               *([last] if last is not None else []))
+                rows = [tuple(row) for row in cursor.fetchall()]
+            finally:
+                cursor.close()
+            if not rows:
+                return
+            yield rows
+            last = rows[-1][0]
+
+
+# Назначает строкам этого запуска случайных родителей из пула значений
+# внешних ключей и обновляет их порциями по первичному ключу. Ссылка на саму
+# себя исключается: строка не может быть своим родителем.
+def _fill_deferred_foreign_key(db_manager, table, fk, run_rows, fk_pool, seed=None):
+    name = f"{table.schema}.{table.name}.{fk.column}"
+    if run_rows.key_column is None:
+        message = (f"Отложенный внешний ключ {name} не заполнен: у таблицы нет первичного ключа из одного "
+                   f"столбца, по которому можно найти строки этого запуска")
+        logging.error(message)
+        db_manager.show_error("Ошибка", message)
+        return
+    self_reference = fk.referenced_table == table.name
+    if not run_rows.by_range and self_reference and fk.referenced_column != run_rows.key_column.name:
+        message = (f"Отложенный внешний ключ {name} не заполнен: ссылка на саму себя не по первичному ключу "
+                   f"поддерживается только для целочисленного первичного ключа")
+        logging.error(message)
+        db_manager.show_error("Ошибка", message)
+        return
+
+    rnd = random.Random(seed)
+    updated = 0
+    cursor = db_manager.conn.cursor()
+    autocommit = db_manager.conn.autocommit
+    db_manager.conn.autocommit = False
+    try:
+        parents = fk_pool.get_values(fk.referenced_table, fk.referenced_column, table.schema)
+        if not parents:
+            raise ValueError(f"нет значений в {fk.referenced_table}.{fk.referenced_column}")
+        cursor.fast_executemany = True
+        query = f"UPDATE {table.full_name} SET [{fk.column}] = ? WHERE [{run_rows.key_column.name}] = ?"
+        for rows in run_rows.batches(fk):
+            params = []
+            for key, own_value in rows:
+                parent = parents[rnd.randrange(len(parents))]
+                if self_reference and parent == own_value:
+                    if len(parents) == 1:
+                        continue
+                    # Сдвиг на случайное ненулевое число позиций даёт другое значение пула
+                    position = (parents.index(parent) + rnd.randrange(1, len(parents))) % len(parents)
+                    parent = parents[position]
+                params.append((parent, key))
+            if params:
+                cursor.executemany(query, params)
+            db_manager.conn.commit()
+            updated += len(params)
+        logging.info(f"Заполнен отложенный внешний ключ {name}: {updated} строк")
+    except Exception as e:
+        db_manager.conn.rollback()
+        logging.error(f"Ошибка при заполнении отложенного внешнего ключа {name} (обновлено {updated} строк): {e}")
+        db_manager.show_error("Ошибка", f"Ошибка при заполнении внешнего ключа {table.name}.{fk.column}: {e}")
+    finally:
+        cursor.close()
+        db_manager.conn.autocommit = autocommit
@@ -0,0 +1,105 @@
+# process_pool.py
+
+import logging
+import multiprocessing
+import os
+import signal
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from database import OperationCancelled
+from fk_pool import ForeignKeyPool
+from generators import ColumnarGenerator, new_seed
+from pipeline import CHUNK_SIZE, FillProgress, create_generator, create_inserter
+from record_batch import RecordBatch
+from resilience import DEFAULT_ON_ERROR
+
+GENERATION_PROCESSES = os.cpu_count() or 1
+# Сколько сгенерированных порций на процесс может ждать вставки
+PENDING_PER_PROCESS = 2
+
+# Генератор процесса-исполнителя; создаётся один раз при запуске процесса
+_generator = None
+
+
+def _init_process(table, key_snapshot, unique_values, seed, null_columns, reference_date, profile):
+    global _generator
+    # Ctrl+C обрабатывает основной процесс: он отменяет заполнение и закрывает пул
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _generator = ColumnarGenerator(table, key_snapshot, unique_values, seed, null_columns, reference_date, profile)
+
+
+def _generate_chunk(row_offset, n):
+    # Передаются только списки значений: имена столбцов известны вызывающей стороне
+    return _generator.generate(n, row_offset).data
+
+
+# Заполняет таблицу, генерируя порции в пуле процессов, а вставляя через одно
+# соединение в порядке номеров строк. Строки вычисляются по (seed, номер строки),
+# поэтому у каждого процесса свой Faker и свои диапазоны уникальных значений,
+# а результат совпадает с последовательным заполнением с тем же seed.
+def process_fill(db_manager, table_name, n, schema='dbo', processes=GENERATION_PROCESSES, chunk_size=CHUNK_SIZE,
+                 checkpoint=None, insert_mode='fast_executemany', on_progress=None, cancel_event=None,
+                 null_columns=(), seed=None, reference_date=None, profile=None, on_error=DEFAULT_ON_ERROR):
+    start = checkpoint.processed if checkpoint else 0
+    if seed is None:
+        seed = checkpoint.seed if checkpoint and checkpoint.seed is not None and start else new_seed()
+    if checkpoint:
+        checkpoint.seed = seed
+    if start:
+        logging.info(f"Продолжение заполнения таблицы {schema}.{table_name} с записи {start} из {n}")
+
+    progress = FillProgress(n, start)
+    # Всё, что требует сервера, загружается здесь; процессы получают готовые
+    # значения внешних ключей и параметры уникальных последовательностей.
+    fk_pool = ForeignKeyPool(db_manager, seed=seed)
+    generator = create_generator(db_manager, table_name, schema, fk_pool, null_columns=null_columns, seed=seed,
+                                 reference_date=reference_date, profile=profile)
+    column_names = generator.column_names
+    # Отклонённые строки заменяются здесь же: у основного процесса свой генератор
+    inserter = create_inserter(db_manager, generator, n, on_error, insert_mode, cancel_event)
+    chunks = iter([(row_offset, min(chunk_size, n - row_offset)) for row_offset in range(start, n, chunk_size)])
+    processes = max(1, min(processes, -(-(n - start) // chunk_size)))
+    logging.info(f"Генерация таблицы {schema}.{table_name} в {processes} процессах")
+
+    # spawn, а не fork: процесс запускается из потока интерфейса с открытыми соединениями
+    executor = ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context('spawn'),
+                                   initializer=_init_process,
+                                   initargs=(generator.table, fk_pool.snapshot(), generator.unique_values, seed,
+                                             tuple(null_columns), generator.reference_date, profile))
+    pending = deque()
+
+    def submit():
+        while len(pending) < processes * PENDING_PER_PROCESS:
+            chunk = next(chunks, None)
+            if chunk is None:
+                return
+            pending.append(executor.submit(_generate_chunk, *chunk))
+
+    try:
+        submit()
+        while pending:
+            if cancel_event is not None and cancel_event.is_set():
+                raise OperationCancelled()
+            # Время ожидания порции — то, на сколько генерация не успевает за вставкой
+            with db_manager.metrics.stage('generate'):
+                batch = RecordBatch(column_names, pending.popleft().result())
+            submit()
+            progress.generated += len(batch)
+            count = len(inserter.insert(batch, progress.generated - len(batch)))
+            progress.inserted += count
+            progress.rejected += len(batch) - count
+            if checkpoint:
+                checkpoint.processed = progress.processed
+                checkpoint.save()
+            if on_progress:
+                on_progress(progress)
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+    if checkpoint:
+        checkpoint.remove()
+    inserted = progress.inserted - start
+    logging.info(f"Заполнение таблицы {schema}.{table_name} завершено: вставлено {inserted} записей "
+                 f"за {progress.elapsed:.1f} с ({progress.rows_per_sec:.0f} записей/с); {inserter.report.summary()}")
+    return inserted
@@ -0,0 +1,91 @@
+# record_batch.py
+
+
+# Порция строк таблицы по столбцам: порядок столбцов задаётся один раз,
+# значения каждого столбца хранятся одним списком. Имена столбцов не
+# повторяются в каждой строке, как в списке словарей.
+class RecordBatch:
+    __slots__ = ('columns', 'data', '_positions')
+
+    def __init__(self, columns, data):
+        self.columns = tuple(columns)
+        self.data = list(data)
+        if len(self.columns) != len(self.data):
+            raise ValueError(f"Порция: {len(self.columns)} столбцов, но {len(self.data)} списков значений")
+        self._positions = {column_name: position for position, column_name in enumerate(self.columns)}
+
+    @classmethod
+    def from_records(cls, records, columns=None):
+        # Для старого кода, передающего список словарей
+        if columns is None:
+            columns = list(records[0]) if records else []
+        return cls(columns, [[record.get(column_name) for record in records] for column_name in columns])
+
+    def __len__(self):
+        return len(self.data[0]) if self.data else 0
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return RecordRow(self, index)
+
+    def __iter__(self):
+        return (RecordRow(self, index) for index in range(len(self)))
+
+    def __contains__(self, column_name):
+        return column_name in self._positions
+
+    def column(self, column_name):
+        return self.data[self._positions[column_name]]
+
+    def items(self):
+        return zip(self.columns, self.data)
+
+    # Кортежи значений строк в порядке columns — то, что принимает executemany
+    def rows(self):
+        return zip(*self.data)
+
+    def select(self, columns):
+        return RecordBatch(columns, [self.column(column_name) for column_name in columns])
+
+    def to_records(self):
+        return [dict(zip(self.columns, row)) for row in self.rows()]
+
+
+# Представление одной строки порции без копирования значений; поддерживает
+# обращение по имени столбца и по номеру, как словарь записи и строка pyodbc.
+class RecordRow:
+    __slots__ = ('_batch', '_index')
+
+    def __init__(self, batch, index):
+        self._batch = batch
+        self._index = index
+
+    def __getitem__(self, key):
+        batch = self._batch
+        position = key if isinstance(key, int) else batch._positions[key]
+        return batch.data[position][self._index]
+
+    def __len__(self):
+        return len(self._batch.columns)
+
+    def __iter__(self):
+        return (values[self._index] for values in self._batch.data)
+
+    def get(self, column_name, default=None):
+        position = self._batch._positions.get(column_name)
+        return default if position is None else self._batch.data[position][self._index]
+
+    def keys(self):
+        return self._batch.columns
+
+    def values(self):
+        return tuple(self)
+
+    def items(self):
+        return zip(self._batch.columns, self)
+
+    def __repr__(self):
+        return f"RecordRow({dict(self.items())!r})"
@@ -0,0 +1,271 @@
+# resilience.py
+
+import datetime
+import itertools
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+
+from record_batch import RecordBatch
+
+# Что делать со строкой, которую сервер отклонил (дубликат ключа, нарушение
+# внешнего ключа, не помещающееся значение): остановить заполнение, пропустить
+# строку или заменить её строкой, сгенерированной заново.
+ON_ERROR_POLICIES = ('regenerate', 'skip', 'fail')
+DEFAULT_ON_ERROR = 'regenerate'
+REJECTED_ROWS_DIR = 'rejected_rows'
+# Сколько раз повторять порцию после временной ошибки и начальная пауза, секунд
+RETRY_ATTEMPTS = 5
+RETRY_BACKOFF = 0.5
+RETRY_BACKOFF_MAX = 30.0
+# Сколько раз генерировать замену отклонённой строки, прежде чем пропустить её
+REGENERATE_ATTEMPTS = 3
+# Больше отклонённых строк на таблицу означает ошибку в самих данных или схеме,
+# а не отдельные неудачные значения
+MAX_REJECTED_ROWS = 10000
+
+# Номера ошибок SQL Server, после которых тот же запрос можно просто повторить:
+# взаимоблокировка, тайм-аут блокировки, ошибки сети и переключения Azure SQL
+CONNECTION_ERRORS = {64, 121, 233, 10053, 10054, 10060}
+TRANSIENT_ERRORS = CONNECTION_ERRORS | {-2, 1205, 1222, 40143, 40197, 40501, 40613, 49918, 49919, 49920}
+# SQLSTATE обрыва соединения и тайм-аута; 40001 — откат из-за взаимоблокировки
+CONNECTION_STATES = {'08S01', '08001', '08003', '08004', '08007'}
+TRANSIENT_STATES = CONNECTION_STATES | {'HYT00', 'HYT01', '40001'}
+# Ошибки, вызванные значениями конкретной строки: дубликат ключа, внешний
+# ключ и CHECK, NULL в NOT NULL, усечение, преобразование и переполнение
+ROW_ERRORS = {220, 241, 242, 245, 515, 547, 2601, 2627, 2628, 8114, 8115, 8152}
+# Классы SQLSTATE 22 (ошибка данных) и 23 (нарушение ограничения)
+ROW_ERROR_STATE_CLASSES = ('22', '23')
+
+# Драйвер ODBC дописывает номер ошибки в скобках после текста каждого сообщения:
+# "... The duplicate key value is (42). (2601) (SQLExecDirectW)"
+_ERROR_NUMBER_RE = re.compile(r'\((-?\d+)\)(?=\s*(?:\(SQL\w*\)|;|$))')
+
+
+class TooManyRejectedRows(Exception):
+    pass
+
+
+def _sqlstate(error):
+    args = getattr(error, 'args', ())
+    if args and isinstance(args[0], str) and len(args[0]) == 5:
+        return args[0]
+    return None
+
+
+# Текст сообщения драйвера без SQLSTATE, который pyodbc передаёт первым аргументом
+def error_message(error):
+    args = getattr(error, 'args', ())
+    return args[1] if len(args) > 1 and isinstance(args[1], str) else str(error)
+
+
+# Номера ошибок SQL Server из всех сообщений драйвера
+def error_numbers(error):
+    return [int(number) for number in _ERROR_NUMBER_RE.findall(error_message(error))]
+
+
+def error_number(error):
+    numbers = error_numbers(error)
+    return numbers[0] if numbers else None
+
+
+def is_connection_error(error):
+    return _sqlstate(error) in CONNECTION_STATES or not CONNECTION_ERRORS.isdisjoint(error_numbers(error))
+
+
+def is_transient(error):
+    return _sqlstate(error) in TRANSIENT_STATES or not TRANSIENT_ERRORS.isdisjoint(error_numbers(error))
+
+
+def is_row_error(error):
+    if is_transient(error):
+        return False
+    state = _sqlstate(error)
+    return (state is not None and state[:2] in ROW_ERROR_STATE_CLASSES) or not ROW_ERRORS.isdisjoint(
+        error_numbers(error))
+
+
+# Вызывает function(*args), повторяя её после временных ошибок с растущей
+# паузой; после обрыва соединения db_manager переподключается.
+def call_with_retry(db_manager, function, *args, attempts=RETRY_ATTEMPTS, backoff=RETRY_BACKOFF, cancel_event=None):
+    for attempt in range(attempts + 1):
+        try:
+            return function(*args)
+        except Exception as e:
+            if attempt == attempts or not is_transient(e):
+                raise
+            delay = min(RETRY_BACKOFF_MAX, backoff * 2 ** attempt) * random.uniform(0.5, 1.5)
+            logging.warning(f"Временная ошибка сервера, повтор {attempt + 1} из {attempts} через {delay:.1f} с: {e}")
+            # При отмене пауза прерывается, а следующая попытка сразу сообщит об отмене
+            if cancel_event is not None:
+                cancel_event.wait(delay)
+            else:
+                time.sleep(delay)
+            if is_connection_error(e):
+                try:
+                    db_manager.reconnect()
+                    logging.info(f"Соединение с сервером {db_manager.server} восстановлено")
+                except Exception as reconnect_error:
+                    logging.warning(f"Не удалось переподключиться к серверу {db_manager.server}: {reconnect_error}")
+
+
+# Применяет apply к списку элементов одной транзакцией; если сервер отклоняет
+# список из-за значений строк, список делится пополам, пока не останутся
+# отдельные отклонённые элементы, которые передаются в reject. Удачные
+# половины фиксируются, так что теряется не больше одного элемента на ошибку.
+def apply_bisecting(items, apply, reject):
+    try:
+        apply(items)
+    except Exception as e:
+        if not is_row_error(e):
+            raise
+        if len(items) == 1:
+            reject(items[0], e)
+            return
+        middle = len(items) // 2
+        apply_bisecting(items[:middle], apply, reject)
+        apply_bisecting(items[middle:], apply, reject)
+
+
+# Номера строк для замен: после последней строки заполнения. Генерация
+# детерминирована по номеру строки, поэтому у замены другие значения, а её
+# уникальные значения не совпадают со значениями основных строк.
+class ReplacementOffsets:
+    def __init__(self, first_offset):
+        self._offsets = itertools.count(first_offset)
+        self._lock = threading.Lock()
+
+    def next(self):
+        with self._lock:
+            return next(self._offsets)
+
+
+# Отчёт об отклонённых строках: каждая строка сразу дописывается в файл JSON
+# Lines, чтобы отчёт сохранился и при прерванном заполнении.
+class RejectedRowsReport:
+    def __init__(self, path=None, max_rejected=MAX_REJECTED_ROWS):
+        self.path = path
+        self.max_rejected = max_rejected
+        self.rejected = 0
+        self.dropped = 0
+        self.regenerated = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def for_table(cls, database, schema, table_name, directory=REJECTED_ROWS_DIR, max_rejected=MAX_REJECTED_ROWS):
+        stamp = datetime.datetime.now().strftime('%Y%m%d-%H%M%S')
+        return cls(os.path.join(directory, f"{database}.{schema}.{table_name}.{stamp}.jsonl"), max_rejected)
+
+    def add(self, table, row_number, columns, values, error, action):
+        record = {'table': f"{table.schema}.{table.name}", 'row': row_number, 'action': action,
+                  'error_number': error_number(error), 'sqlstate': _sqlstate(error), 'message': error_message(error),
+                  'values': dict(zip(columns, values))}
+        with self._lock:
+            self.rejected += 1
+            if action == 'dropped':
+                self.dropped += 1
+            else:
+                self.regenerated += 1
+            if self.path:
+                os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(record, ensure_ascii=False, default=str) + '\n')
+            rejected = self.rejected
+        logging.warning(f"Строка {row_number} таблицы {table.schema}.{table.name} отклонена сервером "
+                        f"({'пропущена' if action == 'dropped' else 'заменена'}): {error_message(error)}")
+        if self.max_rejected is not None and rejected > self.max_rejected:
+            raise TooManyRejectedRows(f"Сервер отклонил больше {self.max_rejected} строк таблицы "
+                                      f"{table.schema}.{table.name}; последняя ошибка: {error}")
+
+    def summary(self):
+        if not self.rejected:
+            return "отклонённых строк нет"
+        return (f"отклонено строк: {self.rejected}, заменено: {self.regenerated}, пропущено: {self.dropped}"
+                + (f"; отчёт: {self.path}" if self.path else ""))
+
+
+# Вставка порций с изоляцией ошибок: каждая порция фиксируется отдельно,
+# временные ошибки повторяются с переподключением, а порция, отклонённая
+# из-за значений строк, делится пополам до отклонённых строк. Такие строки
+# по политике on_error заменяются новыми, пропускаются или останавливают
+# заполнение; в последнем случае откатывается только текущая порция.
+class ResilientInserter:
+    def __init__(self, db_manager, table_name, schema='dbo', on_error=DEFAULT_ON_ERROR, generator=None,
+                 replacement_offsets=None, report=None, insert_mode='fast_executemany', cancel_event=None):
+        if on_error not in ON_ERROR_POLICIES:
+            raise ValueError(f"Неизвестная политика обработки ошибок: {on_error}")
+        if on_error == 'regenerate' and (generator is None or replacement_offsets is None):
+            raise ValueError("Для замены отклонённых строк нужны генератор и номера строк для замен")
+        self.db_manager = db_manager
+        self.table = db_manager.catalog.get_table(table_name, schema)
+        if self.table is None:
+            raise ValueError(f"Схема таблицы {schema}.{table_name} недоступна")
+        self.on_error = on_error
+        self.generator = generator
+        self.replacement_offsets = replacement_offsets
+        self.report = report if report is not None else RejectedRowsReport()
+        self.insert_mode = insert_mode
+        self.cancel_event = cancel_event
+
+    def _insert_rows(self, columns, rows):
+        return call_with_retry(self.db_manager, self._insert_once, columns, rows, cancel_event=self.cancel_event)
+
+    def _insert_once(self, columns, rows):
+        return self.db_manager.insert_rows(self.table, columns, rows, insert_mode=self.insert_mode,
+                                           cancel_event=self.cancel_event)
+
+    # Вставляет порцию, начинающуюся со строки row_offset заполнения, и
+    # возвращает порцию строк, которые действительно оказались в таблице.
+    def insert(self, batch, row_offset=0):
+        columns = list(batch.columns)
+        rows = list(batch.rows())
+        if self.on_error == 'fail':
+            self._insert_rows(columns, rows)
+            return batch
+
+        rejected = set()
+        replacements = []
+
+        def apply(positions):
+            self._insert_rows(columns, [rows[position] for position in positions])
+
+        def reject(position, error):
+            rejected.add(position)
+            replacement = self._replace(columns, row_offset + position, rows[position], error)
+            if replacement is not None:
+                replacements.append(replacement)
+
+        apply_bisecting(list(range(len(rows))), apply, reject)
+        if not rejected:
+            return batch
+        kept = [row for position, row in enumerate(rows) if position not in rejected] + replacements
+        return RecordBatch(columns, [list(values) for values in zip(*kept)] if kept else [[] for _ in columns])
+
+    def _replace(self, columns, row_number, row, error):
+        if self.on_error == 'skip':
+            self.report.add(self.table, row_number, columns, row, error, 'dropped')
+            return None
+        last_error = error
+        for _ in range(REGENERATE_ATTEMPTS):
+            try:
+                replacement = next(self.generator.generate(1, self.replacement_offsets.next()).rows())
+            except Exception as e:
+                # Например, исчерпаны сочетания составного ключа
+                logging.warning(f"Не удалось сгенерировать замену строки {row_number} таблицы "
+                                f"{self.table.schema}.{self.table.name}: {e}")
+                break
+            try:
+                self._insert_rows(columns, [replacement])
+            except Exception as e:
+                if not is_row_error(e):
+                    raise
+                last_error = e
+                continue
+            self.report.add(self.table, row_number, columns, row, error, 'regenerated')
+            return replacement
+        self.report.add(self.table, row_number, columns, row, last_error, 'dropped')
+        return None
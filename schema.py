@@ -0,0 +1,245 @@
+# schema.py
+
+import json
+import logging
+import os
+import re
+from collections import namedtuple
+
+TEXT_TYPES = ('NVARCHAR', 'VARCHAR', 'CHAR', 'NCHAR', 'TEXT')
+INTEGER_TYPES = ('INT', 'BIGINT', 'SMALLINT', 'TINYINT')
+FLOAT_TYPES = ('FLOAT', 'REAL', 'DECIMAL', 'NUMERIC')
+DATETIME_TYPES = ('DATETIME', 'DATETIME2', 'SMALLDATETIME')
+SNAPSHOT_DIR = 'schema_snapshots'
+
+Column = namedtuple('Column', ['name', 'data_type', 'max_length', 'is_nullable', 'is_identity'])
+ForeignKey = namedtuple('ForeignKey', ['name', 'column', 'referenced_table', 'referenced_column'])
+UniqueKey = namedtuple('UniqueKey', ['name', 'columns', 'is_primary_key'])
+
+
+class TableSchema:
+    def __init__(self, schema, name, columns, foreign_keys, unique_keys):
+        self.schema = schema
+        self.name = name
+        self.columns = columns
+        self.foreign_keys = foreign_keys
+        self.unique_keys = unique_keys
+        self.fk_columns = {fk.column: fk for fk in foreign_keys}
+        self._columns_by_name = {column.name: column for column in columns}
+        self.unique_columns, self.composite_fk_keys = self._resolve_unique_keys()
+        self.unique_column_names = {column_name for column_name, _ in self.unique_columns}
+
+    @property
+    def full_name(self):
+        return f"[{self.schema}].[{self.name}]"
+
+    @property
+    def insertable_columns(self):
+        return [column for column in self.columns if not column.is_identity]
+
+    def column(self, column_name):
+        return self._columns_by_name.get(column_name)
+
+    def data_type(self, column_name, default='NVARCHAR'):
+        column = self._columns_by_name.get(column_name)
+        return column.data_type if column else default
+
+    # Для каждого уникального ключа выбирается столбец, уникальность которого
+    # делает уникальной всю строку ключа. Ключи только из внешних ключей
+    # заполняются перебором сочетаний родительских значений.
+    def _resolve_unique_keys(self):
+        unique_columns = []
+        unique_names = set()
+        composite_fk_keys = []
+        for key in self.unique_keys:
+            columns = [self._columns_by_name.get(column_name) for column_name in key.columns]
+            if any(column is None or column.is_identity for column in columns):
+                continue
+            if any(column.name in unique_names for column in columns):
+                continue
+            candidates = [column for column in columns
+                          if column.name not in self.fk_columns and column.data_type != 'BIT']
+            if candidates:
+                unique_columns.append((candidates[0].name, candidates[0].data_type))
+                unique_names.add(candidates[0].name)
+            elif all(column.name in self.fk_columns for column in columns):
+                composite_fk_keys.append(key)
+            else:
+                logging.warning(f"Уникальный ключ {key.name} таблицы {self.schema}.{self.name} "
+                                f"не может быть заполнен без повторов: {key.columns}")
+        return unique_columns, composite_fk_keys
+
+
+# Кэш метаданных таблиц для одного подключения. При первом обращении схема всей
+# базы читается несколькими запросами к каталогу и сохраняется в снимок на диске;
+# следующие запуски берут её из снимка, если отпечаток схемы не изменился.
+# Если массовое чтение недоступно, схема читается по таблицам.
+# snapshot_dir=None отключает снимки.
+class SchemaCatalog:
+    def __init__(self, db_manager, snapshot_dir=SNAPSHOT_DIR):
+        self.db_manager = db_manager
+        self.snapshot_dir = snapshot_dir
+        self._tables = {}
+        self._state = {'loaded': False}
+
+    def get_table(self, table_name, schema='dbo'):
+        key = (schema, table_name)
+        table = self._tables.get(key)
+        if table is None and not self._state['loaded']:
+            self.load_all()
+            table = self._tables.get(key)
+        if table is None:
+            table = self._load_table(table_name, schema)
+            if table is not None:
+                self._tables[key] = table
+        return table
+
+    def share(self, db_manager):
+        catalog = SchemaCatalog(db_manager, self.snapshot_dir)
+        catalog._tables = self._tables
+        catalog._state = self._state
+        return catalog
+
+    def invalidate(self, table_name=None, schema='dbo'):
+        if table_name is None:
+            self._tables.clear()
+            self._state['loaded'] = False
+            logging.info("Кэш схемы очищен")
+        else:
+            self._tables.pop((schema, table_name), None)
+            logging.info(f"Кэш схемы таблицы {schema}.{table_name} очищен")
+
+    @property
+    def snapshot_path(self):
+        name = f"{self.db_manager.server}.{self.db_manager.database}"
+        return os.path.join(self.snapshot_dir, re.sub(r'[^\w.-]', '_', name) + '.json')
+
+    def load_all(self):
+        self._state['loaded'] = True
+        with self.db_manager.metrics.stage('schema'):
+            try:
+                fingerprint = self.db_manager.get_schema_fingerprint()
+            except Exception as e:
+                logging.warning(f"Массовое чтение схемы недоступно, схема будет читаться по таблицам: {e}")
+                return False
+
+            tables = self._read_snapshot(fingerprint)
+            if tables is None:
+                try:
+                    tables = self._read_database()
+                except Exception as e:
+                    logging.warning(f"Массовое чтение схемы недоступно, схема будет читаться по таблицам: {e}")
+                    return False
+                self._write_snapshot(fingerprint, tables)
+            for table in tables:
+                self._tables.setdefault((table.schema, table.name), table)
+        return True
+
+    def _read_database(self):
+        columns = {}
+        for row in self.db_manager.get_all_columns():
+            columns.setdefault((row[0], row[1]), []).append(Column(
+                name=row[2],
+                data_type=row[3].upper(),
+                max_length=row[4],
+                is_nullable=bool(row[5]),
+                is_identity=bool(row[6]),
+            ))
+        foreign_keys = {}
+        for row in self.db_manager.get_all_foreign_keys():
+            foreign_keys.setdefault((row[0], row[1]), []).append(
+                ForeignKey(name=row[2], column=row[3], referenced_table=row[4], referenced_column=row[5]))
+        unique_keys = {}
+        for row in self.db_manager.get_all_unique_keys():
+            keys = unique_keys.setdefault((row[0], row[1]), {})
+            keys.setdefault(row[2], (bool(row[3]), []))[1].append(row[4])
+
+        tables = []
+        for (schema, table_name), table_columns in columns.items():
+            keys = [UniqueKey(name, tuple(key_columns), is_primary_key)
+                    for name, (is_primary_key, key_columns) in unique_keys.get((schema, table_name), {}).items()]
+            tables.append(TableSchema(schema, table_name, table_columns,
+                                      foreign_keys.get((schema, table_name), []), keys))
+        logging.info(f"Схема базы данных {self.db_manager.database} прочитана целиком: {len(tables)} таблиц")
+        return tables
+
+    def _read_snapshot(self, fingerprint):
+        if self.snapshot_dir is None:
+            return None
+        path = self.snapshot_path
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('fingerprint') != fingerprint:
+                logging.info(f"Снимок схемы {path} устарел")
+                return None
+            tables = [
+                TableSchema(
+                    item['schema'], item['name'],
+                    [Column(*column) for column in item['columns']],
+                    [ForeignKey(*fk) for fk in item['foreign_keys']],
+                    [UniqueKey(key[0], tuple(key[1]), key[2]) for key in item['unique_keys']],
+                )
+                for item in data['tables']
+            ]
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logging.warning(f"Не удалось прочитать снимок схемы {path}: {e}")
+            return None
+        logging.info(f"Схема базы данных {self.db_manager.database} загружена из снимка {path}: {len(tables)} таблиц")
+        return tables
+
+    def _write_snapshot(self, fingerprint, tables):
+        if self.snapshot_dir is None:
+            return
+        path = self.snapshot_path
+        data = {
+            'server': self.db_manager.server,
+            'database': self.db_manager.database,
+            'fingerprint': fingerprint,
+            'tables': [
+                {
+                    'schema': table.schema,
+                    'name': table.name,
+                    'columns': [list(column) for column in table.columns],
+                    'foreign_keys': [list(fk) for fk in table.foreign_keys],
+                    'unique_keys': [[key.name, list(key.columns), key.is_primary_key] for key in table.unique_keys],
+                }
+                for table in tables
+            ],
+        }
+        try:
+            os.makedirs(self.snapshot_dir, exist_ok=True)
+            tmp_path = path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logging.warning(f"Не удалось сохранить снимок схемы {path}: {e}")
+
+    def _load_table(self, table_name, schema):
+        with self.db_manager.metrics.stage('schema'):
+            return self._read_table(table_name, schema)
+
+    def _read_table(self, table_name, schema):
+        schema_info = self.db_manager.get_table_schema(table_name, schema)
+        if not schema_info:
+            return None
+
+        columns = [
+            Column(
+                name=row[0],
+                data_type=row[1].upper(),
+                max_length=row[2],
+                is_nullable=row[3] == 'YES',
+                is_identity=row[4] == 1,
+            )
+            for row in schema_info
+        ]
+        foreign_keys = [
+            ForeignKey(name=fk[0], column=fk[1], referenced_table=fk[2], referenced_column=fk[3])
+            for fk in self.db_manager.get_foreign_keys(table_name, schema)
+        ]
+        unique_keys = self.db_manager.get_unique_keys(table_name, schema)
+        return TableSchema(schema, table_name, columns, foreign_keys, unique_keys)
@@ -0,0 +1,148 @@
+# tvp.py
+
+import contextlib
+import logging
+import threading
+import uuid
+
+from schema import TEXT_TYPES
+
+# Префикс вспомогательных типов и процедур: по нему их можно найти и удалить
+# вручную, если процесс был убит и не успел убрать за собой
+TVP_OBJECT_PREFIX = 'DataGenerator'
+# Длинные имена таблиц обрезаются, чтобы имя объекта уложилось в 128 символов
+TVP_NAME_TABLE_LENGTH = 80
+MAX_NVARCHAR_LENGTH = 4000
+MAX_VARBINARY_LENGTH = 8000
+
+# Типы, которые объявляются в табличном типе как есть
+PLAIN_TYPES = ('INT', 'BIGINT', 'SMALLINT', 'TINYINT', 'BIT', 'FLOAT', 'REAL', 'MONEY', 'SMALLMONEY', 'DATE',
+               'DATETIME', 'SMALLDATETIME', 'UNIQUEIDENTIFIER')
+
+
+def _sized(type_name, max_length, limit):
+    if max_length is None or max_length <= 0 or max_length > limit:
+        return f"{type_name}(MAX)"
+    return f"{type_name}({max_length})"
+
+
+# Тип столбца табличного параметра. Точность и масштаб в кэше схемы не хранятся,
+# поэтому DECIMAL и типы с дробными секундами объявляются с наибольшей
+# точностью; к типу целевого столбца значения приводит сам INSERT ... SELECT.
+def column_type(column):
+    data_type = column.data_type
+    if data_type in PLAIN_TYPES:
+        return data_type
+    if data_type in TEXT_TYPES or data_type == 'NTEXT':
+        return _sized('NVARCHAR', column.max_length, MAX_NVARCHAR_LENGTH)
+    if data_type in ('DECIMAL', 'NUMERIC'):
+        return 'DECIMAL(38, 12)'
+    if data_type in ('DATETIME2', 'TIME', 'DATETIMEOFFSET'):
+        return f"{data_type}(7)"
+    if data_type in ('BINARY', 'VARBINARY'):
+        return _sized('VARBINARY', column.max_length, MAX_VARBINARY_LENGTH)
+    if data_type == 'IMAGE':
+        return 'VARBINARY(MAX)'
+    # XML и прочие типы передаются строкой и преобразуются сервером
+    return 'NVARCHAR(MAX)'
+
+
+# Вспомогательные объекты режима вставки tvp: для каждой таблицы — табличный
+# тип с её вставляемыми столбцами и процедура INSERT ... SELECT FROM @rows.
+# Создаются при первой вставке в таблицу и удаляются в drop_all.
+class TvpObjects:
+    def __init__(self, db_manager):
+        self.db_manager = db_manager
+        # Свой суффикс у каждого запуска: параллельные запуски не мешают друг другу
+        self.token = uuid.uuid4().hex[:8]
+        self._procedures = {}
+        self._created = []
+        self._lock = threading.Lock()
+
+    def procedure(self, table, columns, tablock=False):
+        key = (table.schema, table.name, tuple(columns), tablock)
+        with self._lock:
+            procedure_name = self._procedures.get(key)
+            if procedure_name is None:
+                procedure_name = self._create(table, columns, tablock, len(self._procedures))
+                self._procedures[key] = procedure_name
+            return procedure_name
+
+    def _create(self, table, columns, tablock, number):
+        base = f"{TVP_OBJECT_PREFIX}_{table.name[:TVP_NAME_TABLE_LENGTH]}_{self.token}_{number}"
+        type_name = f"[{table.schema}].[{base}_Rows]"
+        procedure_name = f"[{table.schema}].[{base}_Insert]"
+        declarations = ', '.join(f"[{column_name}] {column_type(table.column(column_name))} NULL"
+                                 for column_name in columns)
+        columns_str = ', '.join(f"[{column_name}]" for column_name in columns)
+        hint = " WITH (TABLOCK)" if tablock else ""
+        # DDL выполняется в отдельном соединении в режиме autocommit, а не в
+        # транзакции порции, чтобы откат порции не удалял тип и процедуру
+        conn = self.db_manager.open_connection()
+        try:
+            cursor = conn.cursor()
+            try:
+                cursor.execute(f"CREATE TYPE {type_name} AS TABLE ({declarations})")
+                self._created.append(('TYPE', type_name))
+                cursor.execute(f"CREATE PROCEDURE {procedure_name} @rows {type_name} READONLY AS "
+                               f"BEGIN SET NOCOUNT ON; INSERT INTO {table.full_name}{hint} ({columns_str}) "
+                               f"SELECT {columns_str} FROM @rows; END")
+                self._created.append(('PROCEDURE', procedure_name))
+            finally:
+                cursor.close()
+        finally:
+            conn.close()
+        logging.info(f"Созданы табличный тип {type_name} и процедура {procedure_name} для вставки в "
+                     f"таблицу {table.schema}.{table.name}")
+        return procedure_name
+
+    # Процедуры удаляются раньше типов: тип нельзя удалить, пока на него ссылается процедура
+    def drop_all(self):
+        with self._lock:
+            created, self._created = self._created, []
+            self._procedures.clear()
+        if not created:
+            return []
+        errors = []
+        conn = self.db_manager.open_connection()
+        try:
+            for kind, name in sorted(reversed(created), key=lambda item: item[0] != 'PROCEDURE'):
+                cursor = conn.cursor()
+                try:
+                    cursor.execute(f"DROP {kind} {name}")
+                except Exception as e:
+                    errors.append(f"{name}: {e}")
+                finally:
+                    cursor.close()
+        finally:
+            conn.close()
+        logging.info(f"Удалено вспомогательных объектов режима tvp: {len(created) - len(errors)}")
+        return errors
+
+
+# Включает режим вставки tvp для db_manager и его клонов на время блока и
+# удаляет созданные типы и процедуры при выходе, в том числе после ошибки.
+@contextlib.contextmanager
+def tvp_insert(db_manager):
+    objects = TvpObjects(db_manager)
+    previous = db_manager.tvp_objects
+    db_manager.tvp_objects = objects
+    try:
+        yield objects
+    finally:
+        db_manager.tvp_objects = previous
+        try:
+            errors = objects.drop_all()
+        except Exception as e:
+            errors = [str(e)]
+        if errors:
+            message = '\n'.join(errors)
+            logging.error(f"Не удалось удалить вспомогательные объекты режима tvp:\n{message}")
+            db_manager.show_error("Ошибка", f"Не удалось удалить вспомогательные объекты режима tvp "
+                                            f"(префикс {TVP_OBJECT_PREFIX}_):\n{message}")
+
+
+def insert_mode_context(db_manager, insert_mode):
+    if insert_mode == 'tvp':
+        return tvp_insert(db_manager)
+    return contextlib.nullcontext()
@@ -0,0 +1,258 @@
+# unique_values.py
+
+import bisect
+import datetime
+import math
+import random
+import uuid
+
+from fk_pool import FETCH_BATCH_SIZE, ForeignKeyPool
+from schema import INTEGER_TYPES, FLOAT_TYPES, DATETIME_TYPES
+from vocabulary import get_vocabulary
+
+UNIQUE_INT_STRATEGIES = ('sequence', 'permutation')
+INTEGER_MAX_VALUES = {
+    'TINYINT': 255,
+    'SMALLINT': 32767,
+    'INT': 2 ** 31 - 1,
+    'BIGINT': 2 ** 63 - 1,
+}
+# Дробные столбцы заполняются целыми значениями, точно представимыми во FLOAT
+FLOAT_MAX_VALUE = 2 ** 53
+BINARY_KEY_LENGTH = 8
+# 122 случайных бита UUID версии 4
+UUID_SPACE = 2 ** 122
+DEFAULT_DATE_BASE = datetime.date(2000, 1, 1)
+# Шаг уникальных значений даты и времени: не меньше точности типа, иначе
+# соседние значения округляются сервером до одного и дают дубликат ключа.
+# SMALLDATETIME хранится с точностью до минуты, DATETIME — до 1/300 секунды.
+DATETIME_STEPS = {
+    'SMALLDATETIME': datetime.timedelta(minutes=1),
+}
+DEFAULT_DATETIME_STEP = datetime.timedelta(seconds=1)
+SMALLDATETIME_MAX = datetime.datetime(2079, 6, 6, 23, 59)
+
+
+def affine_permutation(size, rnd):
+    # i -> (a * i + c) mod size является перестановкой [0, size) при gcd(a, size) = 1
+    if size <= 1:
+        return 1, 0
+    a = rnd.randrange(1, size)
+    while math.gcd(a, size) != 1:
+        a = rnd.randrange(1, size)
+    return a, rnd.randrange(size)
+
+
+def uuid_from_int(value):
+    # Раскладывает 122 бита по полям UUID, оставляя биты версии 4 и варианта RFC 4122
+    high, middle, low = value >> 74, (value >> 62) & 0xFFF, value & (2 ** 62 - 1)
+    return str(uuid.UUID(int=(high << 80) | (4 << 76) | (middle << 64) | (2 << 62) | low))
+
+
+# Уникальные значения, вычисляемые по номеру строки в запуске за O(1): непересекающиеся
+# диапазоны строк (например, у разных соединений) никогда не дают дубликатов, а
+# последовательности продолжаются после значений, уже существующих в таблице.
+class UniqueValueFactory:
+    def __init__(self, table, bases=None, key_pools=None, int_strategy='sequence', rnd=None, existing_keys=None):
+        if int_strategy not in UNIQUE_INT_STRATEGIES:
+            raise ValueError(f"Неизвестная стратегия уникальных чисел: {int_strategy}")
+        self.table = table
+        self.bases = bases or {}
+        self.key_pools = key_pools or {}
+        self.int_strategy = int_strategy
+        rnd = rnd or random.Random()
+
+        # Параметры перестановок выбираются один раз, чтобы все потоки,
+        # разделяющие фабрику, использовали одну и ту же биекцию.
+        self._permutations = {}
+        for column_name, data_type in table.unique_columns:
+            if int_strategy == 'permutation' and data_type in INTEGER_TYPES:
+                capacity = self._capacity(column_name, data_type)
+                self._permutations[column_name] = (capacity, affine_permutation(capacity, rnd))
+            elif data_type == 'UNIQUEIDENTIFIER':
+                # Нечётный множитель взаимно прост с 2 ** 122: номера строк не дают повторов
+                self._permutations[column_name] = (UUID_SPACE, (rnd.randrange(UUID_SPACE) | 1,
+                                                                rnd.randrange(UUID_SPACE)))
+        # Для каждого составного ключа — отсортированные позиции перестановки,
+        # занятые сочетаниями, которые уже есть в таблице; номера строк
+        # отображаются только на свободные позиции.
+        self._taken = {}
+        existing_keys = existing_keys or {}
+        for key_name, pools in self.key_pools.items():
+            capacity = math.prod(len(pool) for pool in pools)
+            self._permutations[key_name] = (capacity, affine_permutation(capacity, rnd))
+            self._taken[key_name] = self._taken_positions(key_name, existing_keys.get(key_name, ()))
+
+    # Позиции сочетаний из existing в перестановке составного ключа key_name
+    # в виде P[i] - i: число свободных позиций перед i-й занятой. Сочетания со
+    # значениями, которых нет в пулах, сгенерированным строкам не мешают.
+    def _taken_positions(self, key_name, existing):
+        pools = self.key_pools[key_name]
+        capacity, (a, c) = self._permutations[key_name]
+        digits = [{value: digit for digit, value in enumerate(pool)} for pool in pools]
+        a_inverse = pow(a, -1, capacity) if capacity > 1 else 0
+        positions = set()
+        for values in existing:
+            index, multiplier = 0, 1
+            for value, pool_digits, pool in zip(values, digits, pools):
+                digit = pool_digits.get(value)
+                if digit is None:
+                    break
+                index += digit * multiplier
+                multiplier *= len(pool)
+            else:
+                positions.add(a_inverse * (index - c) % capacity)
+        return [position - number for number, position in enumerate(sorted(positions))]
+
+    @classmethod
+    def for_table(cls, db_manager, table, fk_pool=None, int_strategy='sequence', rnd=None):
+        bases = {}
+        cursor = db_manager.conn.cursor()
+        try:
+            for column_name, data_type in table.unique_columns:
+                bases[column_name] = cls._load_base(cursor, table, column_name, data_type)
+        finally:
+            cursor.close()
+
+        key_pools = {}
+        if table.composite_fk_keys:
+            if fk_pool is None:
+                fk_pool = ForeignKeyPool(db_manager)
+            for key in table.composite_fk_keys:
+                # Сортировка делает сочетания независимыми от порядка строк на сервере
+                key_pools[key.name] = [
+                    sorted(fk_pool.get_values(table.fk_columns[column_name].referenced_table,
+                                              table.fk_columns[column_name].referenced_column, table.schema))
+                    for column_name in key.columns
+                ]
+        existing_keys = {key.name: cls._load_existing_keys(db_manager, table, key.columns)
+                         for key in table.composite_fk_keys}
+        return cls(table, bases, key_pools, int_strategy, rnd, existing_keys)
+
+    # Сочетания составного ключа, уже существующие в таблице: повторное
+    # заполнение не должно их повторить
+    @staticmethod
+    def _load_existing_keys(db_manager, table, columns):
+        columns_str = ', '.join(f"[{column_name}]" for column_name in columns)
+        condition = ' AND '.join(f"[{column_name}] IS NOT NULL" for column_name in columns)
+        cursor = db_manager.conn.cursor()
+        try:
+            cursor.execute(f"SELECT DISTINCT {columns_str} FROM {table.full_name} WHERE {condition}")
+            existing = []
+            while True:
+                rows = cursor.fetchmany(FETCH_BATCH_SIZE)
+                if not rows:
+                    break
+                existing.extend(tuple(row) for row in rows)
+        finally:
+            cursor.close()
+        return existing
+
+    @staticmethod
+    def _load_base(cursor, table, column_name, data_type):
+        if data_type == 'UNIQUEIDENTIFIER':
+            return None
+        if data_type in INTEGER_TYPES or data_type in FLOAT_TYPES or data_type == 'DATE' \
+                or data_type in DATETIME_TYPES or data_type == 'VARBINARY':
+            cursor.execute(f"SELECT MAX([{column_name}]) FROM {table.full_name}")
+            row = cursor.fetchone()
+            value = row[0] if row else None
+            if value is None:
+                return None
+            if data_type in INTEGER_TYPES or data_type in FLOAT_TYPES:
+                return math.ceil(value)
+            if data_type == 'VARBINARY':
+                return int.from_bytes(value, 'big')
+            return value
+
+        # Строки имеют вид <слово>-<номер>: счётчик продолжается после
+        # наибольшего номера, уже встречающегося в столбце.
+        cursor.execute(f"""
+            SELECT MAX(TRY_CAST(RIGHT([{column_name}], CHARINDEX('-', REVERSE([{column_name}])) - 1) AS BIGINT))
+            FROM {table.full_name}
+            WHERE CHARINDEX('-', [{column_name}]) > 0
+        """)
+        row = cursor.fetchone()
+        return row[0] + 1 if row and row[0] is not None else 0
+
+    def _capacity(self, column_name, data_type):
+        base = self.bases.get(column_name) or 0
+        return INTEGER_MAX_VALUES[data_type] - base
+
+    def value(self, column_name, row_number):
+        return self.values(column_name, row_number, 1)[0]
+
+    def values(self, column_name, row_start, n, words=None):
+        column = self.table.column(column_name)
+        data_type = column.data_type
+        base = self.bases.get(column_name)
+        row_stop = row_start + n
+
+        if data_type in INTEGER_TYPES or data_type in FLOAT_TYPES:
+            base = base or 0
+            capacity = self._capacity(column_name, data_type) if data_type in INTEGER_TYPES else FLOAT_MAX_VALUE
+            self._check_capacity(column_name, row_stop, capacity)
+            if column_name in self._permutations:
+                capacity, (a, c) = self._permutations[column_name]
+                return [base + 1 + (a * row_number + c) % capacity for row_number in range(row_start, row_stop)]
+            return list(range(base + row_start + 1, base + row_stop + 1))
+        if data_type == 'UNIQUEIDENTIFIER':
+            _, (a, c) = self._permutations[column_name]
+            return [uuid_from_int((a * row_number + c) % UUID_SPACE) for row_number in range(row_start, row_stop)]
+        if data_type == 'DATE':
+            start = base or DEFAULT_DATE_BASE
+            return [start + datetime.timedelta(days=row_number + 1) for row_number in range(row_start, row_stop)]
+        if data_type in DATETIME_TYPES:
+            step = DATETIME_STEPS.get(data_type, DEFAULT_DATETIME_STEP)
+            start = datetime.datetime.combine(DEFAULT_DATE_BASE, datetime.time())
+            if base:
+                # Начало выравнивается по шагу, чтобы все значения были точно представимы в типе
+                start = base.replace(second=0 if data_type == 'SMALLDATETIME' else base.second, microsecond=0)
+            if data_type == 'SMALLDATETIME':
+                self._check_capacity(column_name, row_stop, (SMALLDATETIME_MAX - start) // step)
+            return [start + step * (row_number + 1) for row_number in range(row_start, row_stop)]
+        if data_type == 'VARBINARY':
+            length = min(BINARY_KEY_LENGTH, column.max_length) if column.max_length and column.max_length > 0 \
+                else BINARY_KEY_LENGTH
+            base = base or 0
+            self._check_capacity(column_name, row_stop, 256 ** length - base - 1)
+            return [(base + row_number + 1).to_bytes(length, 'big') for row_number in range(row_start, row_stop)]
+
+        counter = base or 0
+        if words is None:
+            # Без слов от генератора — слово словаря по номеру строки
+            vocabulary = get_vocabulary()
+            words = [vocabulary[row_number % len(vocabulary)] for row_number in range(row_start, row_stop)]
+        max_length = column.max_length if column.max_length and column.max_length > 0 else None
+        if max_length is not None and len(f"-{counter + row_stop - 1}") > max_length:
+            raise ValueError(f"Столбец {column_name} слишком короткий для {row_stop} уникальных значений")
+        result = []
+        for row_number, word in zip(range(row_start, row_stop), words):
+            suffix = f"-{counter + row_number}"
+            result.append((word[:max_length - len(suffix)] if max_length else word) + suffix)
+        return result
+
+    # Сочетания значений родительских ключей для составного уникального ключа:
+    # номер строки переставляется и раскладывается по основаниям размеров пулов.
+    def key_values(self, key_name, row_start, n):
+        pools = self.key_pools[key_name]
+        capacity, (a, c) = self._permutations[key_name]
+        taken = self._taken.get(key_name, [])
+        self._check_capacity(key_name, row_start + n, capacity - len(taken))
+        sizes = [len(pool) for pool in pools]
+        rows = []
+        for row_number in range(row_start, row_start + n):
+            # Номер строки — номер свободной позиции; занятые позиции перед ней пропускаются
+            position = row_number + bisect.bisect_right(taken, row_number) if taken else row_number
+            index = (a * position + c) % capacity
+            values = []
+            for pool, size in zip(pools, sizes):
+                index, digit = divmod(index, size)
+                values.append(pool[digit])
+            rows.append(tuple(values))
+        return rows
+
+    def _check_capacity(self, name, row_stop, capacity):
+        if row_stop > capacity:
+            raise ValueError(f"Недостаточно уникальных значений для {name}: "
+                             f"требуется {row_stop}, доступно {max(capacity, 0)}")
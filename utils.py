@@ -1,24 +1,166 @@
 # utils.py
 
+import datetime
+import decimal
 import logging
+import math
+
+# В одном INSERT ... VALUES SQL Server допускает не больше 1000 строк
+MAX_ROWS_PER_INSERT = 1000
+
+
+def _nstring(value):
+    return "N'" + str(value).replace("'", "''") + "'"
+
+
+def _quoted(value):
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def _number(value):
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    if isinstance(value, int):
+        return str(value)
+    if isinstance(value, float):
+        if not math.isfinite(value):
+            raise ValueError(f"значение {value} нельзя записать в числовой столбец")
+        return repr(value)
+    if isinstance(value, decimal.Decimal):
+        if not value.is_finite():
+            raise ValueError(f"значение {value} нельзя записать в числовой столбец")
+        # Без экспоненты: 1E+2 сервер прочитал бы как float
+        return format(value, 'f')
+    try:
+        return format(decimal.Decimal(str(value)), 'f')
+    except decimal.InvalidOperation:
+        raise ValueError(f"значение {value!r} не является числом")
+
+
+def _bit(value):
+    if isinstance(value, str):
+        return '1' if value.strip().lower() in ('1', 'true') else '0'
+    return '1' if value else '0'
+
+
+# Даты пишутся в ISO 8601 с 'T': такой формат не зависит от SET DATEFORMAT и
+# языка сеанса, в отличие от 'ГГГГ-ММ-ДД чч:мм:сс' для DATETIME.
+def _date(value):
+    if isinstance(value, datetime.datetime):
+        value = value.date()
+    return "'" + value.isoformat() + "'"
+
+
+def _datetime_formatter(timespec):
+    def format_datetime(value):
+        if isinstance(value, datetime.datetime):
+            # DATETIME хранит до 1/300 секунды, SMALLDATETIME — до минуты; лишние
+            # знаки дробной части сервер не принимает
+            return "'" + value.replace(tzinfo=None).isoformat(timespec=timespec) + "'"
+        if isinstance(value, datetime.date):
+            return "'" + value.isoformat() + "T00:00:00'"
+        return _quoted(value)
+    return format_datetime
+
+
+def _datetimeoffset(value):
+    if isinstance(value, datetime.datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=datetime.timezone.utc)
+        return "'" + value.isoformat() + "'"
+    return _quoted(value)
+
+
+def _time(value):
+    if isinstance(value, datetime.datetime):
+        value = value.time()
+    if isinstance(value, datetime.time):
+        return "'" + value.replace(tzinfo=None).isoformat() + "'"
+    if isinstance(value, datetime.timedelta):
+        # TIME хранит время суток: интервалы вне [0, 24 ч) в него не помещаются
+        if not datetime.timedelta(0) <= value < datetime.timedelta(days=1):
+            raise ValueError(f"интервал {value} нельзя записать в столбец TIME")
+        seconds = value.seconds
+        return f"'{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}.{value.microseconds:06d}'"
+    return _quoted(value)
+
+
+def _binary(value):
+    if isinstance(value, str):
+        value = value.encode('utf-8')
+    # Пустое значение 0x — допустимый литерал пустой строки байт
+    return '0x' + bytes(value).hex()
+
+
+def _uniqueidentifier(value):
+    return _quoted(value)
+
+
+SQL_LITERAL_FORMATTERS = {
+    'NVARCHAR': _nstring,
+    'VARCHAR': _nstring,
+    'CHAR': _nstring,
+    'NCHAR': _nstring,
+    'TEXT': _nstring,
+    'NTEXT': _nstring,
+    'XML': _nstring,
+    'INT': _number,
+    'BIGINT': _number,
+    'SMALLINT': _number,
+    'TINYINT': _number,
+    'FLOAT': _number,
+    'REAL': _number,
+    'DECIMAL': _number,
+    'NUMERIC': _number,
+    'MONEY': _number,
+    'SMALLMONEY': _number,
+    'BIT': _bit,
+    'DATE': _date,
+    'DATETIME': _datetime_formatter('milliseconds'),
+    'SMALLDATETIME': _datetime_formatter('seconds'),
+    'DATETIME2': _datetime_formatter('microseconds'),
+    'TIMESTAMP': _datetime_formatter('microseconds'),
+    'DATETIMEOFFSET': _datetimeoffset,
+    'TIME': _time,
+    'UNIQUEIDENTIFIER': _uniqueidentifier,
+    'BINARY': _binary,
+    'VARBINARY': _binary,
+    'IMAGE': _binary,
+}
+
+
+def sql_literal_formatter(data_type):
+    return SQL_LITERAL_FORMATTERS.get(data_type.upper(), _nstring)
 
 
 def generate_sql_value(value, data_type):
     try:
         if value is None:
             return 'NULL'
-        if data_type in ['NVARCHAR', 'VARCHAR', 'CHAR', 'NCHAR', 'TEXT']:
-            return f"N'{str(value).replace('\'', '\'\'')}'"
-        elif data_type in ['DATE', 'DATETIME', 'TIMESTAMP', 'DATETIME2', 'SMALLDATETIME']:
-            return f"'{value}'"
-        elif data_type in ['INT', 'BIGINT', 'SMALLINT', 'TINYINT', 'FLOAT', 'REAL', 'DECIMAL', 'NUMERIC', 'BIT']:
-            return str(value)
-        elif data_type == 'UNIQUEIDENTIFIER':
-            return f"'{value}'"
-        elif data_type == 'VARBINARY':
-            return f"0x{value.hex()}"
-        else:
-            return f"N'{value}'"
+        return sql_literal_formatter(data_type)(value)
     except Exception as e:
         logging.error(f"Ошибка в generate_sql_value для значения {value} и типа {data_type}: {e}")
         return 'NULL'
+
+
+# Литералы целого столбца: функция форматирования выбирается один раз по типу.
+# Если какое-то значение не форматируется, столбец разбирается по одному
+# значению, и неподходящие значения заменяются на NULL с записью в лог.
+def format_sql_column(values, data_type):
+    formatter = sql_literal_formatter(data_type)
+    try:
+        if formatter is _nstring:
+            return ['NULL' if value is None else "N'" + str(value).replace("'", "''") + "'" for value in values]
+        return ['NULL' if value is None else formatter(value) for value in values]
+    except Exception:
+        return [generate_sql_value(value, data_type) for value in values]
+
+
+# Многострочные INSERT для порции: не больше rows_per_insert строк в одном VALUES
+def format_insert_statements(full_name, columns, data_types, data, rows_per_insert=MAX_ROWS_PER_INSERT):
+    rows_per_insert = max(1, min(rows_per_insert, MAX_ROWS_PER_INSERT))
+    header = f"INSERT INTO {full_name} ({', '.join(f'[{column}]' for column in columns)}) VALUES\n"
+    literals = [format_sql_column(values, data_type) for values, data_type in zip(data, data_types)]
+    rows = ['(' + ', '.join(row) + ')' for row in zip(*literals)]
+    return [header + ',\n'.join(rows[start:start + rows_per_insert]) + ';'
+            for start in range(0, len(rows), rows_per_insert)]
@@ -0,0 +1,157 @@
+# vocabulary.py
+
+import json
+import logging
+import os
+import threading
+
+FAKER_LOCALE = 'ru_RU'
+VOCABULARY_SIZE = 5000
+VOCABULARY_CACHE_DIR = 'vocabulary_cache'
+
+_faker = None
+_faker_lock = threading.Lock()
+# Списки имён провайдера person: мужские и женские имена и фамилии
+NAME_LISTS = ('first_names_male', 'first_names_female', 'last_names_male', 'last_names_female')
+
+_vocabulary = None
+_vocabulary_lock = threading.Lock()
+_names = None
+_names_lock = threading.Lock()
+
+
+# Общий экземпляр Faker. Загрузка локали — самая медленная часть запуска,
+# поэтому faker импортируется при первом обращении, а не при импорте модулей.
+def get_faker():
+    global _faker
+    with _faker_lock:
+        if _faker is None:
+            from faker import Faker
+            _faker = Faker(FAKER_LOCALE)
+        return _faker
+
+
+def faker_version():
+    # Версия из метаданных пакета не требует импорта самого faker
+    try:
+        from importlib.metadata import version
+        return version('faker')
+    except Exception:
+        import faker
+        return faker.VERSION
+
+
+def vocabulary_cache_path(directory=VOCABULARY_CACHE_DIR):
+    return os.path.join(directory, f"words.{FAKER_LOCALE}.faker-{faker_version()}.{VOCABULARY_SIZE}.json")
+
+
+def names_cache_path(directory=VOCABULARY_CACHE_DIR):
+    return os.path.join(directory, f"names.{FAKER_LOCALE}.faker-{faker_version()}.json")
+
+
+def _build_words():
+    fake = get_faker()
+    # Полный список слов локали не зависит от состояния генератора Faker
+    if hasattr(fake, 'get_words_list'):
+        words = fake.get_words_list()
+    else:
+        words = fake.words(nb=VOCABULARY_SIZE)
+    return sorted(set(words))
+
+
+def _build_names():
+    fake = get_faker()
+    names = {}
+    for list_name in NAME_LISTS:
+        # Списки лежат в провайдере person локали; у части локалей это словари с весами
+        values = next((getattr(provider, list_name) for provider in fake.providers
+                       if hasattr(provider, list_name)), None)
+        if not values:
+            method = getattr(fake, list_name[:-1])
+            values = [method() for _ in range(VOCABULARY_SIZE)]
+        names[list_name] = sorted(set(values))
+    return names
+
+
+def _is_word_list(words):
+    return isinstance(words, list) and bool(words) and all(isinstance(word, str) for word in words)
+
+
+def _load_cache(path, valid):
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError) as e:
+        logging.warning(f"Не удалось прочитать кэш словаря {path}: {e}")
+        return None
+    if not valid(data):
+        logging.warning(f"Кэш словаря {path} повреждён и будет построен заново")
+        return None
+    return data
+
+
+def _save_cache(path, data, description):
+    try:
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        # Уникальное имя временного файла: словарь могут сохранять сразу несколько процессов генерации
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        logging.info(f"{description} сохранён в {path}")
+    except OSError as e:
+        logging.warning(f"Не удалось сохранить кэш словаря {path}: {e}")
+
+
+# Словарь, из которого генераторы выбирают слова текстовых столбцов. Строится
+# один раз и сохраняется на диск; имя файла включает локаль и версию Faker,
+# поэтому после обновления Faker кэш строится заново. Процессы генерации
+# читают готовый файл, не загружая Faker.
+def get_vocabulary():
+    global _vocabulary
+    with _vocabulary_lock:
+        if _vocabulary is None:
+            import numpy as np
+            path = vocabulary_cache_path()
+            words = _load_cache(path, _is_word_list)
+            if words is None:
+                words = _build_words()
+                _save_cache(path, words, f"Словарь Faker ({FAKER_LOCALE}, {len(words)} слов)")
+            _vocabulary = np.array(words, dtype=object)
+        return _vocabulary
+
+
+# Имена и фамилии для столбцов с именами людей, по спискам NAME_LISTS.
+# Кэшируются на диске так же, как словарь слов, с тем же ключом локали и версии Faker.
+def get_names():
+    global _names
+    with _names_lock:
+        if _names is None:
+            import numpy as np
+            path = names_cache_path()
+            names = _load_cache(path, lambda data: isinstance(data, dict) and all(
+                _is_word_list(data.get(list_name)) for list_name in NAME_LISTS))
+            if names is None:
+                names = _build_names()
+                _save_cache(path, names, f"Список имён Faker ({FAKER_LOCALE})")
+            _names = {list_name: np.array(names[list_name], dtype=object) for list_name in NAME_LISTS}
+        return _names
+
+
+# Загружает словарь и Faker в фоновом потоке, пока пользователь подключается
+# к серверу, чтобы первое заполнение не ждало их загрузки.
+def prewarm():
+    def warm():
+        try:
+            get_vocabulary()
+            get_names()
+            get_faker()
+        except Exception as e:
+            logging.warning(f"Не удалось заранее загрузить словарь Faker: {e}")
+
+    thread = threading.Thread(target=warm, name='faker-prewarm', daemon=True)
+    thread.start()
+    return thread
+
@@ -0,0 +1,218 @@
+# worker.py
+
+import contextlib
+import logging
+import os
+import threading
+
+from bulk_load import bulk_fill
+from data_profile import profile_path, profile_table
+from database import OperationCancelled
+from fast_load import fast_load
+from instrumentation import profiled
+from parallel import parallel_fill
+from pipeline import export_script, fill_table
+from process_pool import process_fill
+from planner import build_plan, fill_database
+
+
+# Базовый фоновый поток: сбрасывает метрики перед запуском, после него пишет
+# сводку в лог и отправляет её в интерфейс перед итоговым событием.
+# Для таблиц fast_load_tables заполнение идёт в режиме быстрой загрузки.
+class MeasuredWorker(threading.Thread):
+    def __init__(self, db_manager, events, name, fast_load_tables=()):
+        super().__init__(name=name, daemon=True)
+        self.db_manager = db_manager
+        self.events = events
+        self.cancel_event = threading.Event()
+        self.fast_load_tables = list(fast_load_tables)
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def run(self):
+        metrics = self.db_manager.metrics
+        metrics.reset()
+        try:
+            with profiled(self.db_manager.profile_mode, self.name), self._load_mode():
+                result = self.fill()
+        except Exception as e:
+            logging.error(f"Ошибка в фоновом потоке {self.name}: {e}")
+            result = ('failed', str(e))
+        metrics.log(self.name, result=result[0])
+        self.events.put(('metrics', metrics.summary()))
+        self.events.put(result)
+
+    def fill(self):
+        raise NotImplementedError
+
+    def _load_mode(self):
+        if not self.fast_load_tables:
+            return contextlib.nullcontext()
+        return fast_load(self.db_manager, self.fast_load_tables, self.schema)
+
+
+# Фоновый поток заполнения таблицы. Все сообщения для интерфейса кладутся
+# в очередь events, которую главный поток Tk опрашивает через root.after.
+class FillWorker(MeasuredWorker):
+    def __init__(self, db_manager, table_name, n, events, schema='dbo', checkpoint=None, connections=1, processes=1,
+                 fast_load=False, **options):
+        super().__init__(db_manager, events, f"fill-{table_name}", [table_name] if fast_load else ())
+        self.table_name = table_name
+        self.n = n
+        self.schema = schema
+        self.checkpoint = checkpoint
+        self.connections = connections
+        self.processes = processes
+        self.options = options
+        # Вставлено строк к последнему отчёту о ходе заполнения
+        self.inserted = checkpoint.processed if checkpoint else 0
+
+    def fill(self):
+        if self.connections > 1:
+            return self._fill_parallel()
+        try:
+            if self.processes > 1:
+                inserted = process_fill(self.db_manager, self.table_name, self.n, self.schema, self.processes,
+                                        checkpoint=self.checkpoint, on_progress=self._report_progress,
+                                        cancel_event=self.cancel_event, **self.options)
+            else:
+                inserted = fill_table(self.db_manager, self.table_name, self.n, self.schema,
+                                      checkpoint=self.checkpoint, on_progress=self._report_progress,
+                                      cancel_event=self.cancel_event, overlap=True, **self.options)
+            return ('done', inserted)
+        except OperationCancelled:
+            return ('cancelled', self.inserted)
+        except Exception as e:
+            logging.error(f"Ошибка при заполнении таблицы {self.schema}.{self.table_name}: {e}")
+            return ('failed', str(e))
+
+    def _fill_parallel(self):
+        try:
+            report = parallel_fill(self.db_manager, self.table_name, self.n, self.schema,
+                                   connections=self.connections, on_progress=self._report_progress,
+                                   cancel_event=self.cancel_event, **self.options)
+        except Exception as e:
+            logging.error(f"Ошибка при заполнении таблицы {self.schema}.{self.table_name}: {e}")
+            return ('failed', str(e))
+        if self.cancel_event.is_set():
+            return ('cancelled', report.inserted)
+        if not report.succeeded:
+            return ('failed', report.summary())
+        return ('done', report.inserted)
+
+    def _report_progress(self, progress):
+        self.inserted = progress.inserted
+        self.events.put(('progress', progress.snapshot()))
+
+
+# Фоновое заполнение всей базы данных по плану зависимостей.
+class DatabaseFillWorker(MeasuredWorker):
+    def __init__(self, db_manager, row_counts, events, schema='dbo', fast_load=False, **options):
+        tables = [table_name for table_name, n in row_counts.items() if n > 0] if fast_load else ()
+        super().__init__(db_manager, events, "fill-database", tables)
+        self.row_counts = row_counts
+        self.schema = schema
+        self.options = options
+        self.table_name = "вся база данных"
+
+    def fill(self):
+        try:
+            plan = build_plan(self.db_manager, list(self.row_counts), self.schema)
+            self.events.put(('plan', plan.describe()))
+            report = fill_database(self.db_manager, self.row_counts, plan, self.schema,
+                                   on_progress=self._report_progress, cancel_event=self.cancel_event,
+                                   **self.options)
+        except Exception as e:
+            logging.error(f"Ошибка при заполнении базы данных: {e}")
+            return ('failed', str(e))
+        if self.cancel_event.is_set():
+            return ('cancelled', report.inserted)
+        if not report.succeeded:
+            return ('failed', report.summary())
+        return ('done', report.inserted)
+
+    def _report_progress(self, table_name, progress):
+        snapshot = progress.snapshot()
+        snapshot['table'] = table_name
+        self.events.put(('progress', snapshot))
+
+
+# Фоновая выгрузка сгенерированных данных в файл и загрузка его через BULK INSERT.
+class BulkLoadWorker(MeasuredWorker):
+    def __init__(self, db_manager, table_name, n, data_path, events, schema='dbo', fast_load=False, **options):
+        super().__init__(db_manager, events, f"bulk-{table_name}", [table_name] if fast_load else ())
+        self.table_name = table_name
+        self.n = n
+        self.data_path = data_path
+        self.schema = schema
+        self.options = options
+
+    def fill(self):
+        try:
+            inserted = bulk_fill(self.db_manager, self.table_name, self.n, self.data_path, self.schema,
+                                 on_progress=self._report_progress, cancel_event=self.cancel_event, **self.options)
+            return ('done', inserted)
+        except OperationCancelled:
+            return ('cancelled', 0)
+        except Exception as e:
+            logging.error(f"Ошибка массовой загрузки таблицы {self.schema}.{self.table_name}: {e}")
+            return ('failed', str(e))
+
+    def _report_progress(self, progress):
+        self.events.put(('progress', progress.snapshot()))
+
+
+# Фоновая выгрузка сгенерированных данных в SQL-скрипт. При отмене
+# недописанный файл удаляется.
+class ExportWorker(MeasuredWorker):
+    def __init__(self, db_manager, table_name, n, file_path, events, schema='dbo', **options):
+        super().__init__(db_manager, events, f"export-{table_name}")
+        self.table_name = table_name
+        self.n = n
+        self.file_path = file_path
+        self.schema = schema
+        self.options = options
+
+    def fill(self):
+        try:
+            exported = export_script(self.db_manager, self.table_name, self.n, self.file_path, self.schema,
+                                     on_progress=self._report_progress, cancel_event=self.cancel_event,
+                                     **self.options)
+            return ('exported', (exported, self.file_path))
+        except OperationCancelled:
+            self._remove_partial_file()
+            return ('cancelled', 0)
+        except Exception as e:
+            logging.error(f"Ошибка при экспорте SQL-скрипта в файл {self.file_path}: {e}")
+            return ('failed', str(e))
+
+    def _remove_partial_file(self):
+        try:
+            os.remove(self.file_path)
+        except OSError as e:
+            logging.warning(f"Не удалось удалить недописанный файл {self.file_path}: {e}")
+
+    def _report_progress(self, progress):
+        self.events.put(('progress', progress.snapshot()))
+
+
+# Фоновое профилирование таблицы. Запрос к серверу не прерывается, но при
+# отмене профиль не сохраняется.
+class ProfileWorker(MeasuredWorker):
+    def __init__(self, db_manager, table_name, events, schema='dbo'):
+        super().__init__(db_manager, events, f"profile-{table_name}")
+        self.table_name = table_name
+        self.schema = schema
+
+    def fill(self):
+        try:
+            profile = profile_table(self.db_manager, self.table_name, self.schema)
+            if self.cancel_event.is_set():
+                return ('cancelled', 0)
+            path = profile_path(self.db_manager.database, self.schema, self.table_name)
+            profile.save(path)
+            return ('profiled', (profile.sampled_rows, profile.rows, path))
+        except Exception as e:
+            logging.error(f"Ошибка при профилировании таблицы {self.schema}.{self.table_name}: {e}")
+            return ('failed', str(e))